@@ -11,10 +11,16 @@ from passlib.context import CryptContext
 
 from app.config.config import settings
 from app.models.company import Company
+from app.schemas.company import CompanyPrincipal
 from app.schemas.tokens import TokenPayload
+from app.services.principal_cache import principal_cache
+from app.services.password_hasher import password_hash_pool
+from app.services.revocation_store import revocation_store
 
-ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.COMPANY_ACCESS_TOKEN_EXPIRE_MINUTES
 ALGORITHM = "HS256"
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
 
 class OAuth2PasswordBearerWithCookie(OAuth2):
     def __init__(
@@ -51,20 +57,30 @@ def get_hashed_password(password: str) -> str:
 def verify_password(password: str, hashed_pass: str) -> bool:
     return password_context.verify(password, hashed_pass)
 
+async def hash_password(password: str) -> str:
+    """get_hashed_password no pool do bcrypt, sem bloquear o event loop"""
+    return await password_hash_pool.run(get_hashed_password, password)
+
+async def check_password(password: str, hashed_pass: str) -> bool:
+    """verify_password no pool do bcrypt, sem bloquear o event loop"""
+    return await password_hash_pool.run(verify_password, password, hashed_pass)
+
 async def authenticate_company(email: str, password: str) -> Company | None:
     company = await Company.find_one({"email": email})
     if not company:
         return None
-    if company.hashed_password is None or not verify_password(password, company.hashed_password):
+    if company.hashed_password is None or not await check_password(password, company.hashed_password):
         return None
     return company
 
-def create_access_token_company(subject: str | Any, expires_delta: timedelta | None = None):
+def create_access_token_company(
+    subject: str | Any, expires_delta: timedelta | None = None, claims: dict | None = None
+):
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode = {"exp": expire, "sub": str(subject)}
+    to_encode = {**(claims or {}), "exp": expire, "sub": str(subject)}
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -74,25 +90,91 @@ async def get_current_company(token: str = Depends(oauth2_scheme)):
 async def get_current_company_from_cookie(token: str = Depends(oauth2_scheme_with_cookies)):
     return await _get_current_company(token)
 
-async def _get_current_company(token):
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _decode_payload(token) -> tuple[UUID, dict]:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
         company_id: UUID | None = payload.get("sub")
         if company_id is None:
-            raise credentials_exception
+            raise _credentials_exception()
         token_data = TokenPayload(uuid=company_id)
-    except JWTError:
-        raise credentials_exception
-    company = await Company.find_one({"uuid": token_data.uuid})
+    except (JWTError, ValueError):
+        raise _credentials_exception()
+    return token_data.uuid, payload
+
+def _decode_subject(token) -> UUID:
+    return _decode_payload(token)[0]
+
+async def _authorize_token(token) -> tuple[UUID, dict]:
+    """
+    Valida o token de acesso: refresh e redefinição de senha não servem aqui.
+    Todos passam pelo store de revogação (logout, senha trocada, empresa
+    desativada). Tokens antigos sem `type` não têm `sid` nem `iat` (vale 0:
+    qualquer revogação da empresa os derruba) e vivem até
+    ACCESS_TOKEN_EXPIRE_MINUTES, mais que as revogações guardadas em
+    memória: são conferidos na coleção.
+    """
+    company_uuid, payload = _decode_payload(token)
+    token_type = payload.get("type")
+    if token_type is not None and token_type != ACCESS_TOKEN_TYPE:
+        raise _credentials_exception()
+    if await revocation_store.is_revoked(
+        payload.get("sid"), str(company_uuid), payload.get("iat", 0), check_db=token_type is None
+    ):
+        raise _credentials_exception()
+    return company_uuid, payload
+
+async def _get_current_company(token):
+    company_uuid, _ = await _authorize_token(token)
+    company = await Company.find_one({"uuid": company_uuid})
     if company is None:
-        raise credentials_exception
+        raise _credentials_exception()
     return company
 
+async def get_current_principal(token: str = Depends(oauth2_scheme)) -> CompanyPrincipal:
+    """
+    Empresa autenticada sem carregar o documento completo: para rotas que só
+    precisam de uuid, status e permissão. Access tokens novos trazem tudo nas
+    claims (sem ir ao MongoDB); os antigos usam o cache por `sub` do token.
+    """
+    company_uuid, payload = await _authorize_token(token)
+    if payload.get("type") == ACCESS_TOKEN_TYPE:
+        try:
+            return CompanyPrincipal(
+                uuid=company_uuid,
+                is_admin=payload.get("adm", False),
+                company_type=payload.get("ctp"),
+            )
+        except ValueError:
+            raise _credentials_exception()
+
+    principal = principal_cache.get(company_uuid)
+    if principal is None:
+        principal = await Company.find_one({"uuid": company_uuid}, projection_model=CompanyPrincipal)
+        if principal is None:
+            raise _credentials_exception()
+        principal_cache.set(principal)
+    return principal
+
+def get_current_active_principal(principal: CompanyPrincipal = Depends(get_current_principal)) -> CompanyPrincipal:
+    if not principal.is_active:
+        raise HTTPException(status_code=400, detail="Inactive company")
+    return principal
+
+def get_current_active_admin_principal(principal: CompanyPrincipal = Depends(get_current_principal)) -> CompanyPrincipal:
+    if not principal.is_active or not principal.is_admin:
+        raise HTTPException(
+            status_code=403,
+            detail="The company doesn't have enough privileges"
+        )
+    return principal
+
 def get_current_active_company(current_company: Company = Depends(get_current_company)) -> Company:
     if not current_company.is_active:
         raise HTTPException(status_code=400, detail="Inactive company")
@@ -0,0 +1,110 @@
+"""
+Comandos de manutenção executados fora da API.
+
+Uso (a partir de backend/):
+    python -m app.cli check-query-plans
+    python -m app.cli regeocode [--dry-run] [--stale-days N] [--checkpoint ARQUIVO]
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from app.config.database import create_mongo_client, init_database
+from app.config.logging import setup_loggers
+from app.services.geocoding_dispatcher import geocoding_dispatcher
+from app.services.http_client import http_clients
+from app.services.query_plan_service import query_plan_service
+from app.services.regeocode_service import regeocode_service
+
+
+async def check_query_plans(args: argparse.Namespace) -> int:
+    """
+    Sai com código 1 se alguma consulta do company_service cair em COLLSCAN
+    ou se uma consulta geográfica não usar o índice location_2dsphere
+    """
+    client = create_mongo_client()
+    try:
+        await init_database(client)
+        results = await query_plan_service.check_company_service()
+    finally:
+        client.close()
+
+    failures = [result for result in results if result.failed]
+    for result in results:
+        status = "COLLSCAN" if result.collscan else "SEM GEO" if result.missing_geo_index else "ok"
+        print(f"{status:>8}  {result.name}: {' > '.join(result.stages)} [{', '.join(result.indexes)}]")
+    print(f"\n{len(results) - len(failures)}/{len(results)} consultas usando o índice esperado")
+    return 1 if failures else 0
+
+
+async def regeocode(args: argparse.Namespace) -> int:
+    """Geocodifica empresas sem coordenadas (ou antigas) em lote"""
+    client = create_mongo_client()
+    try:
+        await init_database(client)
+        report = await regeocode_service.run(
+            stale_days=args.stale_days,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            checkpoint=args.checkpoint,
+            dry_run=args.dry_run,
+        )
+    finally:
+        await geocoding_dispatcher.stop()
+        await http_clients.aclose()
+        client.close()
+
+    if args.dry_run:
+        print(f"{report.scanned} candidatas: empresas sem coordenadas (ou antigas)")
+        print(f"{report.map_entries} candidatas ao mapa (coletoras ativas)")
+        print(f"{report.cached} candidatas com resultado no cache de geocoding (sem chamar o Nominatim)")
+    else:
+        print(f"{report.scanned} empresas lidas, {report.geocoded} geocodificadas "
+              f"({report.recovered_map_entries} de volta ao mapa)")
+        print(f"{report.not_found} sem resultado, {report.errors} erros, "
+              f"{report.changed_during_run} alteradas durante a execução (não gravadas)")
+        if report.interrupted:
+            print(f"Nominatim indisponível: execução interrompida, retome depois do _id {report.last_id}")
+            return 1
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    check = subparsers.add_parser(
+        "check-query-plans",
+        help="roda explain() nas consultas do company_service e falha em COLLSCAN ou sem o índice geográfico",
+    )
+    check.set_defaults(handler=check_query_plans)
+
+    regeo = subparsers.add_parser(
+        "regeocode",
+        help="geocodifica em lote empresas sem coordenadas, pelo cache e pela fila do Nominatim",
+    )
+    regeo.add_argument("--dry-run", action="store_true", help="só conta as candidatas, sem geocodificar")
+    regeo.add_argument(
+        "--stale-days", type=int, default=None,
+        help="inclui empresas geocodificadas há mais de N dias",
+    )
+    regeo.add_argument("--concurrency", type=int, default=4, help="consultas simultâneas (padrão: 4)")
+    regeo.add_argument("--batch-size", type=int, default=100, help="empresas por bulk_write (padrão: 100)")
+    regeo.add_argument(
+        "--checkpoint", type=Path, default=None,
+        help="arquivo com o último _id processado; se existir, a execução continua dali",
+    )
+    regeo.set_defaults(handler=regeocode)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    setup_loggers()
+    args = build_parser().parse_args(argv)
+    return asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
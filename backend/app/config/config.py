@@ -18,6 +18,9 @@ class Settings(BaseSettings):
     ENVIRONMENT: Literal["development", "test", "production"] = "development"
     # 60 minutes * 24 hours * 8 days = 8 days
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
+    # Empresas: access token curto; a sessão continua pelo refresh token (rotacionado a cada uso)
+    COMPANY_ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
+    REFRESH_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
     # JSON-formatted list of origins
     BACKEND_CORS_ORIGINS: list[AnyHttpUrl] = []
     PROJECT_NAME: str
@@ -39,5 +42,67 @@ class Settings(BaseSettings):
 
     # Validação de CNPJ
     VALIDATE_CNPJ_EXTERNAL: bool = False
+    CNPJ_CACHE_TTL_SECONDS: int = 60 * 60 * 24 * 30
+    CNPJ_CACHE_NEGATIVE_TTL_SECONDS: int = 60 * 60 * 24
+
+    # bcrypt fora do event loop: threads dedicadas e limite de chamadas na fila (acima: 429)
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_PENDING: int = 64
+
+    # Cache do principal autenticado (uuid, is_active, is_admin, company_type) por worker
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 30.0
+
+    # Limite de tentativas de login e de recuperação de senha (janela deslizante, por IP e por email)
+    LOGIN_THROTTLE_WINDOW_SECONDS: int = 60 * 15
+    LOGIN_THROTTLE_MAX_PER_IP: int = 50
+    LOGIN_THROTTLE_MAX_PER_EMAIL: int = 10
+    FORGOT_PASSWORD_THROTTLE_WINDOW_SECONDS: int = 60 * 60
+    FORGOT_PASSWORD_THROTTLE_MAX_PER_IP: int = 10
+    FORGOT_PASSWORD_THROTTLE_MAX_PER_EMAIL: int = 3
+    # Contadores somados entre os workers via MongoDB (coleção throttle_counters)
+    THROTTLE_SHARED: bool = False
+    # Atrás do proxy: usar o primeiro IP do X-Forwarded-For como IP do cliente
+    THROTTLE_TRUST_FORWARDED_FOR: bool = False
+
+    # Intervalo de sincronização do filtro de revogação de tokens entre workers
+    REVOCATION_SYNC_SECONDS: float = 5.0
+
+    # Mapa: snapshot em memória das coletoras e intervalo de checagem da versão
+    MAP_SNAPSHOT_ENABLED: bool = True
+    MAP_VERSION_POLL_SECONDS: float = 1.0
+
+    # Clientes HTTP das integrações externas (um pool por host)
+    HTTP_TIMEOUT_SECONDS: float = 10.0
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 10
+    HTTP_MAX_KEEPALIVE_PER_HOST: int = 5
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+
+    # Limite do Nominatim compartilhado entre os workers (política: 1 req/s)
+    GEOCODING_RATE_PER_SECOND: float = 1.0
+    GEOCODING_BURST: int = 1
+
+    # Fila de jobs de geocoding (coleção geocode_jobs)
+    GEOCODE_JOB_POLL_SECONDS: float = 2.0
+    GEOCODE_JOB_MAX_ATTEMPTS: int = 5
+    GEOCODE_JOB_BACKOFF_SECONDS: float = 30.0
+    GEOCODE_JOB_LEASE_SECONDS: float = 120.0
+
+    # Cache de geocoding (memória + coleção geocode_cache)
+    GEOCODE_CACHE_TTL_SECONDS: int = 60 * 60 * 24 * 30
+    GEOCODE_CACHE_NEGATIVE_TTL_SECONDS: int = 60 * 60 * 6
+
+    # Índice local de CEPs (CSV ';' .gz/.xz/.bz2 ou .sqlite); sem ele, só Nominatim
+    CEP_INDEX_PATH: str | None = None
+    CEP_INDEX_CHECK_SECONDS: float = 60.0
+
+    # Snapshot dos municípios do IBGE (JSON, opcionalmente .gz) e intervalo de atualização (0 desliga)
+    IBGE_SNAPSHOT_PATH: str | None = None
+    IBGE_REFRESH_HOURS: float = 24.0
+    LOCATION_CACHE_MAX_AGE_SECONDS: int = 60 * 60 * 24
+
+    # Roda explain() nas consultas do company_service no startup e falha em COLLSCAN
+    # ou em consulta geográfica fora do índice location_2dsphere
+    CHECK_QUERY_PLANS_ON_STARTUP: bool = False
 
 settings = Settings()  # type: ignore
@@ -0,0 +1,54 @@
+import certifi
+from beanie import init_beanie
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.config.config import settings
+from app.models.users import User
+from app.models.company import Company
+from app.models.rating import Rating
+from app.models.discard import Discard
+from app.models.environmental_report import EnvironmentalReport
+from app.models.item_reference import ItemReference
+from app.models.cache_version import CacheVersion
+from app.models.geocode_cache import GeocodeCache
+from app.models.rate_limit import RateLimitBucket
+from app.models.geocode_job import GeocodeJob
+from app.models.cnpj_cache import CnpjCache
+from app.models.revoked_token import RevokedToken
+from app.models.password_reset_token import PasswordResetToken
+from app.models.throttle_counter import ThrottleCounter
+
+# Todos os documentos registrados no Beanie (API e comandos de linha de comando)
+DOCUMENT_MODELS = [
+    User,
+    Company,
+    Discard,
+    Rating,
+    EnvironmentalReport,
+    ItemReference,
+    CacheVersion,
+    GeocodeCache,
+    RateLimitBucket,
+    GeocodeJob,
+    CnpjCache,
+    RevokedToken,
+    PasswordResetToken,
+    ThrottleCounter,
+]
+
+
+def create_mongo_client() -> AsyncIOMotorClient:
+    """Cliente MongoDB com TLS, igual para a API e para a CLI"""
+    return AsyncIOMotorClient(
+        settings.MONGO_HOST,
+        tls=True,
+        tlsCAFile=certifi.where()
+    )
+
+
+async def init_database(client: AsyncIOMotorClient) -> None:
+    """Inicializa o Beanie (e cria os índices declarados) no banco configurado"""
+    await init_beanie(
+        database=client[settings.MONGO_DB],
+        document_models=DOCUMENT_MODELS
+    )
@@ -1,20 +1,10 @@
 from contextlib import asynccontextmanager
-import certifi
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
-from beanie import init_beanie
 
 # Configurações
 from app.config.config import settings
-
-# Models
-from app.models.users import User
-from app.models.company import Company
-from app.models.rating import Rating
-from app.models.discard import Discard
-from app.models.environmental_report import EnvironmentalReport
-from app.models.item_reference import ItemReference
+from app.config.database import create_mongo_client, init_database
 
 # Routers
 from app.routers.api import api_router
@@ -22,36 +12,74 @@ from app.routers.api import api_router
 # Seeds e serviços
 from app.seeds import admin_setup
 from app.auth.auth import get_hashed_password
+from app.services.company_service import company_service
+from app.services.map_cache import map_cache
+from app.services.http_client import http_clients
+from app.services.cep_index import cep_index
+from app.services.locationIBGE_service import ibge_service
+from app.services.geocoding_dispatcher import geocoding_dispatcher
+from app.services.geocode_job_service import geocode_job_service
+from app.services.query_plan_service import query_plan_service
+from app.services.password_hasher import password_hash_pool
+from app.services.revocation_store import revocation_store
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Setup MongoDB
-    app.state.client = AsyncIOMotorClient(
-        settings.MONGO_HOST,
-        tls=True,
-        tlsCAFile=certifi.where()
-    )
+    app.state.client = create_mongo_client()
     
     # Inicializar Beanie com todos os models
-    await init_beanie(
-        database=app.state.client[settings.MONGO_DB], 
-        document_models=[
-            User, 
-            Company, 
-            Discard, 
-            Rating, 
-            EnvironmentalReport,
-            ItemReference
-        ]
-    )
+    await init_database(app.state.client)
+
+    # Falhar cedo se alguma consulta do company_service perdeu o índice
+    if settings.CHECK_QUERY_PLANS_ON_STARTUP:
+        await query_plan_service.assert_query_plans()
+    
+    # Tokens revogados (logout, senha trocada) em memória, sincronizados com os outros workers
+    await revocation_store.load()
+    revocation_store.start_sync()
+
+    # Clientes HTTP compartilhados (Nominatim, IBGE, BrasilAPI)
+    http_clients.start()
+
+    # Índice local de CEPs (opcional); sem ele as buscas vão ao Nominatim
+    if cep_index.enabled:
+        try:
+            await cep_index.reload()
+        except Exception as e:
+            print(f"⚠️ Índice de CEP não carregado: {str(e)}")
+
+    # Municípios do IBGE em memória: do arquivo de snapshot ou baixados em segundo plano
+    try:
+        await ibge_service.load_snapshot()
+    except Exception as e:
+        print(f"⚠️ Snapshot de municípios não carregado: {str(e)}")
+    ibge_service.start_refresher()
     
     # Criar admin se não existir
     admin_service = admin_setup.AdminSetupService()
     await admin_service.create_admin_if_not_exists()
 
+    # Preencher campos derivados (GeoJSON, cidade normalizada) de empresas antigas
+    await company_service.sync_derived_fields()
+
+    # Acompanhar a versão do mapa publicada pelos outros workers
+    await map_cache.refresh_version()
+    map_cache.start_watcher()
+
+    # Worker da fila de geocoding (coordenadas das empresas cadastradas/alteradas)
+    geocode_job_service.start_worker()
+
     yield
     
     print("🛑 Parando aplicação...")
+    await geocode_job_service.stop_worker()
+    await ibge_service.stop_refresher()
+    await revocation_store.stop_sync()
+    await map_cache.stop_watcher()
+    await geocoding_dispatcher.stop()
+    await http_clients.aclose()
+    password_hash_pool.shutdown()
     app.state.client.close()
 
 app = FastAPI(
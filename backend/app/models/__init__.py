@@ -2,4 +2,12 @@ from .users import User
 from .company import Company
 from .rating import Rating
 from .discard import Discard
-from .environmental_report import EnvironmentalReport
\ No newline at end of file
+from .environmental_report import EnvironmentalReport
+from .cache_version import CacheVersion
+from .geocode_cache import GeocodeCache
+from .rate_limit import RateLimitBucket
+from .geocode_job import GeocodeJob
+from .cnpj_cache import CnpjCache
+from .revoked_token import RevokedToken
+from .password_reset_token import PasswordResetToken
+from .throttle_counter import ThrottleCounter
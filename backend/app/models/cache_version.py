@@ -0,0 +1,19 @@
+from typing import Annotated
+from datetime import datetime
+
+from beanie import Document, Indexed
+from pydantic import Field
+
+
+class CacheVersion(Document):
+    """
+    Contador de versão compartilhado entre os workers.
+    Quem altera os dados incrementa `version`; os demais comparam com a
+    versão que têm em memória e descartam seus caches quando ela muda.
+    """
+    key: Annotated[str, Indexed(unique=True)]
+    version: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "cache_versions"
@@ -0,0 +1,25 @@
+from typing import Annotated
+from datetime import datetime
+
+import pymongo
+from beanie import Document, Indexed
+from pydantic import Field
+from pymongo import IndexModel
+
+
+class CnpjCache(Document):
+    """
+    Resultado da consulta de um CNPJ na BrasilAPI, compartilhado entre os
+    workers. CNPJs não encontrados expiram antes.
+    """
+    cnpj: Annotated[str, Indexed(unique=True)]
+    result: dict
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime
+
+    class Settings:
+        name = "cnpj_cache"
+        indexes = [
+            # O MongoDB remove o documento quando expires_at passa
+            IndexModel([("expires_at", pymongo.ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        ]
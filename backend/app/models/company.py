@@ -1,10 +1,24 @@
-from typing import Annotated, List, Optional
+from typing import Annotated, List, Literal, Optional
 from uuid import UUID, uuid4
 from datetime import datetime
 from enum import Enum
 
-from beanie import Document, Indexed
-from pydantic import Field, EmailStr, model_validator, HttpUrl
+import pymongo
+from beanie import (
+    Delete,
+    Document,
+    Indexed,
+    Insert,
+    Replace,
+    Save,
+    SaveChanges,
+    after_event,
+    before_event,
+)
+from pydantic import BaseModel, Field, EmailStr, model_validator, HttpUrl
+from pymongo import IndexModel
+
+from app.utils.text import normalize_text
 
 class CompanyType(str, Enum):
     EMPRESA_COLETORA = "coletora"
@@ -17,6 +31,31 @@ class Companycolectortags(str, Enum):
     Reuso_de_material_reciclavel = "reuso"
 
 
+class GeocodeStatus(str, Enum):
+    PENDENTE = "pendente"  # aguardando o job de geocoding
+    OK = "ok"  # coordenadas preenchidas
+    NAO_ENCONTRADO = "nao_encontrado"  # Nominatim não encontrou o endereço
+    FALHOU = "falhou"  # tentativas esgotadas por erro do serviço
+
+
+# Um bit por tag, na ordem de declaração do enum
+TAG_BITS = {tag: 1 << index for index, tag in enumerate(Companycolectortags)}
+
+
+def tags_to_mask(tags: Optional[List[Companycolectortags]]) -> int:
+    """Converte uma lista de tags para a máscara de bits correspondente"""
+    mask = 0
+    for tag in tags or []:
+        mask |= TAG_BITS[Companycolectortags(tag)]
+    return mask
+
+
+class GeoPoint(BaseModel):
+    """Ponto GeoJSON usado pelo índice 2dsphere (coordenadas em [longitude, latitude])"""
+    type: Literal["Point"] = "Point"
+    coordinates: List[float]
+
+
 class Company(Document):
     uuid: Annotated[UUID, Field(default_factory=uuid4), Indexed(unique=True)]
     cnpj: Annotated[str, Indexed(unique=True)]
@@ -27,6 +66,7 @@ class Company(Document):
     company_type: CompanyType
     company_description: Optional[str] = None
     company_colector_tags: Optional[List[Companycolectortags]] = None
+    tags_mask: int = 0  # derivado de company_colector_tags (um bit por tag, ver TAG_BITS)
     company_photo_url: Optional[HttpUrl] = None
    
     # Endereço
@@ -36,6 +76,8 @@ class Company(Document):
     bairro: str 
     cidade: str 
     uf: str 
+    cidade_norm: Optional[str] = None  # derivado de cidade (sem acento, minúsculo)
+    codigo_ibge: Optional[str] = None  # código IBGE do município
     
     # Opcionais
     complemento: str | None = None
@@ -44,6 +86,9 @@ class Company(Document):
     # Geolocalização
     latitude: Optional[float] = None
     longitude: Optional[float] = None
+    location: Optional[GeoPoint] = None  # derivado de latitude/longitude
+    geocode_status: Optional[GeocodeStatus] = None  # preenchido pelo job de geocoding
+    geocoded_at: Optional[datetime] = None
     
     # Status e avaliação (valores padrão)
     is_active: bool = True
@@ -65,12 +110,32 @@ class Company(Document):
             raise ValueError("Empresas coletoras devem selecionar pelo menos uma tag")
         return self
     
-    def is_coletora(self) -> bool:
-        return self.company_type == CompanyType.EMPRESA_COLETORA
-    
-    def is_descartante(self) -> bool:
-        return self.company_type == CompanyType.EMPRESA_DESCARTANTE
+    @before_event(Insert, Replace, Save, SaveChanges)
+    def sync_derived_fields(self):
+        """Mantém campos derivados (cidade normalizada, UF, ponto GeoJSON, máscara de tags) alinhados"""
+        self.uf = self.uf.strip().upper()
+        self.tags_mask = tags_to_mask(self.company_colector_tags)
+        self.cidade_norm = normalize_text(self.cidade)
+
+        if self.latitude is not None and self.longitude is not None:
+            self.location = GeoPoint(coordinates=[self.longitude, self.latitude])
+        else:
+            self.location = None
+
+    @after_event(Insert, Replace, Save, SaveChanges, Delete)
+    async def invalidate_map_cache(self):
+        """Coordenadas, tags e avaliação de coletoras aparecem no mapa: descarta o cache"""
+        from app.services.map_cache import map_cache
+
+        if self.is_coletora():
+            await map_cache.invalidate(f"empresa {self.uuid}")
+
+    @after_event(Replace, Save, SaveChanges, Delete)
+    def invalidate_principal_cache(self):
+        """Status, tipo ou permissão de admin podem ter mudado: o próximo request relê o principal"""
+        from app.services.principal_cache import principal_cache
 
+        principal_cache.invalidate(self.uuid)
 
     def is_coletora(self) -> bool:
         return self.company_type == CompanyType.EMPRESA_COLETORA
@@ -117,4 +182,24 @@ class Company(Document):
     
 
     class Settings:
-        name = "companies"
\ No newline at end of file
+        name = "companies"
+        indexes = [
+            IndexModel([("location", pymongo.GEOSPHERE)], name="location_2dsphere"),
+            IndexModel(
+                [("is_active", 1), ("company_type", 1), ("uf", 1), ("cidade_norm", 1)],
+                name="map_uf_cidade",
+            ),
+            IndexModel(
+                [("is_active", 1), ("company_type", 1), ("codigo_ibge", 1)],
+                name="map_codigo_ibge",
+            ),
+            IndexModel(
+                [("is_active", 1), ("company_type", 1), ("tags_mask", 1)],
+                name="map_tags",
+            ),
+            IndexModel(
+                [("is_active", 1), ("company_type", 1), ("rating_average", -1)],
+                name="map_rating",
+            ),
+            IndexModel([("is_admin", 1)], name="admin_listing"),
+        ]
\ No newline at end of file
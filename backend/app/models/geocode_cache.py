@@ -0,0 +1,27 @@
+from typing import Annotated, Optional
+from datetime import datetime
+
+import pymongo
+from beanie import Document, Indexed
+from pydantic import Field
+from pymongo import IndexModel
+
+
+class GeocodeCache(Document):
+    """
+    Resultado do Nominatim para um endereço normalizado, compartilhado entre
+    os workers. Resultados negativos (sem coordenadas) expiram antes.
+    """
+    key: Annotated[str, Indexed(unique=True)]
+    query: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime
+
+    class Settings:
+        name = "geocode_cache"
+        indexes = [
+            # O MongoDB remove o documento quando expires_at passa
+            IndexModel([("expires_at", pymongo.ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        ]
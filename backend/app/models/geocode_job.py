@@ -0,0 +1,46 @@
+from typing import Annotated, Optional
+from uuid import UUID
+from datetime import datetime
+from enum import Enum
+
+import pymongo
+from beanie import Document, Indexed
+from pydantic import Field
+from pymongo import IndexModel
+
+
+class GeocodeJobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class GeocodeJob(Document):
+    """
+    Job de geocoding de uma empresa. Há no máximo um por empresa: enfileirar
+    de novo reaproveita o documento e incrementa `revision`, de modo que um
+    worker com uma revisão antiga não grava coordenadas de um endereço velho.
+    """
+    company_uuid: Annotated[UUID, Indexed(unique=True)]
+    status: GeocodeJobStatus = GeocodeJobStatus.QUEUED
+    revision: int = 0
+    attempts: int = 0
+    next_run_at: datetime = Field(default_factory=datetime.utcnow)
+    locked_until: Optional[datetime] = None
+    last_error: Optional[str] = None
+    finished_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "geocode_jobs"
+        indexes = [
+            IndexModel([("status", 1), ("next_run_at", 1)], name="status_next_run_at"),
+            # Jobs concluídos somem depois de uma semana
+            IndexModel(
+                [("finished_at", pymongo.ASCENDING)],
+                name="finished_at_ttl",
+                expireAfterSeconds=60 * 60 * 24 * 7,
+            ),
+        ]
@@ -0,0 +1,26 @@
+from typing import Annotated
+from datetime import datetime
+from uuid import UUID
+
+import pymongo
+from beanie import Document, Indexed
+from pydantic import Field
+from pymongo import IndexModel
+
+
+class PasswordResetToken(Document):
+    """
+    Token de redefinição de senha emitido e ainda não usado, pelo `jti` do
+    JWT. O uso remove o documento; sem ele o token não vale mais.
+    """
+    jti: Annotated[str, Indexed(unique=True)]
+    company_uuid: Annotated[UUID, Indexed()]
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime
+
+    class Settings:
+        name = "password_reset_tokens"
+        indexes = [
+            # O MongoDB remove o documento quando expires_at passa
+            IndexModel([("expires_at", pymongo.ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        ]
@@ -0,0 +1,19 @@
+from typing import Annotated, Optional
+from datetime import datetime
+
+from beanie import Document, Indexed
+
+
+class RateLimitBucket(Document):
+    """
+    Estado de um token bucket compartilhado entre os workers.
+    `next_slot_at` é o horário (relógio do MongoDB) do próximo envio livre;
+    cada reserva o empurra em um intervalo.
+    """
+    key: Annotated[str, Indexed(unique=True)]
+    next_slot_at: Optional[datetime] = None
+    slot_at: Optional[datetime] = None  # última reserva feita
+    checked_at: Optional[datetime] = None  # horário do servidor na última reserva
+
+    class Settings:
+        name = "rate_limits"
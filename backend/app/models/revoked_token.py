@@ -0,0 +1,30 @@
+from typing import Annotated
+from datetime import datetime
+
+import pymongo
+from beanie import Document, Indexed
+from pydantic import Field
+from pymongo import IndexModel
+
+
+class RevokedToken(Document):
+    """
+    Entrada do store de revogação de tokens. `key` é:
+    - "jti:<id>": refresh token já usado (rotação; reuso revoga a sessão)
+    - "sid:<id>": sessão encerrada (logout ou reuso de refresh token)
+    - "sub:<uuid>": todos os tokens da empresa emitidos até `revoked_at`
+      (senha trocada, empresa desativada ou removida)
+    Some sozinha quando nenhum token afetado pode mais ser válido.
+    """
+    key: Annotated[str, Indexed(unique=True)]
+    revoked_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime
+
+    class Settings:
+        name = "revoked_tokens"
+        indexes = [
+            # O MongoDB remove o documento quando expires_at passa
+            IndexModel([("expires_at", pymongo.ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+            # Sincronização incremental do filtro de Bloom entre workers
+            IndexModel([("revoked_at", pymongo.ASCENDING)], name="revoked_at"),
+        ]
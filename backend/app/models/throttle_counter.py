@@ -0,0 +1,24 @@
+from typing import Annotated
+from datetime import datetime
+
+import pymongo
+from beanie import Document, Indexed
+from pymongo import IndexModel
+
+
+class ThrottleCounter(Document):
+    """
+    Tentativas de login / recuperação de senha numa janela fixa, somadas por
+    todos os workers. `key` é "<política>:<ip|email>:<valor>:<índice da janela>";
+    o documento fica até o fim da janela seguinte, que ainda o usa como anterior.
+    """
+    key: Annotated[str, Indexed(unique=True)]
+    hits: int = 0
+    expires_at: datetime
+
+    class Settings:
+        name = "throttle_counters"
+        indexes = [
+            # O MongoDB remove o documento quando expires_at passa
+            IndexModel([("expires_at", pymongo.ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        ]
@@ -10,6 +10,7 @@ from . import location
 from . import discard_route
 from . import environmental_report
 from . import item_reference
+from . import metrics
 
 
 api_router = APIRouter()
@@ -23,6 +24,7 @@ api_router.include_router(location.router, prefix="/location", tags=["location"]
 api_router.include_router(discard_route.router, prefix="/discards", tags=["discards"])
 api_router.include_router(environmental_report.router, prefix="/api/v1/environmental-reports", tags=["environmental-reports"])
 api_router.include_router(item_reference.router, prefix="/item-references", tags=["item-references"])
+api_router.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
 
 @api_router.get("/")
 async def root():
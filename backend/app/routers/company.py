@@ -6,19 +6,28 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from pymongo import errors
 
 from app import models
-from app.schemas.company import CompanyCreate, CompanyUpdate, CompanyOut, CompanyMapFilter, CompanyMapOut
+from app.schemas.company import CompanyCreate, CompanyUpdate, CompanyOut, CompanyMapFilter, CompanyMapOut, CompanyPrincipal
 from app.auth.auth_company import (
-    get_hashed_password,
+    hash_password,
     get_current_active_company,
-    get_current_active_admin_company,
+    get_current_active_principal,
+    get_current_active_admin_principal,
 )
-from app.services.geocoding_service import geocoding_service
+from app.models.company import GeocodeStatus
+from app.services.geocode_job_service import geocode_job_service
+from app.services.locationIBGE_service import ibge_service
 from app.services.company_service import company_service
-from app.services.cnpj_validator import CNPJValidator
+from app.services.cnpj_validator import cnpj_validator
+from app.services.token_service import token_service
 from app.config.config import settings
 
 router = APIRouter()
 
+# Campos cuja alteração exige novo geocoding
+ADDRESS_FIELDS = ['rua', 'numero', 'bairro', 'cidade', 'uf', 'cep']
+# Campos cuja alteração derruba as sessões abertas da empresa
+SESSION_FIELDS = ['hashed_password', 'is_active']
+
 
 @router.post("/register", response_model=CompanyOut)
 async def register_company(company: CompanyCreate):
@@ -43,13 +52,15 @@ async def register_company(company: CompanyCreate):
 
 
     if settings.VALIDATE_CNPJ_EXTERNAL:
-        cnpj_validator = CNPJValidator()
         cnpj_validation = await cnpj_validator.validate(company.cnpj)
         if not cnpj_validation["valid"]:
             raise HTTPException(status_code=400, detail=cnpj_validation["error"])
 
 
-    hashed_password = get_hashed_password(company.password)
+    hashed_password = await hash_password(company.password)
+
+    # Só o snapshot: sem ele o job de geocoding resolve o código fora da requisição
+    codigo_ibge = await ibge_service.get_codigo_municipio(company.uf, company.cidade, fetch=False)
 
   
     new_company = models.Company(
@@ -70,24 +81,15 @@ async def register_company(company: CompanyCreate):
         uf=company.uf,
         complemento=company.complemento,
         referencia=company.referencia,
+        codigo_ibge=codigo_ibge,
+        geocode_status=GeocodeStatus.PENDENTE,
     )
 
     try:
         await new_company.create()
 
-        address_data = {
-            'rua': company.rua,
-            'numero': company.numero,
-            'bairro': company.bairro,
-            'cidade': company.cidade,
-            'uf': company.uf
-        }
-
-        coordinates = await geocoding_service.get_coordinates_from_address(address_data)
-
-        if coordinates:
-            new_company.latitude, new_company.longitude = coordinates
-            await new_company.save()
+        # Coordenadas são preenchidas em segundo plano pelo job de geocoding
+        await geocode_job_service.enqueue(new_company.uuid)
 
         return new_company
 
@@ -99,7 +101,7 @@ async def register_company(company: CompanyCreate):
 async def get_companies(
     limit: int = 10,
     offset: int = 0,
-    admin_company: models.Company = Depends(get_current_active_admin_company),
+    admin_company: CompanyPrincipal = Depends(get_current_active_admin_principal),
 ):
     companies = await models.Company.find({"is_admin":False}).skip(offset).limit(limit).to_list()
     return companies
@@ -132,7 +134,7 @@ async def update_my_company(
             raise HTTPException(status_code=400, detail="Company with that name already exists")
 
     if "password" in update_data:
-        update_data["hashed_password"] = get_hashed_password(update_data["password"])
+        update_data["hashed_password"] = await hash_password(update_data["password"])
         del update_data["password"]
         del update_data["confirm_password"]
 
@@ -161,9 +163,27 @@ async def update_my_company(
             detail="Empresas coletoras devem selecionar pelo menos uma tag"
         )
 
+    if "cidade" in update_data or "uf" in update_data:
+        update_data["codigo_ibge"] = await ibge_service.get_codigo_municipio(
+            update_data.get("uf", current_company.uf),
+            update_data.get("cidade", current_company.cidade),
+            fetch=False,
+        )
+
+    address_updated = any(field in update_data for field in ADDRESS_FIELDS)
+    if address_updated:
+        update_data["geocode_status"] = GeocodeStatus.PENDENTE
+
     current_company = current_company.model_copy(update=update_data)
     try:
         await current_company.save()
+
+        if any(field in update_data for field in SESSION_FIELDS):
+            await token_service.revoke_company(current_company.uuid)
+
+        if address_updated:
+            await geocode_job_service.enqueue(current_company.uuid)
+
         return current_company
     except (errors.DuplicateKeyError, RevisionIdWasChanged):
         raise HTTPException(status_code=400, detail="Company with that email or CNPJ already exists")
@@ -176,7 +196,8 @@ async def delete_me(current_company: models.Company = Depends(get_current_active
         raise HTTPException(status_code=401, detail="Not authenticated")
 
     try:
-        await current_company.delete()   
+        await current_company.delete()
+        await token_service.revoke_company(current_company.uuid)
         return {"message": "Company deleted successfully"}
     except Exception:
         raise HTTPException(status_code=500, detail="Error deleting company")
@@ -185,7 +206,7 @@ async def delete_me(current_company: models.Company = Depends(get_current_active
 @router.get("/id", response_model=CompanyMapOut)
 async def get_company_by_any_id(
     company_id: str = Query(..., description="Company ID (UUID or ObjectID)"),
-    admin_company: models.Company = Depends(get_current_active_company),
+    admin_company: CompanyPrincipal = Depends(get_current_active_principal),
 ):
     from uuid import UUID
     from bson import ObjectId
@@ -210,7 +231,7 @@ async def get_company_by_any_id(
 @router.get("/{company_id}", response_model=CompanyOut)
 async def get_company(
     company_id: UUID,
-    admin_company: models.Company = Depends(get_current_active_admin_company),
+    admin_company: CompanyPrincipal = Depends(get_current_active_admin_principal),
 ):
     company = await models.Company.find_one({"uuid": company_id})
     if company is None:
@@ -222,7 +243,7 @@ async def get_company(
 async def update_company(
     company_id: UUID,
     update: CompanyUpdate,
-    admin_company: models.Company = Depends(get_current_active_admin_company),
+    admin_company: CompanyPrincipal = Depends(get_current_active_admin_principal),
 ):
     company = await models.Company.find_one({"uuid": company_id})
     if company is None:
@@ -240,22 +261,33 @@ async def update_company(
             raise HTTPException(status_code=400, detail="Company with that name already exists")
 
     if "password" in update_data:
-        update_data["hashed_password"] = get_hashed_password(update_data["password"])
+        update_data["hashed_password"] = await hash_password(update_data["password"])
         del update_data["password"]
         del update_data["confirm_password"]
 
     # Verificar se algum campo de endereço foi atualizado
-    address_fields = ['rua', 'numero', 'bairro', 'cidade', 'uf', 'cep']
-    address_updated = any(field in update_data for field in address_fields)
+    address_updated = any(field in update_data for field in ADDRESS_FIELDS)
+    if address_updated:
+        update_data["geocode_status"] = GeocodeStatus.PENDENTE
+
+    if "cidade" in update_data or "uf" in update_data:
+        update_data["codigo_ibge"] = await ibge_service.get_codigo_municipio(
+            update_data.get("uf", company.uf),
+            update_data.get("cidade", company.cidade),
+            fetch=False,
+        )
     
     updated_company = company.model_copy(update=update_data)
     
     try:
         await updated_company.save()
+
+        if any(field in update_data for field in SESSION_FIELDS):
+            await token_service.revoke_company(updated_company.uuid)
         
-        # Se endereço foi atualizado, buscar novas coordenadas
+        # Se endereço foi atualizado, buscar novas coordenadas em segundo plano
         if address_updated:
-            await updated_company.update_geolocation()
+            await geocode_job_service.enqueue(updated_company.uuid)
             
         return updated_company
     except (errors.DuplicateKeyError, RevisionIdWasChanged):
@@ -266,10 +298,11 @@ async def update_company(
 @router.delete("/{company_id}", response_model=CompanyOut)
 async def delete_company(
     company_id: UUID,
-    admin_company: models.Company = Depends(get_current_active_admin_company),
+    admin_company: CompanyPrincipal = Depends(get_current_active_admin_principal),
 ):
     company = await models.Company.find_one({"uuid": company_id})
     if company is None:
         raise HTTPException(status_code=404, detail="Company not found")
     await company.delete()
+    await token_service.revoke_company(company.uuid)
     return company
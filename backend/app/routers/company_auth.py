@@ -1,37 +1,36 @@
-from datetime import timedelta
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app import models
-from app.schemas.tokens import Token
+from app.schemas.tokens import RefreshTokenRequest, Token
 from app.schemas.company import CompanyOut
 from app.auth.auth_company import (
     authenticate_company,
-    create_access_token_company,
-    get_current_company,
-    get_current_company_from_cookie,
     get_current_active_company,
 )
-from app.config.config import settings
+from app.services.login_throttle import client_ip, login_throttle
+from app.services.token_service import token_service
 
 router = APIRouter()
 
 @router.post("/access-token", response_model=Token)
-async def login_access_token(form_data: OAuth2PasswordRequestForm = Depends()) -> Any:
+async def login_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()) -> Any:
     """
     OAuth2 compatible token login for companies.
     """
+    # Limite por IP e email antes da busca no banco e do bcrypt
+    await login_throttle.hit(client_ip(request), form_data.username)
+
     company = await authenticate_company(form_data.username, form_data.password)
     if company is None:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not company.is_active:
         raise HTTPException(status_code=400, detail="Inactive company")
 
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token_company(company.uuid, expires_delta=access_token_expires)
-    return {"access_token": access_token, "token_type": "bearer"}
+    await login_throttle.reset(form_data.username)
+    return token_service.issue(company)
 
 
 
@@ -42,17 +41,17 @@ async def test_token(current_company: models.Company = Depends(get_current_activ
     """
     return current_company
 
-@router.get("/refresh")
-async def refresh_token(current_company=None):
-    # se vier None, usa a dependência do FastAPI
-    if current_company is None:
-        from fastapi import Depends
-        current_company = await get_current_company_from_cookie()
-
-    if not current_company.is_active:
-        raise HTTPException(status_code=400, detail="Inactive company")
-
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    token = create_access_token_company(current_company.uuid, expires_delta=access_token_expires)
+@router.post("/refresh", response_model=Token)
+async def refresh_token(request: RefreshTokenRequest) -> Any:
+    """
+    Troca o refresh token por um novo par (o usado deixa de valer)
+    """
+    return await token_service.rotate(request.refresh_token)
 
-    return {"access_token": token, "token_type": "bearer"}
+@router.post("/logout")
+async def logout(request: RefreshTokenRequest):
+    """
+    Encerra a sessão do refresh token
+    """
+    await token_service.logout(request.refresh_token)
+    return {"message": "Sessão encerrada"}
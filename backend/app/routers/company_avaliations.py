@@ -10,14 +10,14 @@ from app.schemas.avaliations import (
     CompanyAvaliationsSummary
 )
 from app.services.avaliation_service import avaliation_service
-from app.auth.auth_company import get_current_company
-from app.models.company import Company
+from app.auth.auth_company import get_current_principal
+from app.schemas.company import CompanyPrincipal
 router = APIRouter()
 
 @router.post("/", response_model=AvaliationOut, status_code=status.HTTP_201_CREATED)
 async def create_avaliation(
     avaliation_data: AvaliationCreate,
-    current_company: Company = Depends(get_current_company)
+    current_company: CompanyPrincipal = Depends(get_current_principal)
 ):
     """
     Create a new avaliation
@@ -91,7 +91,7 @@ async def get_company_avaliations(
 
 @router.get("/my/avaliations", response_model=List[AvaliationOut])
 async def get_my_avaliations(
-    current_company: Company = Depends(get_current_company),
+    current_company: CompanyPrincipal = Depends(get_current_principal),
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100)
 ):
@@ -114,7 +114,7 @@ async def get_my_avaliations(
 async def update_avaliation(
     rating_uuid: UUID,
     update_data: AvaliationUpdate,
-    current_company: Company = Depends(get_current_company)
+    current_company: CompanyPrincipal = Depends(get_current_principal)
 ):
     """
     Update an avaliation (only by the company that created it)
@@ -148,7 +148,7 @@ async def update_avaliation(
 @router.delete("/delete", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_avaliation(
     rating_uuid: UUID,
-    current_company: Company = Depends(get_current_company)
+    current_company: CompanyPrincipal = Depends(get_current_principal)
 ):
     """
     Delete an avaliation (only by the company that created it)
@@ -1,14 +1,33 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from typing import List
 
+from app.auth.auth_company import get_current_active_admin_principal
+from app.config.config import settings
+from app.services.cep_index import cep_index
 from app.services.locationIBGE_service import ibge_service
 from app.services.geocoding_service import geocoding_service
-from app.schemas.location import EstadoSchema, CidadeSchema, EnderecoCEPSchema, LocalizacaoResponse
+from app.schemas.company import CompanyPrincipal
+from app.schemas.location import (
+    EstadoSchema, CidadeSchema, CidadeAutocompleteSchema, EnderecoCEPSchema, LocalizacaoResponse
+)
 
 router = APIRouter(prefix="/location", tags=["location"])
 
+
+def _not_modified(request: Request, response: Response, etag: str) -> bool:
+    """
+    Coloca Cache-Control/ETag na resposta; True se o cliente já tem essa versão
+    """
+    response.headers["Cache-Control"] = f"public, max-age={settings.LOCATION_CACHE_MAX_AGE_SECONDS}"
+    response.headers["ETag"] = etag
+    return request.headers.get("if-none-match") == etag
+
+
 @router.get("/estados", response_model=List[EstadoSchema])
-async def get_estados():
+async def get_estados(request: Request, response: Response):
+    if _not_modified(request, response, ibge_service.etag()):
+        return Response(status_code=304, headers=dict(response.headers))
+
     try:
         estados = await ibge_service.get_estados()
         if not estados:
@@ -21,11 +40,14 @@ async def get_estados():
         raise HTTPException(status_code=500, detail=f"Erro ao buscar estados: {str(e)}")
 
 @router.get("/estados/{uf}/cidades", response_model=List[CidadeSchema])
-async def get_cidades_por_estado(uf: str):
+async def get_cidades_por_estado(uf: str, request: Request, response: Response):
 
     if len(uf) != 2:
         raise HTTPException(status_code=400, detail="UF deve ter 2 caracteres")
 
+    if ibge_service.snapshot is not None and _not_modified(request, response, ibge_service.etag(uf)):
+        return Response(status_code=304, headers=dict(response.headers))
+
     try:
         cidades = await ibge_service.get_cidades_por_estado(uf)
         if not cidades:
@@ -37,6 +59,29 @@ async def get_cidades_por_estado(uf: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar cidades: {str(e)}")
     
+@router.get("/cidades/autocomplete", response_model=List[CidadeAutocompleteSchema])
+async def autocomplete_cidades(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=100, description="Início do nome da cidade"),
+    uf: str | None = Query(None, min_length=2, max_length=2),
+    limit: int = Query(10, ge=1, le=50),
+):
+    """
+    Sugestões de cidades pelo início do nome, sem acento/caixa, com o código IBGE
+    """
+    if ibge_service.snapshot is not None and _not_modified(request, response, ibge_service.etag(uf or "BR")):
+        return Response(status_code=304, headers=dict(response.headers))
+
+    try:
+        cidades = await ibge_service.autocomplete_cidades(q, uf, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar cidades: {str(e)}")
+
+    if cidades is None:
+        raise HTTPException(status_code=503, detail="Lista de municípios ainda não carregada; informe a UF")
+    return cidades
+
 @router.get("/cep/{cep}", response_model=LocalizacaoResponse)
 async def get_endereco_por_cep(cep: str):
     """
@@ -67,4 +112,23 @@ async def get_endereco_por_cep_query(cep: str = Query(..., description="CEP no f
     """
     Busca endereço completo a partir do CEP (usando query parameter)
     """
-    return await get_endereco_por_cep(cep)
\ No newline at end of file
+    return await get_endereco_por_cep(cep)
+
+
+@router.post("/cep/index/reload")
+async def reload_cep_index(
+    admin_company: CompanyPrincipal = Depends(get_current_active_admin_principal),
+):
+    """
+    Recarrega o índice local de CEPs deste worker (os demais recarregam
+    sozinhos quando o arquivo muda)
+    """
+    if not settings.CEP_INDEX_PATH:
+        raise HTTPException(status_code=404, detail="Índice local de CEP não configurado")
+
+    try:
+        rows = await cep_index.reload()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao recarregar índice de CEP: {str(e)}")
+
+    return {"rows": rows, **cep_index.stats()}
@@ -1,31 +1,60 @@
-from typing import Any, List
+from typing import Annotated, Any, List, Optional, Union
 from uuid import UUID
 
 from beanie.exceptions import RevisionIdWasChanged
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pymongo import errors
 
-from app import models
-from app.schemas.company import CompanyOut, CompanyMapFilter, CompanyMapOut, CompanyMapSimpleOut
+from app.schemas.company import (
+    CompanyOut,
+    CompanyMapFilter,
+    CompanyMapOut,
+    CompanyMapSimpleOut,
+    CompanyMapViewportOut,
+    CompanyMapClustersOut,
+    CompanyDensityOut,
+    CompanyPrincipal,
+    DensityLayer,
+    TagMatch,
+    CLUSTER_MAX_ZOOM,
+    MAX_MAP_RADIUS_KM,
+    MAX_MAP_RESULTS,
+)
 from app.auth.auth_company import (
-    get_current_active_company,
-    get_current_active_admin_company,
+    get_current_active_principal,
+    get_current_active_admin_principal,
 )
 from app.services.geocoding_service import geocoding_service
 from app.services.company_service import company_service
+from app.services.density_service import density_service
+from app.services.map_cache import TILE_CACHE_TTL_SECONDS
+from app.services.map_tile_service import map_tile_service
 
 router = APIRouter()
 
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
 
-@router.post("/map/filter", response_model=List[CompanyMapOut])
+@router.post(
+    "/map/filter",
+    response_model=Union[
+        List[CompanyMapOut], CompanyMapViewportOut[CompanyMapOut], CompanyMapClustersOut
+    ],
+)
 async def get_companies_for_map(
     filter_data: CompanyMapFilter,
-    current_company: models.Company = Depends(get_current_active_company)
+    current_company: CompanyPrincipal = Depends(get_current_active_principal)
 ):
     """
-    Get companies for map with filters
+    Get companies for map with filters.
+    With bbox, returns a capped page with a `truncated` flag instead of a list.
+    With a zoom below the cluster threshold, returns grid clusters instead.
     """
     try:
+        if filter_data.wants_clusters():
+            return await company_service.get_map_clusters(filter_data)
+        if filter_data.bbox is not None:
+            return await company_service.get_companies_for_map_viewport(filter_data)
         companies = await company_service.get_companies_for_map(filter_data)
         return companies
     except Exception as e:
@@ -33,32 +62,130 @@ async def get_companies_for_map(
 
 @router.get("/tags/available", response_model=List[str])
 async def get_available_tags(
-    current_company: models.Company = Depends(get_current_active_company)
+    current_company: CompanyPrincipal = Depends(get_current_active_principal)
 ):
     """
     Get all available collector tags
     """
     return await company_service.get_available_tags()
 
-@router.get("/map/coletoras", response_model=List[CompanyMapSimpleOut])
+@router.get(
+    "/map/coletoras",
+    response_model=Union[
+        List[CompanyMapSimpleOut],
+        CompanyMapViewportOut[CompanyMapSimpleOut],
+        CompanyMapClustersOut,
+    ],
+)
 async def get_coletoras_for_map(
     tags: List[str] = Query(None, description="Filter by tags"),
-    city: str = Query(None, description="Filter by city"),
+    tag_match: Annotated[
+        TagMatch, Query(description="Match any of the tags (default) or all of them")
+    ] = TagMatch.ANY,
+    city: str = Query(None, description="Filter by city (accent and case insensitive)"),
     uf: str = Query(None, description="Filter by state"),
-    min_rating: float = Query(None, ge=1, le=5, description="Minimum rating")
+    min_rating: float = Query(None, ge=1, le=5, description="Minimum rating"),
+    city_code: Annotated[
+        Optional[str], Query(description="Filter by IBGE municipality code")
+    ] = None,
+    lat: Annotated[
+        Optional[float], Query(ge=-90, le=90, description="Latitude of the search center")
+    ] = None,
+    lng: Annotated[
+        Optional[float], Query(ge=-180, le=180, description="Longitude of the search center")
+    ] = None,
+    radius_km: Annotated[
+        Optional[float], Query(gt=0, le=MAX_MAP_RADIUS_KM, description="Search radius in km")
+    ] = None,
+    bbox: Annotated[
+        Optional[str], Query(description="Visible area as minLng,minLat,maxLng,maxLat")
+    ] = None,
+    limit: Annotated[
+        int, Query(gt=0, le=MAX_MAP_RESULTS, description="Max companies returned in bbox mode")
+    ] = MAX_MAP_RESULTS,
+    zoom: Annotated[
+        Optional[int], Query(ge=0, le=22, description="Map zoom level; low zooms return clusters")
+    ] = None,
 ):
     """
-    Get collector companies for map with query parameters
+    Get collector companies for map with query parameters.
+    With lat/lng, only companies inside radius_km are returned, nearest first.
+    With bbox, returns a capped page with a `truncated` flag instead of a list.
+    With a zoom below the cluster threshold, returns grid clusters instead.
     """
-    filter_data = CompanyMapFilter(
-        tags=tags,
-        city=city,
-        uf=uf,
-        min_rating=min_rating
-    )
-    
     try:
+        filter_data = CompanyMapFilter(
+            tags=tags,
+            tag_match=tag_match,
+            city=city,
+            city_code=city_code,
+            uf=uf,
+            min_rating=min_rating,
+            lat=lat,
+            lng=lng,
+            radius_km=radius_km,
+            bbox=bbox,
+            limit=limit,
+            zoom=zoom
+        )
+        
+        if filter_data.wants_clusters():
+            return await company_service.get_map_clusters(filter_data)
+        if filter_data.bbox is not None:
+            return await company_service.get_companies_for_map_simple_viewport(filter_data)
+        
         companies = await company_service.get_companies_for_map_simple(filter_data)  # ← Use o novo método
         return companies
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/map/tiles/{z}/{x}/{y}.mvt", response_class=Response)
+async def get_coletoras_tile(
+    z: int,
+    x: int,
+    y: int,
+    request: Request,
+    tags: Annotated[Optional[List[str]], Query(description="Filter by tags")] = None,
+    tag_match: Annotated[
+        TagMatch, Query(description="Match any of the tags (default) or all of them")
+    ] = TagMatch.ANY,
+    city: Annotated[Optional[str], Query(description="Filter by city")] = None,
+    city_code: Annotated[
+        Optional[str], Query(description="Filter by IBGE municipality code")
+    ] = None,
+    uf: Annotated[Optional[str], Query(description="Filter by state")] = None,
+    min_rating: Annotated[Optional[float], Query(ge=1, le=5, description="Minimum rating")] = None,
+):
+    """
+    Collector companies as a Mapbox Vector Tile (layer "coletoras": uuid, rating_average, tags)
+    """
+    try:
+        filter_data = CompanyMapFilter(
+            tags=tags, tag_match=tag_match, city=city, city_code=city_code, uf=uf,
+            min_rating=min_rating
+        )
+        tile, etag = await map_tile_service.get_tile(z, x, y, filter_data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={TILE_CACHE_TTL_SECONDS}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=tile, media_type=MVT_MEDIA_TYPE, headers=headers)
+
+
+@router.get("/map/density", response_model=CompanyDensityOut)
+async def get_map_density(
+    layer: Annotated[
+        DensityLayer, Query(description="coletoras (active collectors) or descartes (discard volume)")
+    ] = DensityLayer.COLETORAS,
+    zoom: Annotated[
+        int, Query(ge=0, le=CLUSTER_MAX_ZOOM, description="Grid resolution as a map zoom level")
+    ] = 4,
+    admin_company: CompanyPrincipal = Depends(get_current_active_admin_principal),
+):
+    """
+    Density grid (count and discarded quantity per cell) for coverage analysis
+    """
+    return await density_service.get_density(layer, zoom)
@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends
+
+from app.schemas.company import CompanyPrincipal
+from app.auth.auth_company import get_current_active_admin_principal
+from app.services.cep_index import cep_index
+from app.services.circuit_breaker import circuit_breaker_stats
+from app.services.cnpj_validator import cnpj_validator
+from app.services.geocode_cache import geocode_cache
+from app.services.geocoding_dispatcher import geocoding_dispatcher
+from app.services.geocode_job_service import geocode_job_service
+from app.services.locationIBGE_service import ibge_service
+from app.services.map_cache import map_cache
+from app.services.map_snapshot import map_snapshot_service
+from app.services.login_throttle import forgot_password_throttle, login_throttle
+from app.services.password_hasher import password_hash_pool
+from app.services.token_service import token_service
+
+router = APIRouter()
+
+
+@router.get("/")
+async def get_metrics(
+    admin_company: CompanyPrincipal = Depends(get_current_active_admin_principal),
+):
+    """
+    Contadores em memória deste worker (caches e snapshot do mapa)
+    """
+    return {
+        "map_cache": map_cache.stats(),
+        "map_snapshot": map_snapshot_service.stats(),
+        "geocode_cache": geocode_cache.stats(),
+        "geocoding_queue": geocoding_dispatcher.stats(),
+        "geocode_jobs": geocode_job_service.stats(),
+        "cep_index": cep_index.stats(),
+        "ibge": ibge_service.stats(),
+        "cnpj": cnpj_validator.stats(),
+        "circuit_breakers": circuit_breaker_stats(),
+        "password_hashing": password_hash_pool.stats(),
+        "tokens": token_service.stats(),
+        "throttle": {
+            "login": login_throttle.stats(),
+            "forgot_password": forgot_password_throttle.stats(),
+        },
+    }
@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request
 from app import models
-from uuid import UUID
+from datetime import datetime
 from app.schemas.password_reset import (
     ForgotPasswordRequest, 
     ResetPasswordRequest, 
@@ -8,9 +8,11 @@ from app.schemas.password_reset import (
 )
 from app.services.password_reset_service import password_reset_service
 from app.services.email_service import email_service
+from app.services.login_throttle import client_ip, forgot_password_throttle
+from app.services.token_service import token_service
 from app.auth.auth_company import (
-    get_hashed_password,
-    verify_password,
+    hash_password,
+    check_password,
     get_current_active_company,
 )
 
@@ -19,11 +21,15 @@ router = APIRouter()
 @router.post("/forgot-password")
 async def forgot_password(
     request: ForgotPasswordRequest,
-    background_tasks: BackgroundTasks
+    background_tasks: BackgroundTasks,
+    http_request: Request,
 ):
     """
     Initiate password reset process for a company.
     """
+    # Limite por IP e email antes da busca no banco e do envio do email
+    await forgot_password_throttle.hit(client_ip(http_request), request.email)
+
     company = await models.Company.find_one({"email": request.email})
     
     # Sempre retornar mesma mensagem por segurança
@@ -32,7 +38,7 @@ async def forgot_password(
             "message": "Se o email existir em nosso sistema, enviaremos instruções de recuperação"
         }
 
-    reset_token = password_reset_service.create_reset_token(str(company.uuid))
+    reset_token = await password_reset_service.create_reset_token(str(company.uuid))
     print("company_UID:", company.uuid)
     
     # Enviar email em background
@@ -51,31 +57,19 @@ async def reset_password(request: ResetPasswordRequest):
     """
     Reset company password using the provided token.
     """
-    company_id = password_reset_service.verify_reset_token(request.token)
-    
-    if not company_id:
-        raise HTTPException(status_code=400, detail="Token inválido ou expirado")
-    
-    try:
-        company_uuid = UUID(company_id)
-        print("Company_ID convertido: {company_uuid}")
-    except ValueError as e:
-        print(f"❌ Erro na conversão para UUID: {e}")
-        raise HTTPException(status_code=400, detail="Token inválido")
+    # Assinatura e tipo antes do bcrypt; o token só é consumido com o hash pronto
+    password_reset_service.verify_reset_token(request.token)
+    hashed_password = await hash_password(request.new_password)
 
+    company_uuid = await password_reset_service.consume_reset_token(request.token)
 
-    # Debug: buscar a empresa
-    company = await models.Company.find_one({"uuid": company_uuid})
-    print(f"🔍 Empresa encontrada: {company}")
-
-    company = await models.Company.find_one({"uuid": company_uuid})
-    if not company:
-        print("❌ Empresa não encontrada no banco")
+    # Atualizar senha ($set direto, sem carregar a empresa)
+    result = await models.Company.find_one({"uuid": company_uuid, "is_active": True}).update(
+        {"$set": {"hashed_password": hashed_password, "updated_at": datetime.utcnow()}}
+    )
+    if not result.matched_count:
         raise HTTPException(status_code=400, detail="Token inválido ou expirado")
-    
-    # Atualizar senha
-    company.hashed_password = get_hashed_password(request.new_password)
-    await company.save()
+    await token_service.revoke_company(company_uuid)
     
     return {"message": "Senha redefinida com sucesso"}
 
@@ -89,11 +83,12 @@ async def change_password(
     Change password for logged-in company (requires current password)
     """
     # Verificar senha atual
-    if not verify_password(request.current_password, current_company.hashed_password):
+    if not await check_password(request.current_password, current_company.hashed_password):
         raise HTTPException(status_code=400, detail="Senha atual incorreta")
     
     # Atualizar senha
-    current_company.hashed_password = get_hashed_password(request.new_password)
+    current_company.hashed_password = await hash_password(request.new_password)
     await current_company.save()
+    await token_service.revoke_company(current_company.uuid)
     
     return {"message": "Senha alterada com sucesso"}
\ No newline at end of file
@@ -1,6 +1,6 @@
-from .tokens import Token, TokenPayload
+from .tokens import RefreshTokenRequest, Token, TokenPayload
 from .users import User, UserUpdate
-from .company import CompanyOut, CompanyCreate, CompanyUpdate, CompanyMapFilter, CompanyMapOut, CompanyMapSimpleOut
+from .company import CompanyOut, CompanyCreate, CompanyUpdate, CompanyMapFilter, CompanyMapOut, CompanyMapSimpleOut, CompanyMapViewportOut, CompanyMapClustersOut
 from .password_reset import ForgotPasswordRequest, ResetPasswordRequest, PasswordChangeRequest
 from .avaliations import AvaliationCreate, AvaliationOut, AvaliationUpdate, CompanyAvaliationsSummary
 from .location import EstadoSchema, CidadeSchema, EnderecoCEPSchema, LocalizacaoResponse
\ No newline at end of file
@@ -1,8 +1,9 @@
 from uuid import UUID
-from pydantic import BaseModel, EmailStr, model_validator, field_validator, HttpUrl
-from typing import Optional, Union, List
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, model_validator, field_validator, HttpUrl
+from typing import Dict, Generic, Optional, Tuple, TypeVar, Union, List
 from datetime import datetime
-from app.models.company import CompanyType, Companycolectortags
+from enum import Enum
+from app.models.company import CompanyType, Companycolectortags, GeocodeStatus
 
 class CompanyBase(BaseModel):
     nome: str
@@ -103,6 +104,9 @@ class CompanyOut(CompanyBase):
     total_rewards_redeemed: int
     latitude: Optional[float] = None
     longitude: Optional[float] = None
+    codigo_ibge: Optional[str] = None
+    geocode_status: Optional[GeocodeStatus] = None
+    geocoded_at: Optional[datetime] = None
     created_at: datetime
     updated_at: datetime
 
@@ -113,12 +117,75 @@ class CompanyOut(CompanyBase):
         }
 
 
+MAX_MAP_RADIUS_KM = 500
+DEFAULT_MAP_RADIUS_KM = 50
+MAX_MAP_RESULTS = 500
+# Abaixo deste zoom o mapa recebe clusters; a partir dele, empresas individuais
+CLUSTER_MAX_ZOOM = 12
+
+
+class TagMatch(str, Enum):
+    ANY = "any"  # pelo menos uma das tags
+    ALL = "all"  # todas as tags
+
 class CompanyMapFilter(BaseModel):
     tags: Optional[List[Companycolectortags]] = None
-    city: Optional[str] = None
+    tag_match: TagMatch = TagMatch.ANY
+    city: Optional[str] = None  # comparação exata, sem acento/caixa
+    city_code: Optional[str] = None  # código IBGE do município
     uf: Optional[str] = None
     min_rating: Optional[float] = None
 
+    # Busca por raio a partir de um ponto
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lng: Optional[float] = Field(None, ge=-180, le=180)
+    radius_km: Optional[float] = Field(None, gt=0, le=MAX_MAP_RADIUS_KM)
+
+    # Área visível do mapa: minLng,minLat,maxLng,maxLat
+    bbox: Optional[Tuple[float, float, float, float]] = None
+    limit: int = Field(MAX_MAP_RESULTS, gt=0, le=MAX_MAP_RESULTS)
+
+    # Nível de zoom do mapa (padrão web mercator, 0 = mundo inteiro)
+    zoom: Optional[int] = Field(None, ge=0, le=22)
+
+    @field_validator('bbox', mode='before')
+    @classmethod
+    def parse_bbox(cls, v):
+        """Aceita a bbox como string 'minLng,minLat,maxLng,maxLat'"""
+        if isinstance(v, str):
+            parts = v.split(',')
+            if len(parts) != 4:
+                raise ValueError("bbox deve ter o formato minLng,minLat,maxLng,maxLat")
+            return [part.strip() for part in parts]
+        return v
+
+    @field_validator('bbox')
+    @classmethod
+    def validate_bbox(cls, v):
+        if v is None:
+            return v
+        min_lng, min_lat, max_lng, max_lat = v
+        if not (-180 <= min_lng < max_lng <= 180) or not (-90 <= min_lat < max_lat <= 90):
+            raise ValueError("bbox inválida: esperado minLng < maxLng e minLat < maxLat")
+        return v
+
+    @model_validator(mode='after')
+    def validate_geo_center(self):
+        """lat e lng devem ser informados juntos; radius_km exige um centro"""
+        if (self.lat is None) != (self.lng is None):
+            raise ValueError("lat e lng devem ser informados juntos")
+        if self.radius_km is not None and self.lat is None:
+            raise ValueError("radius_km exige lat e lng")
+        if self.bbox is not None and self.lat is not None:
+            raise ValueError("Use bbox ou lat/lng, não ambos")
+        return self
+
+    def has_geo_center(self) -> bool:
+        return self.lat is not None and self.lng is not None
+
+    def wants_clusters(self) -> bool:
+        return self.zoom is not None and self.zoom < CLUSTER_MAX_ZOOM
+
 class CompanyMapOut(BaseModel):
     uuid: UUID
     nome: str
@@ -134,6 +201,7 @@ class CompanyMapOut(BaseModel):
     numero: str
     cidade: str
     uf: str
+    distance_km: Optional[float] = None
 
     class Config:
             from_attributes = True
@@ -155,6 +223,108 @@ class CompanyMapSimpleOut(BaseModel):
     bairro: Optional[str] = None
     rua: Optional[str] = None
     numero: Optional[str] = None
+    distance_km: Optional[float] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class CompanyPrincipal(BaseModel):
+    """
+    Empresa autenticada, só com o necessário para autorizar a requisição.
+    Projeção do Company (sem hashed_password nem o resto do documento),
+    imutável para poder ficar em cache entre requisições.
+    """
+    model_config = ConfigDict(frozen=True)
+
+    uuid: UUID
+    is_active: bool = True
+    is_admin: bool = False
+    company_type: CompanyType
+
+    def is_coletora(self) -> bool:
+        return self.company_type == CompanyType.EMPRESA_COLETORA
+
+
+class CompanyMapProjection(BaseModel):
+    """
+    Projeção com os campos exibidos no mapa. Com .project() o MongoDB só envia
+    estes campos e o Document completo não é instanciado (sem hashed_password,
+    sem model_validator e sem timestamps).
+    """
+    uuid: UUID
+    nome: str
+    company_type: CompanyType
+    company_colector_tags: Optional[List[Companycolectortags]] = None
+    tags_mask: int = 0
+    company_photo_url: Optional[HttpUrl] = None
+    company_description: Optional[str] = None
+    telefone: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    rating_average: float = 0.0
+    total_ratings: int = 0
+    rua: str
+    numero: str
+    bairro: str
+    cidade: str
+    uf: str
+    codigo_ibge: Optional[str] = None
+    distance_m: Optional[float] = None  # preenchido pelo $geoNear
+
+
+class CompanyMapPointProjection(BaseModel):
+    """Projeção mínima usada para desenhar pontos (tiles): só carrega estes campos"""
+    uuid: UUID
+    latitude: float
+    longitude: float
+    rating_average: float = 0.0
+    company_colector_tags: Optional[List[Companycolectortags]] = None
+
+
+MapItemT = TypeVar("MapItemT")
+
+
+class CompanyMapViewportOut(BaseModel, Generic[MapItemT]):
+    """Resposta do modo bbox: no máximo `limit` itens; `truncated` indica que havia mais"""
+    items: List[MapItemT]
+    truncated: bool
+    limit: int
+
+
+class CompanyMapClusterOut(BaseModel):
+    """Célula da grade de clusterização com o resumo das empresas dentro dela"""
+    latitude: float  # centróide
+    longitude: float
+    count: int
+    rating_average: float
+    tags: Dict[Companycolectortags, int]
+
+
+class CompanyMapClustersOut(BaseModel):
+    zoom: int
+    cell_size_deg: float
+    total: int
+    clusters: List[CompanyMapClusterOut]
+
+
+class DensityLayer(str, Enum):
+    COLETORAS = "coletoras"  # coletoras ativas com coordenadas
+    DESCARTES = "descartes"  # volume descartado (quantidade_total) na localização da descartante
+
+class CompanyDensityCellOut(BaseModel):
+    """Célula da grade: índices (x, y), centro da célula e totais"""
+    x: int
+    y: int
+    latitude: float
+    longitude: float
+    count: int
+    quantidade_total: int = 0
+
+class CompanyDensityOut(BaseModel):
+    layer: DensityLayer
+    zoom: int
+    cell_size_deg: float
+    total_count: int
+    total_quantidade: int
+    cells: List[CompanyDensityCellOut]
@@ -9,12 +9,20 @@ class CidadeSchema(BaseModel):
     nome: str
     codigo: str
 
+class CidadeAutocompleteSchema(BaseModel):
+    nome: str
+    codigo: str
+    uf: str
+
 class EnderecoCEPSchema(BaseModel):
     cep: str
     rua: str
     bairro: str
     cidade: str
     uf: str
+    codigo_ibge: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class LocalizacaoResponse(BaseModel):
     success: bool
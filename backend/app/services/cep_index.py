@@ -0,0 +1,210 @@
+import asyncio
+import bz2
+import csv
+import gzip
+import logging
+import lzma
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+from app.config.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Arquivo de origem: CSV separado por ';' (opcionalmente .gz/.xz/.bz2) com cabeçalho
+# cep_inicio;cep_fim;rua;bairro;cidade;uf;codigo_ibge;latitude;longitude
+# Cada linha cobre a faixa [cep_inicio, cep_fim]; CEPs únicos repetem o valor ou deixam cep_fim vazio.
+# Um .sqlite/.db já com a tabela `ceps` também é aceito e aberto direto.
+CEP_INDEX_COLUMNS = (
+    "cep_inicio", "cep_fim", "rua", "bairro", "cidade", "uf", "codigo_ibge", "latitude", "longitude",
+)
+SQLITE_SUFFIXES = (".sqlite", ".db")
+OPENERS = {".gz": gzip.open, ".xz": lzma.open, ".bz2": bz2.open}
+SQLITE_MMAP_BYTES = 256 * 1024 * 1024
+
+_NON_DIGITS = re.compile(r"\D")
+
+
+def _to_cep(value: str) -> int:
+    return int(_NON_DIGITS.sub("", value))
+
+
+def _to_float(value: Optional[str]) -> Optional[float]:
+    return float(value) if value not in (None, "") else None
+
+
+def _parse_rows(reader: csv.DictReader) -> Iterator[Tuple]:
+    for row in reader:
+        cep_inicio = _to_cep(row["cep_inicio"])
+        cep_fim = _to_cep(row["cep_fim"]) if row.get("cep_fim") else cep_inicio
+        yield (
+            cep_inicio,
+            cep_fim,
+            row.get("rua") or "",
+            row.get("bairro") or "",
+            row["cidade"],
+            row["uf"].strip().upper(),
+            row.get("codigo_ibge") or None,
+            _to_float(row.get("latitude")),
+            _to_float(row.get("longitude")),
+        )
+
+
+class CepIndex:
+    """
+    Índice local CEP → endereço, opcional (CEP_INDEX_PATH).
+
+    O arquivo comprimido é convertido uma vez para um SQLite temporário,
+    com cep_inicio como chave primária; a busca pega a faixa com o maior
+    cep_inicio <= CEP e confere cep_fim. As leituras usam mmap do SQLite.
+
+    Quando o arquivo de origem muda (checado a cada CEP_INDEX_CHECK_SECONDS),
+    ou via reload(), um novo SQLite é montado em uma thread e trocado
+    atomicamente; as consultas em andamento continuam no antigo.
+    """
+
+    def __init__(self):
+        self._connection: Optional[sqlite3.Connection] = None
+        self._db_path: Optional[Path] = None
+        self._source_mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self.rows = 0
+        self.loaded_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.CEP_INDEX_PATH)
+
+    @staticmethod
+    def _build(source: Path) -> Path:
+        """Monta o SQLite a partir do CSV (roda fora do event loop)"""
+        if source.suffix in SQLITE_SUFFIXES:
+            return source
+
+        fd, tmp = tempfile.mkstemp(prefix="cep_index_", suffix=".sqlite")
+        os.close(fd)
+        connection = sqlite3.connect(tmp)
+        try:
+            connection.execute("""
+                CREATE TABLE ceps (
+                    cep_inicio INTEGER PRIMARY KEY,
+                    cep_fim INTEGER NOT NULL,
+                    rua TEXT,
+                    bairro TEXT,
+                    cidade TEXT NOT NULL,
+                    uf TEXT NOT NULL,
+                    codigo_ibge TEXT,
+                    latitude REAL,
+                    longitude REAL
+                ) WITHOUT ROWID
+            """)
+            opener = OPENERS.get(source.suffix, open)
+            with opener(source, "rt", encoding="utf-8", newline="") as file:
+                reader = csv.DictReader(file, delimiter=";")
+                connection.executemany(
+                    f"INSERT OR REPLACE INTO ceps VALUES ({', '.join('?' * len(CEP_INDEX_COLUMNS))})",
+                    _parse_rows(reader),
+                )
+            connection.commit()
+        except Exception:
+            connection.close()
+            os.unlink(tmp)
+            raise
+        connection.close()
+        return Path(tmp)
+
+    @staticmethod
+    def _open(path: Path) -> sqlite3.Connection:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        connection.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    async def reload(self) -> int:
+        """Recarrega o índice a partir de CEP_INDEX_PATH e retorna o número de faixas"""
+        source = Path(settings.CEP_INDEX_PATH)
+        async with self._lock:
+            started = time.perf_counter()
+            mtime = source.stat().st_mtime
+            db_path = await asyncio.to_thread(self._build, source)
+            connection = self._open(db_path)
+            rows = connection.execute("SELECT COUNT(*) FROM ceps").fetchone()[0]
+
+            old_connection, old_db_path = self._connection, self._db_path
+            self._connection, self._db_path = connection, db_path
+            self._source_mtime, self.rows, self.loaded_at = mtime, rows, time.time()
+            self._checked_at = time.monotonic()
+
+            if old_connection is not None:
+                old_connection.close()
+            if old_db_path is not None and old_db_path != source and old_db_path != db_path:
+                old_db_path.unlink(missing_ok=True)
+
+        logger.info(
+            f"📮 Índice de CEP carregado: {rows} faixas de {source.name} "
+            f"({(time.perf_counter() - started) * 1000:.0f} ms)"
+        )
+        return rows
+
+    async def _reload_if_changed(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < settings.CEP_INDEX_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        try:
+            mtime = Path(settings.CEP_INDEX_PATH).stat().st_mtime
+            if mtime != self._source_mtime:
+                await self.reload()
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao recarregar índice de CEP: {str(e)}")
+
+    async def lookup(self, cep: str) -> Optional[dict]:
+        """Endereço do CEP (8 dígitos) ou None se o índice não tiver a faixa"""
+        if not self.enabled:
+            return None
+        await self._reload_if_changed()
+
+        connection = self._connection
+        if connection is None:
+            return None
+
+        value = _to_cep(cep)
+        row = connection.execute(
+            "SELECT * FROM ceps WHERE cep_inicio <= ? ORDER BY cep_inicio DESC LIMIT 1", (value,)
+        ).fetchone()
+        if row is None or row["cep_fim"] < value:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        digits = f"{value:08d}"
+        return {
+            "cep": f"{digits[:5]}-{digits[5:]}",
+            "rua": row["rua"],
+            "bairro": row["bairro"],
+            "cidade": row["cidade"],
+            "uf": row["uf"],
+            "codigo_ibge": row["codigo_ibge"],
+            "latitude": row["latitude"],
+            "longitude": row["longitude"],
+        }
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "loaded": self._connection is not None,
+            "rows": self.rows,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+cep_index = CepIndex()
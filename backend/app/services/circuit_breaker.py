@@ -0,0 +1,153 @@
+import logging
+import time
+from contextlib import contextmanager
+from enum import Enum
+from typing import Dict, Iterator, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"  # chamadas passam normalmente
+    OPEN = "open"  # serviço fora: falha na hora, sem chamar
+    HALF_OPEN = "half_open"  # uma chamada de teste decide se fecha ou reabre
+
+
+class CircuitOpenError(Exception):
+    """Chamada recusada sem tentar: o circuito do serviço está aberto"""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuito '{name}' aberto: serviço temporariamente indisponível")
+        self.name = name
+
+
+def raise_for_unavailable(response: httpx.Response) -> httpx.Response:
+    """
+    Levanta erro em 5xx/429 para contar como falha do serviço; 4xx como o
+    404 do CNPJ inexistente são respostas válidas e não abrem o circuito
+    """
+    if response.status_code >= 500 or response.status_code == 429:
+        response.raise_for_status()
+    return response
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por dependência externa.
+
+    Depois de `failure_threshold` falhas seguidas o circuito abre e as
+    chamadas falham na hora com CircuitOpenError (quem chama cai para o
+    cache ou para dados locais). Passados `reset_timeout` segundos, uma
+    única chamada de teste passa (meio aberto): sucesso fecha o circuito,
+    falha o abre de novo.
+
+    Uso: `with breaker.guard(): response = await client.get(...)`
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+        CIRCUIT_BREAKERS[name] = self
+
+    @property
+    def is_open(self) -> bool:
+        """Aberto e ainda sem direito a chamada de teste (não consome o teste)"""
+        if self.state == CircuitState.OPEN:
+            return time.monotonic() - self.opened_at < self.reset_timeout
+        return self.state == CircuitState.HALF_OPEN and self._probing
+
+    def allow(self) -> bool:
+        if self.state == CircuitState.CLOSED:
+            return True
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = CircuitState.HALF_OPEN
+            self._probing = False
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.successes += 1
+        self.consecutive_failures = 0
+        if self.state != CircuitState.CLOSED:
+            logger.info(f"✅ Circuito '{self.name}' fechado: serviço respondeu")
+        self.state = CircuitState.CLOSED
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == CircuitState.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != CircuitState.OPEN:
+                self.opened += 1
+                logger.warning(
+                    f"🔌 Circuito '{self.name}' aberto após {self.consecutive_failures} falhas "
+                    f"(nova tentativa em {self.reset_timeout:.0f}s)"
+                )
+            self.state = CircuitState.OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """Envolve a chamada: recusa com CircuitOpenError se aberto e registra o resultado"""
+        if not self.allow():
+            self.rejected += 1
+            raise CircuitOpenError(self.name)
+        try:
+            yield
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            # Cancelada (CancelledError) não diz nada do serviço: não conta como
+            # falha, mas libera a chamada de teste para a próxima requisição
+            self._probing = False
+            raise
+        self.record_success()
+
+    def reject_if_open(self) -> None:
+        """Falha na hora se o circuito está aberto, antes de enfileirar a chamada"""
+        if self.is_open:
+            self.rejected += 1
+            raise CircuitOpenError(self.name)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state.value,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "opened": self.opened,
+        }
+
+
+CIRCUIT_BREAKERS: Dict[str, CircuitBreaker] = {}
+
+
+def circuit_breaker_stats() -> dict:
+    return {name: breaker.stats() for name, breaker in CIRCUIT_BREAKERS.items()}
+
+
+# Um circuito por dependência externa
+nominatim_breaker = CircuitBreaker("nominatim", failure_threshold=5, reset_timeout=30.0)
+ibge_breaker = CircuitBreaker("ibge", failure_threshold=3, reset_timeout=60.0)
+brasilapi_breaker = CircuitBreaker("brasilapi", failure_threshold=3, reset_timeout=60.0)
+gemini_breaker = CircuitBreaker("gemini", failure_threshold=3, reset_timeout=30.0)
@@ -1,47 +1,151 @@
 import httpx
-from app.config.config import settings  
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.config.config import settings
+from app.models.cnpj_cache import CnpjCache
+from app.services.circuit_breaker import CircuitOpenError, brasilapi_breaker, raise_for_unavailable
+from app.services.http_client import BRASILAPI, http_clients
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+CNPJ_MEMORY_MAX_ITEMS = 1024
+CNPJ_WEIGHTS_1 = (5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+CNPJ_WEIGHTS_2 = (6,) + CNPJ_WEIGHTS_1
+
+
+def _check_digit(digits: str, weights: tuple) -> str:
+    remainder = sum(int(d) * w for d, w in zip(digits, weights)) % 11
+    return "0" if remainder < 2 else str(11 - remainder)
+
+
+def cnpj_check_digits_valid(cnpj_clean: str) -> bool:
+    """Dígitos verificadores (módulo 11) de um CNPJ com 14 dígitos"""
+    if len(cnpj_clean) != 14 or len(set(cnpj_clean)) == 1:
+        return False
+    first = _check_digit(cnpj_clean[:12], CNPJ_WEIGHTS_1)
+    second = _check_digit(cnpj_clean[:12] + first, CNPJ_WEIGHTS_2)
+    return cnpj_clean[12:] == first + second
+
 
 class CNPJValidator:
-    
+    """
+    Valida o CNPJ localmente (tamanho e dígitos verificadores) e só então
+    consulta a BrasilAPI. Respostas definitivas (encontrado / não encontrado)
+    ficam em cache: LRU em memória por worker na frente da coleção
+    cnpj_cache (TTL). Timeouts e erros da API não entram no cache.
+    """
+
+    def __init__(self):
+        self.memory = TTLCache(maxsize=CNPJ_MEMORY_MAX_ITEMS, ttl=settings.CNPJ_CACHE_TTL_SECONDS)
+        self.local_rejections = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.api_calls = 0
+
+    async def _cache_get(self, cnpj_clean: str) -> Optional[dict]:
+        result = self.memory.get(cnpj_clean)
+        if result is not None:
+            self.memory_hits += 1
+            return result
+
+        try:
+            document = await CnpjCache.find_one({
+                "cnpj": cnpj_clean,
+                "expires_at": {"$gt": datetime.utcnow()},
+            })
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao consultar cache de CNPJ: {str(e)}")
+            return None
+
+        if document is None:
+            return None
+
+        self.db_hits += 1
+        ttl = (document.expires_at - datetime.utcnow()).total_seconds()
+        self.memory.set(cnpj_clean, document.result, ttl=ttl)
+        return document.result
+
+    async def _cache_set(self, cnpj_clean: str, result: dict) -> None:
+        ttl = settings.CNPJ_CACHE_TTL_SECONDS if result["valid"] else settings.CNPJ_CACHE_NEGATIVE_TTL_SECONDS
+        self.memory.set(cnpj_clean, result, ttl=ttl)
+
+        now = datetime.utcnow()
+        try:
+            await CnpjCache.get_motor_collection().update_one(
+                {"cnpj": cnpj_clean},
+                {"$set": {"result": result, "created_at": now, "expires_at": now + timedelta(seconds=ttl)}},
+                upsert=True,
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao gravar cache de CNPJ: {str(e)}")
+
     async def validate(self, cnpj: str) -> dict:
         """Valida CNPJ usando Brasil API (gratuita)"""
         cnpj_clean = "".join(filter(str.isdigit, cnpj))
-        
+
 
         if len(cnpj_clean) != 14:
             return {"valid": False, "error": "CNPJ deve ter 14 dígitos"}
-        
+
+        if not cnpj_check_digits_valid(cnpj_clean):
+            self.local_rejections += 1
+            return {"valid": False, "error": "CNPJ inválido: dígitos verificadores não conferem"}
+
+        cached = await self._cache_get(cnpj_clean)
+        if cached is not None:
+            return cached
+
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"https://brasilapi.com.br/api/cnpj/v1/{cnpj_clean}",
-                    timeout=10.0
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    return {
-                        "valid": True,
-                        "company_name": data.get("razao_social"),
-                        "trade_name": data.get("nome_fantasia"),
-                        "opening_date": data.get("data_inicio_atividade"),
-                        "situation": data.get("descricao_situacao_cadastral"),
-                        "address": {
-                            "street": data.get("logradouro"),
-                            "number": data.get("numero"),
-                            "district": data.get("bairro"),
-                            "city": data.get("municipio"),
-                            "state": data.get("uf"),
-                            "cep": data.get("cep")
-                        }
+            client = http_clients.get(BRASILAPI)
+            with brasilapi_breaker.guard():
+                self.api_calls += 1
+                response = raise_for_unavailable(await client.get(
+                    f"https://brasilapi.com.br/api/cnpj/v1/{cnpj_clean}"
+                ))
+
+            if response.status_code == 200:
+                data = response.json()
+                result = {
+                    "valid": True,
+                    "company_name": data.get("razao_social"),
+                    "trade_name": data.get("nome_fantasia"),
+                    "opening_date": data.get("data_inicio_atividade"),
+                    "situation": data.get("descricao_situacao_cadastral"),
+                    "address": {
+                        "street": data.get("logradouro"),
+                        "number": data.get("numero"),
+                        "district": data.get("bairro"),
+                        "city": data.get("municipio"),
+                        "state": data.get("uf"),
+                        "cep": data.get("cep")
                     }
-                else:
-                    return {"valid": False, "error": "CNPJ não encontrado na Receita Federal"}
-                    
+                }
+                await self._cache_set(cnpj_clean, result)
+                return result
+            else:
+                result = {"valid": False, "error": "CNPJ não encontrado na Receita Federal"}
+                if response.status_code == 404:
+                    await self._cache_set(cnpj_clean, result)
+                return result
+
+        except CircuitOpenError:
+            return {"valid": False, "error": "Consulta de CNPJ temporariamente indisponível, tente novamente"}
         except httpx.TimeoutException:
             return {"valid": False, "error": "Timeout na consulta do CNPJ"}
         except Exception as e:
             return {"valid": False, "error": f"Erro na validação: {str(e)}"}
 
+    def stats(self) -> dict:
+        return {
+            "local_rejections": self.local_rejections,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "api_calls": self.api_calls,
+            "memory": {"size": len(self.memory)},
+        }
+
 # Instância global
-cnpj_validator = CNPJValidator()
\ No newline at end of file
+cnpj_validator = CNPJValidator()
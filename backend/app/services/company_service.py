@@ -1,26 +1,53 @@
-from typing import List, Optional
+import math
+from typing import List, Optional, Tuple
 from uuid import UUID
-from app.models.company import Company, CompanyType, Companycolectortags
-from app.schemas.company import CompanyMapFilter, CompanyMapOut, CompanyMapSimpleOut
+from app.models.company import Company, CompanyType, Companycolectortags, GeocodeStatus, TAG_BITS, tags_to_mask
+from app.schemas.company import (
+    CompanyMapFilter,
+    CompanyMapOut,
+    CompanyMapSimpleOut,
+    CompanyMapViewportOut,
+    CompanyMapClusterOut,
+    CompanyMapClustersOut,
+    CompanyMapProjection,
+    TagMatch,
+    DEFAULT_MAP_RADIUS_KM,
+)
+from pymongo import UpdateOne
 from app.core.exceptions import NotFoundException
+from app.utils.text import normalize_text
+from app.services.map_cache import map_cache
+from app.services.map_snapshot import map_snapshot_service
+from app.config.config import settings
+
+METERS_PER_KM = 1000
+EARTH_RADIUS_KM = 6378.1
+CLUSTER_CELLS_PER_TILE = 4
+# Bbox em polígonos GeoJSON (2dsphere): cada pedaço com menos de 180° de largura,
+# paralelos quebrados em trechos curtos e polos fora do anel
+BBOX_MAX_PIECE_DEG = 90.0
+BBOX_EDGE_STEP_DEG = 1.0
+BBOX_MAX_LAT = 89.9
 
 class CompanyService:
     
-    
     @staticmethod
-    async def get_companies_for_map(filter_data: CompanyMapFilter) -> List[CompanyMapOut]:
+    def _build_map_query(filter_data: CompanyMapFilter) -> dict:
         """
-        Busca empresas para exibição no mapa com filtros
+        Monta o filtro base das consultas do mapa (apenas coletoras ativas)
         """
         query = {"is_active": True, "company_type": CompanyType.EMPRESA_COLETORA}
         
-        # Filtro por tags
+        # Filtro por tags sobre a máscara de bits (qualquer uma ou todas)
         if filter_data.tags:
-            query["company_colector_tags"] = {"$in": filter_data.tags}
+            query["tags_mask"] = CompanyService._tags_mask_filter(filter_data.tags, filter_data.tag_match)
         
-        # Filtro por cidade
+        # Filtro por cidade (igualdade no campo normalizado, coberto por índice)
         if filter_data.city:
-            query["cidade"] = {"$regex": filter_data.city, "$options": "i"}
+            query["cidade_norm"] = normalize_text(filter_data.city)
+        
+        if filter_data.city_code:
+            query["codigo_ibge"] = filter_data.city_code
         
         # Filtro por UF
         if filter_data.uf:
@@ -30,9 +57,125 @@ class CompanyService:
         if filter_data.min_rating is not None:
             query["rating_average"] = {"$gte": filter_data.min_rating}
         
-        companies = await Company.find(query).to_list()
+        return query
+
+    @staticmethod
+    def _tags_mask_filter(tags: List[Companycolectortags], tag_match: TagMatch = TagMatch.ANY) -> dict:
+        """
+        $bitsAnySet / $bitsAllSet sobre tags_mask
+        """
+        operator = "$bitsAllSet" if tag_match == TagMatch.ALL else "$bitsAnySet"
+        return {operator: tags_to_mask(tags)}
+
+    @staticmethod
+    def _bbox_ring(min_lng: float, min_lat: float, max_lng: float, max_lat: float) -> List[List[float]]:
+        """
+        Anel fechado do retângulo. As arestas de um Polygon GeoJSON são
+        geodésicas: os paralelos ganham um vértice a cada BBOX_EDGE_STEP_DEG
+        para não curvarem em direção aos polos
+        """
+        steps = max(1, math.ceil((max_lng - min_lng) / BBOX_EDGE_STEP_DEG))
+        lngs = [min_lng + (max_lng - min_lng) * i / steps for i in range(steps + 1)]
+        south = [[lng, min_lat] for lng in lngs]
+        north = [[lng, max_lat] for lng in reversed(lngs)]
+        return south + north + [[min_lng, min_lat]]
+
+    @staticmethod
+    def _bbox_filter(bbox: Tuple[float, float, float, float]) -> dict:
+        """
+        Filtro $geoWithin para a bbox (minLng, minLat, maxLng, maxLat), servido
+        pelo índice location_2dsphere.
+
+        O MongoDB recusa polígonos com 180° ou mais de largura (mundo inteiro,
+        tiles de zoom baixo): a bbox é dividida em faixas de até
+        BBOX_MAX_PIECE_DEG num MultiPolygon
+        """
+        min_lng, min_lat, max_lng, max_lat = bbox
+        min_lat = max(min_lat, -BBOX_MAX_LAT)
+        max_lat = min(max_lat, BBOX_MAX_LAT)
+
+        pieces = max(1, math.ceil((max_lng - min_lng) / BBOX_MAX_PIECE_DEG))
+        width = (max_lng - min_lng) / pieces
+        rings = [
+            CompanyService._bbox_ring(min_lng + width * i, min_lat, min_lng + width * (i + 1), max_lat)
+            for i in range(pieces)
+        ]
+        if len(rings) == 1:
+            geometry = {"type": "Polygon", "coordinates": rings}
+        else:
+            geometry = {"type": "MultiPolygon", "coordinates": [[ring] for ring in rings]}
+        return {"$geoWithin": {"$geometry": geometry}}
+
+    @staticmethod
+    def _geo_near_pipeline(filter_data: CompanyMapFilter, query: dict) -> List[dict]:
+        """
+        Pipeline $geoNear (índice 2dsphere) para busca por raio a partir de lat/lng
+        """
+        radius_km = filter_data.radius_km or DEFAULT_MAP_RADIUS_KM
+        return [
+            {
+                "$geoNear": {
+                    "near": {"type": "Point", "coordinates": [filter_data.lng, filter_data.lat]},
+                    "key": "location",
+                    "distanceField": "distance_m",
+                    "maxDistance": radius_km * METERS_PER_KM,
+                    "spherical": True,
+                    "query": query,
+                }
+            }
+        ]
+
+    @staticmethod
+    async def _find_map_companies(filter_data: CompanyMapFilter) -> Tuple[List[Tuple[CompanyMapProjection, Optional[float]]], bool]:
+        """
+        Retorna pares (empresa, distância em km) e se o resultado foi truncado.
+        Usa o snapshot em memória quando habilitado; senão consulta o banco.
+        """
+        if settings.MAP_SNAPSHOT_ENABLED:
+            snapshot = await map_snapshot_service.get_snapshot()
+            return snapshot.query(filter_data)
+        return await CompanyService._query_map_companies(filter_data)
+
+    @staticmethod
+    async def _query_map_companies(filter_data: CompanyMapFilter) -> Tuple[List[Tuple[CompanyMapProjection, Optional[float]]], bool]:
+        """
+        Executa a consulta do mapa no MongoDB e retorna pares (empresa,
+        distância em km) e se o resultado foi truncado. Só os campos de
+        CompanyMapProjection são lidos do banco.
+
+        Com lat/lng usa $geoNear sobre o índice 2dsphere: só retorna empresas
+        dentro do raio, já ordenadas da mais próxima para a mais distante.
+        Com bbox usa $geoWithin no mesmo índice e corta em `limit` resultados,
+        priorizando as melhor avaliadas.
+        """
+        query = CompanyService._build_map_query(filter_data)
+        
+        if filter_data.bbox is not None:
+            query["location"] = CompanyService._bbox_filter(filter_data.bbox)
+            # Busca um a mais que o limite para saber se há resultados cortados
+            companies = await Company.find(query).sort(
+                [("rating_average", -1)]
+            ).limit(filter_data.limit + 1).project(CompanyMapProjection).to_list()
+            truncated = len(companies) > filter_data.limit
+            return [(company, None) for company in companies[:filter_data.limit]], truncated
+        
+        if not filter_data.has_geo_center():
+            # Sem centro, apenas empresas que já possuem coordenadas
+            query["location"] = {"$ne": None}
+            companies = await Company.find(query).project(CompanyMapProjection).to_list()
+            return [(company, None) for company in companies], False
         
-        return [CompanyMapOut(
+        pipeline = CompanyService._geo_near_pipeline(filter_data, query)
+        companies = await Company.aggregate(pipeline, projection_model=CompanyMapProjection).to_list()
+        
+        return [
+            (company, round(company.distance_m / METERS_PER_KM, 2))
+            for company in companies
+        ], False
+
+    @staticmethod
+    def _to_map_out(company: CompanyMapProjection, distance_km: Optional[float] = None) -> CompanyMapOut:
+        return CompanyMapOut(
             uuid=company.uuid,
             nome=company.nome,
             company_photo_url=company.company_photo_url,
@@ -48,31 +191,13 @@ class CompanyService:
             rua=company.rua,                              
             numero=company.numero,                        
             cidade=company.cidade,
-            uf=company.uf
-        ) for company in companies if company.latitude and company.longitude]
+            uf=company.uf,
+            distance_km=distance_km
+        )
 
     @staticmethod
-    async def get_companies_for_map_simple(filter_data: CompanyMapFilter) -> List[CompanyMapSimpleOut]:
-        """
-        Busca empresas para exibição no mapa com filtros (versão simplificada)
-        """
-        query = {"is_active": True, "company_type": CompanyType.EMPRESA_COLETORA}
-        
-        if filter_data.tags:
-            query["company_colector_tags"] = {"$in": filter_data.tags}
-        
-        if filter_data.city:
-            query["cidade"] = {"$regex": filter_data.city, "$options": "i"} 
-        
-        if filter_data.uf:
-            query["uf"] = filter_data.uf.upper()
-        
-        if filter_data.min_rating is not None:
-            query["rating_average"] = {"$gte": filter_data.min_rating}
-        
-        companies = await Company.find(query).to_list()
-        
-        return [CompanyMapSimpleOut(
+    def _to_map_simple_out(company: CompanyMapProjection, distance_km: Optional[float] = None) -> CompanyMapSimpleOut:
+        return CompanyMapSimpleOut(
             uuid=company.uuid,
             nome=company.nome,
             company_type=company.company_type,
@@ -88,8 +213,195 @@ class CompanyService:
             company_description=company.company_description or "Sem descrição",
             bairro=company.bairro,
             rua=company.rua,
-            numero=company.numero
-        ) for company in companies if company.latitude is not None and company.longitude is not None]
+            numero=company.numero,
+            distance_km=distance_km
+        )
+
+    @staticmethod
+    async def get_companies_for_map(filter_data: CompanyMapFilter) -> List[CompanyMapOut]:
+        """
+        Busca empresas para exibição no mapa com filtros
+        """
+        companies, _ = await CompanyService._find_map_companies(filter_data)
+        return [CompanyService._to_map_out(company, distance_km) for company, distance_km in companies]
+
+    @staticmethod
+    async def get_companies_for_map_simple(filter_data: CompanyMapFilter) -> List[CompanyMapSimpleOut]:
+        """
+        Busca empresas para exibição no mapa com filtros (versão simplificada)
+        """
+        companies, _ = await CompanyService._find_map_companies(filter_data)
+        return [CompanyService._to_map_simple_out(company, distance_km) for company, distance_km in companies]
+
+    @staticmethod
+    async def get_companies_for_map_viewport(filter_data: CompanyMapFilter) -> CompanyMapViewportOut[CompanyMapOut]:
+        """
+        Busca empresas dentro da bbox do mapa, limitado a `filter_data.limit` itens
+        """
+        companies, truncated = await CompanyService._find_map_companies(filter_data)
+        return CompanyMapViewportOut[CompanyMapOut](
+            items=[CompanyService._to_map_out(company, distance_km) for company, distance_km in companies],
+            truncated=truncated,
+            limit=filter_data.limit
+        )
+
+    @staticmethod
+    async def get_companies_for_map_simple_viewport(filter_data: CompanyMapFilter) -> CompanyMapViewportOut[CompanyMapSimpleOut]:
+        """
+        Busca empresas dentro da bbox do mapa, limitado a `filter_data.limit` itens (versão simplificada)
+        """
+        companies, truncated = await CompanyService._find_map_companies(filter_data)
+        return CompanyMapViewportOut[CompanyMapSimpleOut](
+            items=[CompanyService._to_map_simple_out(company, distance_km) for company, distance_km in companies],
+            truncated=truncated,
+            limit=filter_data.limit
+        )
+
+    @staticmethod
+    def cluster_cell_size(zoom: int) -> float:
+        """
+        Tamanho (em graus) da célula da grade para um nível de zoom.
+        Cada tile de 256px é dividido em CLUSTER_CELLS_PER_TILE células por eixo.
+        """
+        return 360.0 / (2 ** zoom) / CLUSTER_CELLS_PER_TILE
+
+    @staticmethod
+    def _grid_cell_stages(cell_size: float) -> List[dict]:
+        """
+        Estágios que agrupam documentos com latitude/longitude em células da grade
+        """
+        return [
+            {
+                "$group": {
+                    "_id": {
+                        "x": {"$floor": {"$divide": ["$longitude", cell_size]}},
+                        "y": {"$floor": {"$divide": ["$latitude", cell_size]}},
+                    },
+                    "count": {"$sum": 1},
+                    "latitude": {"$avg": "$latitude"},
+                    "longitude": {"$avg": "$longitude"},
+                    "rating_average": {"$avg": "$rating_average"},
+                    # Contagem por tag (são poucas, então um $sum condicional por tag)
+                    **{
+                        f"tag_{tag.value}": {
+                            "$sum": {
+                                "$cond": [
+                                    {"$in": [tag.value, {"$ifNull": ["$company_colector_tags", []]}]},
+                                    1,
+                                    0,
+                                ]
+                            }
+                        }
+                        for tag in Companycolectortags
+                    },
+                }
+            },
+            {"$sort": {"count": -1}},
+        ]
+
+    @staticmethod
+    def _cluster_match(filter_data: CompanyMapFilter) -> dict:
+        """
+        Filtro do $match dos clusters: bbox, círculo ($centerSphere) ou tudo com coordenadas
+        """
+        query = CompanyService._build_map_query(filter_data)
+        
+        if filter_data.bbox is not None:
+            query["location"] = CompanyService._bbox_filter(filter_data.bbox)
+        elif filter_data.has_geo_center():
+            radius_km = filter_data.radius_km or DEFAULT_MAP_RADIUS_KM
+            query["location"] = {
+                "$geoWithin": {
+                    "$centerSphere": [[filter_data.lng, filter_data.lat], radius_km / EARTH_RADIUS_KM]
+                }
+            }
+        else:
+            query["location"] = {"$ne": None}
+        return query
+
+    @staticmethod
+    async def get_map_clusters(filter_data: CompanyMapFilter) -> CompanyMapClustersOut:
+        """
+        Agrupa as coletoras em células de uma grade proporcional ao zoom,
+        com contagem, centróide, média de avaliação e contagem por tag
+        """
+        query = CompanyService._cluster_match(filter_data)
+        
+        cell_size = CompanyService.cluster_cell_size(filter_data.zoom)
+        pipeline = [
+            {"$match": query},
+            {"$project": {"latitude": 1, "longitude": 1, "rating_average": 1, "company_colector_tags": 1}},
+            *CompanyService._grid_cell_stages(cell_size),
+        ]
+        cells = await Company.get_motor_collection().aggregate(pipeline).to_list(length=None)
+        
+        clusters = [
+            CompanyMapClusterOut(
+                latitude=cell["latitude"],
+                longitude=cell["longitude"],
+                count=cell["count"],
+                rating_average=round(cell["rating_average"] or 0.0, 2),
+                tags={
+                    tag: cell[f"tag_{tag.value}"]
+                    for tag in Companycolectortags
+                    if cell[f"tag_{tag.value}"]
+                }
+            )
+            for cell in cells
+        ]
+        return CompanyMapClustersOut(
+            zoom=filter_data.zoom,
+            cell_size_deg=cell_size,
+            total=sum(cluster.count for cluster in clusters),
+            clusters=clusters
+        )
+
+    @staticmethod
+    async def sync_derived_fields() -> int:
+        """
+        Preenche campos derivados (ponto GeoJSON, máscara de tags, cidade_norm, UF) de empresas
+        gravadas antes deles existirem. Não recalcula o código IBGE, que
+        depende de consulta externa.
+        """
+        collection = Company.get_motor_collection()
+        result = await collection.update_many(
+            {"latitude": {"$ne": None}, "longitude": {"$ne": None}, "location": None},
+            [{"$set": {"location": {"type": "Point", "coordinates": ["$longitude", "$latitude"]}}}],
+        )
+        modified = result.modified_count
+        
+        result = await collection.update_many(
+            {"tags_mask": {"$exists": False}},
+            [{"$set": {"tags_mask": {"$add": [
+                {"$cond": [{"$in": [tag.value, {"$ifNull": ["$company_colector_tags", []]}]}, bit, 0]}
+                for tag, bit in TAG_BITS.items()
+            ]}}}],
+        )
+        modified += result.modified_count
+        
+        # Empresas geocodificadas antes da fila de jobs
+        await collection.update_many(
+            {"geocode_status": {"$exists": False}, "location": {"$ne": None}},
+            {"$set": {"geocode_status": GeocodeStatus.OK.value}},
+        )
+        
+        operations = [
+            UpdateOne(
+                {"_id": document["_id"]},
+                {"$set": {
+                    "cidade_norm": normalize_text(document.get("cidade")),
+                    "uf": (document.get("uf") or "").strip().upper(),
+                }},
+            )
+            async for document in collection.find({"cidade_norm": None}, {"cidade": 1, "uf": 1})
+        ]
+        if operations:
+            bulk = await collection.bulk_write(operations, ordered=False)
+            modified += bulk.modified_count
+        
+        if modified:
+            await map_cache.invalidate("sync_derived_fields")
+        return modified
 
 
     @staticmethod
@@ -99,16 +411,20 @@ class CompanyService:
         """
         return [tag.value for tag in Companycolectortags]
     
+    @staticmethod
+    def _tags_query(tags: List[Companycolectortags]) -> dict:
+        return {
+            "is_active": True,
+            "company_type": CompanyType.EMPRESA_COLETORA,
+            "tags_mask": CompanyService._tags_mask_filter(tags)
+        }
+
     @staticmethod
     async def get_companies_by_tags(tags: List[Companycolectortags]) -> List[Company]:
         """
         Busca empresas coletoras por tags específicas
         """
-        return await Company.find({
-            "is_active": True,
-            "company_type": CompanyType.EMPRESA_COLETORA,
-            "company_colector_tags": {"$in": tags}
-        }).to_list()
+        return await Company.find(CompanyService._tags_query(tags)).to_list()
     
     @staticmethod
     async def update_company_tags(company_uuid: UUID, tags: List[Companycolectortags]) -> Company:
@@ -1,10 +1,16 @@
 import google.generativeai as genai
 from dotenv import load_dotenv
 import os
+
+from app.services.circuit_breaker import CircuitOpenError, gemini_breaker
+
 load_dotenv()
 gemini_api_key = os.getenv("GEMINI_API_KEY")
 genai.configure(api_key=str(gemini_api_key))
 
+# Sem timeout a chamada pode ficar presa e o circuito nunca registra a falha
+GEMINI_TIMEOUT_SECONDS = 30
+
 LISTA_DE_ELETRONICOS = [
     "celular", "laptop", "tablet", "monitor", "teclado", "mouse", 
     "Fone de ouvido", "CPU", "Placa-mãe", "Controle remoto", "Televisão"
@@ -15,18 +21,22 @@ LISTA_DE_ELETRONICOS = [
 def predict_image(image_data: bytes):
 
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content([
-            "Analise esta imagem e identifique se existe os objetos eletrônicos presentes nessa lista:"
-            f"{', '.join(LISTA_DE_ELETRONICOS)}. "
-            "Se existir, apenas devolva quais e a quantidade desse objeto. "
-            "Siga esse padrão de resposta, porém com aspas duplas: {'celular': 1, 'laptop': 3, 'teclado': 1}."
-             "Se não existir, devolva 'Nenhum objeto eletronico identificado.'" ,
-            {'mime_type': 'image/jpeg', 'data': image_data}
-        ])
-        predicao = response.text
+        with gemini_breaker.guard():
+            model = genai.GenerativeModel('gemini-2.5-flash')
+            response = model.generate_content([
+                "Analise esta imagem e identifique se existe os objetos eletrônicos presentes nessa lista:"
+                f"{', '.join(LISTA_DE_ELETRONICOS)}. "
+                "Se existir, apenas devolva quais e a quantidade desse objeto. "
+                "Siga esse padrão de resposta, porém com aspas duplas: {'celular': 1, 'laptop': 3, 'teclado': 1}."
+                 "Se não existir, devolva 'Nenhum objeto eletronico identificado.'" ,
+                {'mime_type': 'image/jpeg', 'data': image_data}
+            ], request_options={"timeout": GEMINI_TIMEOUT_SECONDS})
+            predicao = response.text
         return predicao
 
+    except CircuitOpenError as e:
+        print(f"Análise de imagem indisponível: {e}")
+        return []
     except Exception as e:
         print(f"Erro ao analisar a imagem com a API do Gemini: {e}")
         return []
\ No newline at end of file
@@ -0,0 +1,120 @@
+import logging
+from typing import List, Union
+
+from app.models.company import Company, CompanyType
+from app.models.discard import Discard, DiscardStatus
+from app.schemas.company import CompanyDensityCellOut, CompanyDensityOut, DensityLayer
+from app.services.company_service import CompanyService
+from app.services.map_cache import map_cache
+
+logger = logging.getLogger(__name__)
+
+
+class DensityService:
+    """
+    Grade de densidade (contagem e volume por célula) calculada no MongoDB.
+    O tamanho da célula segue o zoom, como nos clusters do mapa.
+    """
+
+    @staticmethod
+    def _grid_stages(cell_size: float, weight: Union[str, int]) -> List[dict]:
+        """
+        Agrupa documentos com latitude/longitude em células e soma `weight`
+        """
+        return [
+            {
+                "$group": {
+                    "_id": {
+                        "x": {"$floor": {"$divide": ["$longitude", cell_size]}},
+                        "y": {"$floor": {"$divide": ["$latitude", cell_size]}},
+                    },
+                    "count": {"$sum": "$count"},
+                    "quantidade_total": {"$sum": weight},
+                }
+            },
+            {"$sort": {"count": -1}},
+        ]
+
+    @staticmethod
+    def _coletoras_pipeline(cell_size: float) -> List[dict]:
+        return [
+            {"$match": {
+                "is_active": True,
+                "company_type": CompanyType.EMPRESA_COLETORA,
+                "location": {"$ne": None},
+            }},
+            {"$project": {"latitude": 1, "longitude": 1, "count": {"$literal": 1}}},
+            *DensityService._grid_stages(cell_size, weight=0),
+        ]
+
+    @staticmethod
+    def _descartes_pipeline(cell_size: float) -> List[dict]:
+        # Soma por descartante antes do $lookup: uma busca por empresa, não por descarte
+        return [
+            {"$match": {"status": {"$ne": DiscardStatus.CANCELADO}}},
+            {"$group": {
+                "_id": "$empresa_solicitante_id",
+                "count": {"$sum": 1},
+                "quantidade_total": {"$sum": "$quantidade_total"},
+            }},
+            {"$lookup": {
+                "from": Company.get_collection_name(),
+                "localField": "_id",
+                "foreignField": "uuid",
+                "as": "empresa",
+            }},
+            {"$unwind": "$empresa"},
+            {"$match": {"empresa.latitude": {"$ne": None}, "empresa.longitude": {"$ne": None}}},
+            {"$project": {
+                "latitude": "$empresa.latitude",
+                "longitude": "$empresa.longitude",
+                "count": 1,
+                "quantidade_total": 1,
+            }},
+            *DensityService._grid_stages(cell_size, weight="$quantidade_total"),
+        ]
+
+    @staticmethod
+    async def get_density(layer: DensityLayer, zoom: int) -> CompanyDensityOut:
+        """
+        Grade de densidade de uma camada num nível de zoom, em cache por (camada, zoom)
+        """
+        cache_key = (layer, zoom)
+        cached = map_cache.density.get(cache_key)
+        if cached is not None:
+            return cached
+
+        cell_size = CompanyService.cluster_cell_size(zoom)
+        if layer == DensityLayer.DESCARTES:
+            collection = Discard.get_motor_collection()
+            pipeline = DensityService._descartes_pipeline(cell_size)
+        else:
+            collection = Company.get_motor_collection()
+            pipeline = DensityService._coletoras_pipeline(cell_size)
+
+        rows = await collection.aggregate(pipeline).to_list(length=None)
+        cells = [
+            CompanyDensityCellOut(
+                x=int(row["_id"]["x"]),
+                y=int(row["_id"]["y"]),
+                latitude=(row["_id"]["y"] + 0.5) * cell_size,
+                longitude=(row["_id"]["x"] + 0.5) * cell_size,
+                count=row["count"],
+                quantidade_total=row["quantidade_total"] or 0,
+            )
+            for row in rows
+        ]
+        density = CompanyDensityOut(
+            layer=layer,
+            zoom=zoom,
+            cell_size_deg=cell_size,
+            total_count=sum(cell.count for cell in cells),
+            total_quantidade=sum(cell.quantidade_total for cell in cells),
+            cells=cells,
+        )
+        map_cache.density.set(cache_key, density)
+        logger.info(f"🔥 Densidade '{layer.value}' calculada (zoom {zoom}): {len(cells)} células")
+        return density
+
+
+density_service = DensityService()
@@ -0,0 +1,120 @@
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from app.config.config import settings
+from app.models.geocode_cache import GeocodeCache
+from app.utils.cache import TTLCache
+from app.utils.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_MEMORY_MAX_ITEMS = 4096
+
+Coordinates = Tuple[float, float]
+
+_PUNCTUATION = re.compile(r"[^\w\s,]")
+_SEPARATORS = re.compile(r"\s*,\s*")
+
+
+def geocode_cache_key(query: str) -> str:
+    """
+    Chave do cache para a string de consulta do Nominatim: sem acento, caixa
+    e pontuação, para que 'R. São João, 10' e 'r sao joao , 10' coincidam
+    """
+    key = normalize_text(_PUNCTUATION.sub(" ", query))
+    return _SEPARATORS.sub(", ", key)
+
+
+class GeocodeCacheService:
+    """
+    Cache em duas camadas para o geocoding: LRU em memória por worker na
+    frente da coleção geocode_cache (compartilhada, expirada por índice TTL).
+
+    `get` retorna (encontrado, coordenadas): encontrado=True com coordenadas
+    None é um resultado negativo em cache, que não deve ir ao Nominatim.
+    """
+
+    def __init__(self):
+        self.memory = TTLCache(
+            maxsize=GEOCODE_MEMORY_MAX_ITEMS, ttl=settings.GEOCODE_CACHE_TTL_SECONDS
+        )
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    async def get(self, query: str) -> Tuple[bool, Optional[Coordinates]]:
+        key = geocode_cache_key(query)
+        found, coordinates = self.memory.get(key, (False, None))
+        if found:
+            self.memory_hits += 1
+            return True, coordinates
+
+        try:
+            document = await GeocodeCache.find_one({
+                "key": key,
+                "expires_at": {"$gt": datetime.utcnow()},
+            })
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao consultar cache de geocoding: {str(e)}")
+            document = None
+
+        if document is None:
+            self.misses += 1
+            return False, None
+
+        self.db_hits += 1
+        coordinates = (
+            (document.latitude, document.longitude)
+            if document.latitude is not None and document.longitude is not None
+            else None
+        )
+        ttl = (document.expires_at - datetime.utcnow()).total_seconds()
+        self.memory.set(key, (True, coordinates), ttl=ttl)
+        return True, coordinates
+
+    async def set(self, query: str, coordinates: Optional[Coordinates]) -> None:
+        """
+        Guarda o resultado do Nominatim; sem coordenadas usa o TTL negativo
+        """
+        key = geocode_cache_key(query)
+        ttl = (
+            settings.GEOCODE_CACHE_TTL_SECONDS
+            if coordinates is not None
+            else settings.GEOCODE_CACHE_NEGATIVE_TTL_SECONDS
+        )
+        self.memory.set(key, (True, coordinates), ttl=ttl)
+
+        latitude, longitude = coordinates if coordinates is not None else (None, None)
+        now = datetime.utcnow()
+        try:
+            await GeocodeCache.get_motor_collection().find_one_and_update(
+                {"key": key},
+                {"$set": {
+                    "query": query,
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "created_at": now,
+                    "expires_at": now + timedelta(seconds=ttl),
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao gravar cache de geocoding: {str(e)}")
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.memory_hits + self.db_hits) / lookups, 4) if lookups else 0.0,
+            "memory": {"size": len(self.memory)},
+        }
+
+
+geocode_cache = GeocodeCacheService()
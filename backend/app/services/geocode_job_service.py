@@ -0,0 +1,238 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from uuid import UUID
+
+from bson import Binary
+from pymongo import ReturnDocument
+
+from app.config.config import settings
+from app.models.company import Company, GeocodeStatus
+from app.models.geocode_job import GeocodeJob, GeocodeJobStatus
+from app.services.geocoding_dispatcher import Lane
+from app.services.geocoding_service import geocoding_service
+from app.services.locationIBGE_service import ibge_service
+from app.services.map_cache import map_cache
+
+logger = logging.getLogger(__name__)
+
+
+class GeocodeJobService:
+    """
+    Fila durável (coleção geocode_jobs) que preenche as coordenadas das
+    empresas fora da requisição de cadastro/atualização.
+
+    - enqueue() é idempotente por empresa: um único job, reaproveitado.
+    - O worker (iniciado no lifespan) reserva um job por vez com
+      find_one_and_update e um lease; se o processo morrer, o job volta
+      para a fila quando o lease vence.
+    - Falhas transitórias do Nominatim são tentadas de novo com backoff
+      exponencial até GEOCODE_JOB_MAX_ATTEMPTS.
+    """
+
+    def __init__(self):
+        self._worker: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.processed = 0
+        self.succeeded = 0
+        self.not_found = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def enqueue(self, company_uuid: UUID) -> None:
+        """Agenda (ou reagenda) o geocoding da empresa para já"""
+        now = datetime.utcnow()
+        await GeocodeJob.get_motor_collection().update_one(
+            {"company_uuid": Binary.from_uuid(company_uuid)},
+            {
+                "$set": {
+                    "status": GeocodeJobStatus.QUEUED.value,
+                    "attempts": 0,
+                    "next_run_at": now,
+                    "locked_until": None,
+                    "last_error": None,
+                    "finished_at": None,
+                    "updated_at": now,
+                },
+                "$inc": {"revision": 1},
+                "$setOnInsert": {"created_at": now},
+            },
+            upsert=True,
+        )
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def claim(self) -> Optional[dict]:
+        """Reserva o próximo job vencido (ou com lease expirado)"""
+        now = datetime.utcnow()
+        return await GeocodeJob.get_motor_collection().find_one_and_update(
+            {"$or": [
+                {"status": GeocodeJobStatus.QUEUED.value, "next_run_at": {"$lte": now}},
+                {"status": GeocodeJobStatus.RUNNING.value, "locked_until": {"$lt": now}},
+            ]},
+            {
+                "$set": {
+                    "status": GeocodeJobStatus.RUNNING.value,
+                    "locked_until": now + timedelta(seconds=settings.GEOCODE_JOB_LEASE_SECONDS),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("next_run_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    @staticmethod
+    def _job_filter(job: dict) -> dict:
+        # Só mexe no job se ninguém o reenfileirou enquanto ele rodava
+        return {"_id": job["_id"], "revision": job["revision"]}
+
+    async def _finish(self, job: dict, status: GeocodeJobStatus, error: Optional[str] = None) -> bool:
+        now = datetime.utcnow()
+        result = await GeocodeJob.get_motor_collection().update_one(
+            self._job_filter(job),
+            {"$set": {
+                "status": status.value,
+                "locked_until": None,
+                "last_error": error,
+                "finished_at": now,
+                "updated_at": now,
+            }},
+        )
+        return result.modified_count == 1
+
+    async def _retry_later(self, job: dict, error: str) -> bool:
+        now = datetime.utcnow()
+        delay = settings.GEOCODE_JOB_BACKOFF_SECONDS * 2 ** (job["attempts"] - 1)
+        result = await GeocodeJob.get_motor_collection().update_one(
+            self._job_filter(job),
+            {"$set": {
+                "status": GeocodeJobStatus.QUEUED.value,
+                "next_run_at": now + timedelta(seconds=delay),
+                "locked_until": None,
+                "last_error": error,
+                "updated_at": now,
+            }},
+        )
+        return result.modified_count == 1
+
+    @staticmethod
+    async def _apply(
+        company: Company, coordinates: Optional[Tuple[float, float]], status: GeocodeStatus
+    ) -> None:
+        """
+        Grava só os campos de geolocalização ($set), sem sobrescrever
+        alterações feitas na empresa enquanto o job rodava. O código IBGE que
+        a requisição não achou no snapshot é resolvido aqui, podendo chamar o IBGE
+        """
+        update = {"geocode_status": status, "geocoded_at": datetime.utcnow()}
+        if company.codigo_ibge is None:
+            codigo_ibge = await ibge_service.get_codigo_municipio(company.uf, company.cidade)
+            if codigo_ibge:
+                update["codigo_ibge"] = codigo_ibge
+        if status != GeocodeStatus.FALHOU:
+            # Endereço novo sem resultado: as coordenadas antigas não valem mais
+            latitude, longitude = coordinates if coordinates else (None, None)
+            update.update({
+                "latitude": latitude,
+                "longitude": longitude,
+                "location": (
+                    {"type": "Point", "coordinates": [longitude, latitude]} if coordinates else None
+                ),
+            })
+        await Company.find_one({"uuid": company.uuid}).update({"$set": update})
+
+        if company.is_coletora():
+            await map_cache.invalidate(f"geocoding {company.uuid}")
+
+    async def process(self, job: dict) -> None:
+        company_uuid = Binary(job["company_uuid"], 4).as_uuid()
+        company = await Company.find_one({"uuid": company_uuid})
+        if company is None:
+            await GeocodeJob.get_motor_collection().delete_one(self._job_filter(job))
+            return
+
+        address_data = {
+            'rua': company.rua,
+            'numero': company.numero,
+            'bairro': company.bairro,
+            'cidade': company.cidade,
+            'uf': company.uf
+        }
+        self.processed += 1
+
+        try:
+            coordinates = await geocoding_service.lookup_coordinates(address_data, Lane.BATCH)
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+            if job["attempts"] < settings.GEOCODE_JOB_MAX_ATTEMPTS:
+                if await self._retry_later(job, error):
+                    self.retried += 1
+                    logger.warning(f"🔁 Geocoding de {company_uuid} falhou, nova tentativa agendada: {error}")
+                return
+            if await self._finish(job, GeocodeJobStatus.FAILED, error):
+                self.failed += 1
+                logger.error(f"❌ Geocoding de {company_uuid} falhou {job['attempts']} vezes: {error}")
+                await self._apply(company, None, GeocodeStatus.FALHOU)
+            return
+
+        if not await self._finish(job, GeocodeJobStatus.DONE):
+            # Endereço mudou durante a consulta: o job já voltou para a fila
+            return
+
+        if coordinates:
+            self.succeeded += 1
+            await self._apply(company, coordinates, GeocodeStatus.OK)
+        else:
+            self.not_found += 1
+            await self._apply(company, None, GeocodeStatus.NAO_ENCONTRADO)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                job = await self.claim()
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao buscar job de geocoding: {str(e)}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.GEOCODE_JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self.process(job)
+            except Exception as e:
+                logger.error(f"❌ Erro inesperado no job de geocoding: {str(e)}")
+
+    def start_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop_worker(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            self._wakeup = None
+
+    def stats(self) -> dict:
+        return {
+            "running": self._worker is not None and not self._worker.done(),
+            "processed": self.processed,
+            "succeeded": self.succeeded,
+            "not_found": self.not_found,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+geocode_job_service = GeocodeJobService()
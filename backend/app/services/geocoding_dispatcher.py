@@ -0,0 +1,153 @@
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config.config import settings
+from app.services.token_bucket import MongoTokenBucket
+
+logger = logging.getLogger(__name__)
+
+NOMINATIM_BUCKET_KEY = "nominatim"
+
+
+class Lane(IntEnum):
+    """Filas de prioridade: menor valor sai primeiro"""
+    INTERACTIVE = 0  # usuário esperando (busca por CEP, cadastro)
+    BATCH = 1  # re-geocoding em lote, jobs em segundo plano
+
+
+@dataclass
+class _PendingCall:
+    """Chamada enfileirada para uma chave; pode estar na fila em mais de uma lane"""
+    future: asyncio.Future
+    lane: Lane
+    started: bool = False
+
+
+class GeocodingDispatcher:
+    """
+    Fila única para as chamadas ao Nominatim.
+
+    - Cada envio consome um token do bucket compartilhado entre os workers
+      (política do Nominatim: no máximo 1 requisição por segundo).
+    - Chamadas concorrentes com a mesma chave (consulta normalizada) viram
+      uma só; os demais chamadores aguardam o mesmo resultado.
+    - Quando um token fica livre, sai a chamada da fila de maior prioridade.
+    """
+
+    def __init__(self, bucket: MongoTokenBucket):
+        self.bucket = bucket
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._inflight: Dict[str, _PendingCall] = {}
+        self._sequence = itertools.count()
+        self._worker: Optional[asyncio.Task] = None
+        self._running: set = set()
+        self.submitted = 0
+        self.coalesced = 0
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def submit(
+        self, key: str, call: Callable[[], Awaitable[Any]], lane: Lane = Lane.INTERACTIVE
+    ) -> Any:
+        """
+        Enfileira `call` e aguarda o resultado (ou a exceção) da chamada
+        """
+        self._ensure_worker()
+        self.submitted += 1
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            if lane < pending.lane and not pending.started:
+                # Mesma chave com mais urgência: entra de novo na fila mais prioritária;
+                # a entrada antiga é descartada quando sair da fila
+                pending.lane = lane
+                self._queue.put_nowait((lane, next(self._sequence), key, call, pending))
+            return await asyncio.shield(pending.future)
+
+        pending = _PendingCall(asyncio.get_running_loop().create_future(), lane)
+        self._inflight[key] = pending
+        self._queue.put_nowait((lane, next(self._sequence), key, call, pending))
+        return await asyncio.shield(pending.future)
+
+    @staticmethod
+    def _is_stale(item: tuple) -> bool:
+        """Já executada (outra cópia da mesma chave saiu antes) ou já resolvida"""
+        pending = item[4]
+        return pending.started or pending.future.done()
+
+    async def _run(self) -> None:
+        while True:
+            item = await self._queue.get()
+            if self._is_stale(item):
+                continue
+
+            await self.bucket.acquire()
+
+            # Enquanto esperava o token pode ter chegado algo mais prioritário
+            self._queue.put_nowait(item)
+            item = self._queue.get_nowait()
+            while self._is_stale(item) and not self._queue.empty():
+                item = self._queue.get_nowait()
+            if self._is_stale(item):
+                continue
+
+            # A chamada roda à parte: a latência do HTTP não atrasa o próximo token
+            item[4].started = True
+            task = asyncio.create_task(self._execute(*item[2:]))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, key: str, call: Callable[[], Awaitable[Any]], pending: _PendingCall) -> None:
+        future = pending.future
+        try:
+            result = await call()
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            if self._inflight.get(key) is pending:
+                del self._inflight[key]
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        for pending in self._inflight.values():
+            if not pending.future.done():
+                pending.future.set_exception(RuntimeError("Fila de geocoding encerrada"))
+        self._inflight.clear()
+        self._queue = asyncio.PriorityQueue()
+
+    def stats(self) -> dict:
+        pending = {lane.name.lower(): 0 for lane in Lane}
+        for call in self._inflight.values():
+            pending[call.lane.name.lower()] += 1
+        return {
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "pending": pending,
+            "rate_limit": self.bucket.stats(),
+        }
+
+
+geocoding_dispatcher = GeocodingDispatcher(
+    MongoTokenBucket(
+        NOMINATIM_BUCKET_KEY,
+        rate_per_second=settings.GEOCODING_RATE_PER_SECOND,
+        capacity=settings.GEOCODING_BURST,
+    )
+)
@@ -2,6 +2,13 @@ import httpx
 import logging
 import re
 
+from app.services.cep_index import cep_index
+from app.services.circuit_breaker import CircuitOpenError, nominatim_breaker, raise_for_unavailable
+from app.services.geocode_cache import geocode_cache, geocode_cache_key
+from app.services.geocoding_dispatcher import Lane, geocoding_dispatcher
+from app.services.http_client import NOMINATIM, http_clients
+from app.utils.text import normalize_text
+
 logger = logging.getLogger(__name__)
 
 class GeocodingService:
@@ -37,72 +44,109 @@ class GeocodingService:
         'tocantins': 'TO'
     }
     
-    async def get_coordinates_from_address(self, address_data: dict) -> tuple[float, float] | None:
+    async def get_coordinates_from_address(
+        self, address_data: dict, lane: Lane = Lane.INTERACTIVE
+    ) -> tuple[float, float] | None:
         """
-        Obtém latitude e longitude a partir dos dados de endereço usando Nominatim (OpenStreetMap)
+        Obtém latitude e longitude a partir dos dados de endereço usando Nominatim (OpenStreetMap).
+        Retorna None tanto se o endereço não for encontrado quanto em falha do serviço.
         """
-        query = self._build_query_string(address_data)
-        logger.info(f"🔍 Buscando coordenadas para: {query}")
-        
         try:
-            async with httpx.AsyncClient() as client:
-                params = {
-                    'q': query,
-                    'format': 'json',
-                    'limit': 1,
-                    'countrycodes': 'br',
-                    'addressdetails': 1
-                }
-                
-                headers = {
-                    'User-Agent': 'EcocycloApp/1.0 (filipebsg2@gmail.com)'
-                }
-                
-                logger.info(f"🌐 Fazendo requisição para Nominatim...")
-                response = await client.get(
-                    "https://nominatim.openstreetmap.org/search", 
-                    params=params,
-                    headers=headers,
-                    timeout=10.0
-                )
-                
-                logger.info(f"📥 Resposta recebida: Status {response.status_code}")
-                
-                if response.status_code != 200:
-                    logger.warning(f"⚠️ Nominatim retornou status {response.status_code}")
-                    return None
-                
-                data = response.json()
-                logger.info(f"📊 Dados recebidos: {len(data) if data else 0} resultados")
-                
-                if data and len(data) > 0:
-                    location = data[0]
-                    latitude = location.get('lat')
-                    longitude = location.get('lon')
-                    
-                    if latitude and longitude:
-                        logger.info(f"✅ Coordenadas obtidas: {latitude}, {longitude}")
-                        return float(latitude), float(longitude)
-                    else:
-                        logger.warning(f"Coordenadas não encontradas no response: {location}")
-                else:
-                    logger.warning(f"⚠️ Nenhum resultado encontrado para: {query}")
-                
-                return None
-                
+            return await self.lookup_coordinates(address_data, lane)
+        except CircuitOpenError as e:
+            logger.warning(f"🔌 {str(e)}")
+            return None
         except httpx.TimeoutException:
             logger.error("⏰ Timeout na requisição para Nominatim")
             return None
         except httpx.RequestError as e:
             logger.error(f"🔌 Erro de conexão com Nominatim: {str(e)}")
             return None
+        except httpx.HTTPStatusError as e:
+            logger.warning(f"⚠️ Nominatim retornou status {e.response.status_code}")
+            return None
         except Exception as e:
             logger.error(f"❌ Erro inesperado no geocoding: {str(e)}")
             return None
 
+    async def lookup_coordinates(
+        self, address_data: dict, lane: Lane = Lane.INTERACTIVE
+    ) -> tuple[float, float] | None:
+        """
+        Como get_coordinates_from_address, mas levanta a exceção em falhas
+        transitórias (rede, timeout, status HTTP) para quem quiser tentar de novo.
+        None significa que o Nominatim respondeu sem resultado.
+
+        Consulta antes o cache de geocoding; endereços sem resultado também ficam em cache.
+        A chamada passa pela fila do Nominatim (`lane` define a prioridade).
+        """
+        query = self._build_query_string(address_data)
+        
+        found, coordinates = await geocode_cache.get(query)
+        if found:
+            logger.info(f"📦 Coordenadas em cache para: {query}")
+            return coordinates
+        
+        # Nominatim fora do ar: falha na hora em vez de esperar na fila e no timeout
+        nominatim_breaker.reject_if_open()
+
+        logger.info(f"🔍 Buscando coordenadas para: {query}")
+        coordinates = await geocoding_dispatcher.submit(
+            geocode_cache_key(query), lambda: self._fetch_coordinates(query), lane
+        )
+        
+        # Só respostas válidas do Nominatim entram no cache (falhas de rede não)
+        await geocode_cache.set(query, coordinates)
+        return coordinates
+
+    async def _fetch_coordinates(self, query: str) -> tuple[float, float] | None:
+        """
+        Consulta o Nominatim. Retorna None quando não há resultado e levanta
+        exceção em erro de rede ou status diferente de 200.
+        """
+        client = http_clients.get(NOMINATIM)
+        params = {
+            'q': query,
+            'format': 'json',
+            'limit': 1,
+            'countrycodes': 'br',
+            'addressdetails': 1
+        }
+        
+        logger.info(f"🌐 Fazendo requisição para Nominatim...")
+        with nominatim_breaker.guard():
+            response = raise_for_unavailable(await client.get(
+                "https://nominatim.openstreetmap.org/search", 
+                params=params
+            ))
+        
+        logger.info(f"📥 Resposta recebida: Status {response.status_code}")
+        
+        if response.status_code != 200:
+            response.raise_for_status()
+        
+        data = response.json()
+        logger.info(f"📊 Dados recebidos: {len(data) if data else 0} resultados")
+        
+        if data and len(data) > 0:
+            location = data[0]
+            latitude = location.get('lat')
+            longitude = location.get('lon')
+            
+            if latitude and longitude:
+                logger.info(f"✅ Coordenadas obtidas: {latitude}, {longitude}")
+                return float(latitude), float(longitude)
+            else:
+                logger.warning(f"Coordenadas não encontradas no response: {location}")
+        else:
+            logger.warning(f"⚠️ Nenhum resultado encontrado para: {query}")
+        
+        return None
+
     async def get_address_from_cep(self, cep: str) -> dict | None:
         """
-        Busca endereço completo a partir do CEP usando Nominatim
+        Busca endereço completo a partir do CEP: primeiro no índice local
+        (CEP_INDEX_PATH), depois no Nominatim
         Retorna: {
             "cep": "01310-100",
             "bairro": "Bela Vista", 
@@ -118,56 +162,66 @@ class GeocodingService:
             return None
             
         cep_formatado = f"{cep_limpo[:5]}-{cep_limpo[5:]}"
+
+        try:
+            endereco = await cep_index.lookup(cep_limpo)
+        except Exception as e:
+            logger.warning(f"⚠️ Falha no índice local de CEP: {str(e)}")
+            endereco = None
+        if endereco:
+            logger.info(f"📮 CEP {cep_formatado} resolvido pelo índice local")
+            return endereco
+
         logger.info(f"🔍 Buscando endereço para CEP: {cep_formatado}")
         
         try:
-            async with httpx.AsyncClient() as client:
-                params = {
-                    'q': f"{cep_formatado}, Brasil",
-                    'format': 'json',
-                    'limit': 1,
-                    'countrycodes': 'br',
-                    'addressdetails': 1
-                }
-                
-                headers = {
-                    'User-Agent': 'EcocycloApp/1.0 (filipebsg2@gmail.com)'
-                }
-                
-                response = await client.get(
-                    "https://nominatim.openstreetmap.org/search", 
-                    params=params,
-                    headers=headers,
-                    timeout=10.0
-                )
+            client = http_clients.get(NOMINATIM)
+            params = {
+                'q': f"{cep_formatado}, Brasil",
+                'format': 'json',
+                'limit': 1,
+                'countrycodes': 'br',
+                'addressdetails': 1
+            }
+            
+            async def fetch():
+                with nominatim_breaker.guard():
+                    return raise_for_unavailable(
+                        await client.get("https://nominatim.openstreetmap.org/search", params=params)
+                    )
+
+            nominatim_breaker.reject_if_open()
+            response = await geocoding_dispatcher.submit(f"cep:{cep_limpo}", fetch, Lane.INTERACTIVE)
+            
+            if response.status_code == 200:
+                data = response.json()
                 
-                if response.status_code == 200:
-                    data = response.json()
+                if data and len(data) > 0:
+                    location = data[0]
+                    address = location.get('address', {})
                     
-                    if data and len(data) > 0:
-                        location = data[0]
-                        address = location.get('address', {})
-                        
-                        # Extrair UF do nome do estado
-                        estado_nome = address.get('state', '').lower()
-                        uf = self._converter_estado_para_sigla(estado_nome)
-                        
-                        # Mapear campos do Nominatim para nosso formato
-                        endereco = {
-                            "cep": cep_formatado,
-                            "rua": self._extract_street(address),
-                            "bairro": address.get('suburb') or address.get('neighbourhood') or address.get('quarter') or '',
-                            "cidade": address.get('city') or address.get('town') or address.get('village') or address.get('municipality') or '',
-                            "uf": uf,
-                        }
-                        
-                        logger.info(f"✅ Endereço encontrado: {endereco['rua']}, {endereco['cidade']}-{endereco['uf']}")
-                        return endereco
-                    else:
-                        logger.warning(f"⚠️ Nenhum endereço encontrado para CEP: {cep_formatado}")
-                else:
-                    logger.error(f"❌ Erro na requisição: {response.status_code}")
+                    # Extrair UF do nome do estado
+                    estado_nome = address.get('state', '').lower()
+                    uf = self._converter_estado_para_sigla(estado_nome)
                     
+                    # Mapear campos do Nominatim para nosso formato
+                    endereco = {
+                        "cep": cep_formatado,
+                        "rua": self._extract_street(address),
+                        "bairro": address.get('suburb') or address.get('neighbourhood') or address.get('quarter') or '',
+                        "cidade": address.get('city') or address.get('town') or address.get('village') or address.get('municipality') or '',
+                        "uf": uf,
+                    }
+                    
+                    logger.info(f"✅ Endereço encontrado: {endereco['rua']}, {endereco['cidade']}-{endereco['uf']}")
+                    return endereco
+                else:
+                    logger.warning(f"⚠️ Nenhum endereço encontrado para CEP: {cep_formatado}")
+            else:
+                logger.error(f"❌ Erro na requisição: {response.status_code}")
+                
+        except CircuitOpenError as e:
+            logger.warning(f"🔌 {str(e)}")
         except httpx.TimeoutException:
             logger.error("⏰ Timeout na busca por CEP")
         except Exception as e:
@@ -178,27 +232,9 @@ class GeocodingService:
     def _converter_estado_para_sigla(self, estado_nome: str) -> str:
         """
         Converte o nome do estado para sigla
-        Exemplo: 'pernambuco' → 'PE'
+        Exemplo: 'pernambuco' → 'PE', 'São Paulo' → 'SP'
         """
-        estado_limpo = estado_nome.lower().strip()
-        
-        # Remover acentos e caracteres especiais
-        estado_limpo = (
-            estado_limpo
-            .replace('á', 'a')
-            .replace('â', 'a')
-            .replace('ã', 'a')
-            .replace('é', 'e')
-            .replace('ê', 'e')
-            .replace('í', 'i')
-            .replace('ó', 'o')
-            .replace('ô', 'o')
-            .replace('õ', 'o')
-            .replace('ú', 'u')
-            .replace('ç', 'c')
-        )
-        
-        return self.ESTADO_PARA_SIGLA.get(estado_limpo, '')
+        return SIGLA_POR_ESTADO_NORMALIZADO.get(normalize_text(estado_nome), '')
 
     def _extract_street(self, address: dict) -> str:
         """Extrai o nome da rua do response do Nominatim"""
@@ -223,4 +259,9 @@ class GeocodingService:
         ]
         return ', '.join(filter(None, address_parts))
 
+# Chaves sem acento para casar com normalize_text
+SIGLA_POR_ESTADO_NORMALIZADO = {
+    normalize_text(nome): sigla for nome, sigla in GeocodingService.ESTADO_PARA_SIGLA.items()
+}
+
 geocoding_service = GeocodingService()
\ No newline at end of file
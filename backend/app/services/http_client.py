@@ -0,0 +1,70 @@
+import importlib.util
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+from app.config.config import settings
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 só quando o extra httpx[http2] (pacote h2) estiver instalado
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+NOMINATIM = "nominatim"
+IBGE = "ibge"
+BRASILAPI = "brasilapi"
+
+# Cabeçalhos fixos por integração (o Nominatim exige User-Agent identificável)
+DEFAULT_HEADERS: Dict[str, Dict[str, str]] = {
+    NOMINATIM: {"User-Agent": "EcocycloApp/1.0 (filipebsg2@gmail.com)"},
+}
+
+
+class HttpClientRegistry:
+    """
+    Um httpx.AsyncClient por integração externa, reaproveitado entre
+    requisições (keep-alive, sem novo handshake TCP+TLS a cada chamada).
+    Como cada integração fala com um único host, os limites do pool de
+    cada cliente valem por host.
+
+    Os clientes são abertos no lifespan e fechados no shutdown; fora dele
+    (CLI, scripts) são criados sob demanda na primeira chamada de get().
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            headers=DEFAULT_HEADERS.get(name),
+            timeout=httpx.Timeout(
+                settings.HTTP_TIMEOUT_SECONDS, connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_PER_HOST,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client: Optional[httpx.AsyncClient] = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create(name)
+            self._clients[name] = client
+        return client
+
+    def start(self) -> None:
+        for name in (NOMINATIM, IBGE, BRASILAPI):
+            self.get(name)
+        logger.info(f"🌐 Clientes HTTP prontos (HTTP/2: {'sim' if HTTP2_AVAILABLE else 'não'})")
+
+    async def aclose(self) -> None:
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+
+http_clients = HttpClientRegistry()
@@ -1,83 +1,371 @@
+import asyncio
+import bisect
+import gzip
+import hashlib
 import httpx
+import json
 import logging
+from datetime import datetime
+from pathlib import Path
 from typing import List, Dict, Optional
 
+from pydantic import BaseModel, ConfigDict
+
+from app.config.config import settings
+from app.services.circuit_breaker import CircuitOpenError, ibge_breaker, raise_for_unavailable
+from app.services.http_client import IBGE, http_clients
+from app.utils.text import normalize_text
+
 logger = logging.getLogger(__name__)
 
+# As 27 UFs mudam tão pouco que vão no código (código IBGE, sigla, nome)
+ESTADOS_IBGE = [
+    ("12", "AC", "Acre"),
+    ("27", "AL", "Alagoas"),
+    ("16", "AP", "Amapá"),
+    ("13", "AM", "Amazonas"),
+    ("29", "BA", "Bahia"),
+    ("23", "CE", "Ceará"),
+    ("53", "DF", "Distrito Federal"),
+    ("32", "ES", "Espírito Santo"),
+    ("52", "GO", "Goiás"),
+    ("21", "MA", "Maranhão"),
+    ("51", "MT", "Mato Grosso"),
+    ("50", "MS", "Mato Grosso do Sul"),
+    ("31", "MG", "Minas Gerais"),
+    ("15", "PA", "Pará"),
+    ("25", "PB", "Paraíba"),
+    ("41", "PR", "Paraná"),
+    ("26", "PE", "Pernambuco"),
+    ("22", "PI", "Piauí"),
+    ("33", "RJ", "Rio de Janeiro"),
+    ("24", "RN", "Rio Grande do Norte"),
+    ("43", "RS", "Rio Grande do Sul"),
+    ("11", "RO", "Rondônia"),
+    ("14", "RR", "Roraima"),
+    ("42", "SC", "Santa Catarina"),
+    ("35", "SP", "São Paulo"),
+    ("28", "SE", "Sergipe"),
+    ("17", "TO", "Tocantins"),
+]
+ESTADOS = [{"sigla": sigla, "nome": nome} for _, sigla, nome in ESTADOS_IBGE]
+ESTADOS_VERSION = hashlib.sha1(json.dumps(ESTADOS).encode()).hexdigest()[:16]
+
+SNAPSHOT_RETRY_SECONDS = 60
+
+
+class MunicipiosSnapshot(BaseModel):
+    """
+    Municípios por UF, ordenados por nome, mais um índice nome normalizado →
+    código para get_codigo_municipio e, para o autocomplete, arrays de nomes
+    normalizados ordenados (por UF e "" para o Brasil todo) com as cidades
+    na mesma posição. Imutável: uma atualização monta outro snapshot e troca
+    a referência de uma vez.
+    """
+    model_config = ConfigDict(frozen=True)
+
+    cidades_por_uf: Dict[str, List[Dict[str, str]]]
+    codigos_por_uf: Dict[str, Dict[str, str]]
+    prefix_keys: Dict[str, List[str]]
+    prefix_items: Dict[str, List[Dict[str, str]]]
+    version: str
+    loaded_at: datetime
+
+    @classmethod
+    def build(cls, cidades_por_uf: Dict[str, List[Dict[str, str]]]) -> "MunicipiosSnapshot":
+        cidades = {
+            uf.upper(): sorted(
+                ({"codigo": str(cidade["codigo"]), "nome": cidade["nome"]} for cidade in lista),
+                key=lambda x: x["nome"],
+            )
+            for uf, lista in cidades_por_uf.items()
+        }
+        codigos = {
+            uf: {normalize_text(cidade["nome"]): cidade["codigo"] for cidade in lista}
+            for uf, lista in cidades.items()
+        }
+        entries = sorted(
+            (normalize_text(cidade["nome"]), uf, cidade)
+            for uf, lista in cidades.items()
+            for cidade in lista
+        )
+        prefix_keys: Dict[str, List[str]] = {"": []}
+        prefix_items: Dict[str, List[Dict[str, str]]] = {"": []}
+        for nome_norm, uf, cidade in entries:
+            item = {"codigo": cidade["codigo"], "nome": cidade["nome"], "uf": uf}
+            for scope in ("", uf):
+                prefix_keys.setdefault(scope, []).append(nome_norm)
+                prefix_items.setdefault(scope, []).append(item)
+
+        version = hashlib.sha1(json.dumps(cidades, sort_keys=True).encode()).hexdigest()[:16]
+        return cls(
+            cidades_por_uf=cidades,
+            codigos_por_uf=codigos,
+            prefix_keys=prefix_keys,
+            prefix_items=prefix_items,
+            version=version,
+            loaded_at=datetime.utcnow(),
+        )
+
+    def search_prefix(self, prefix: str, uf: str = "", limit: int = 10) -> List[Dict[str, str]]:
+        """Cidades cujo nome normalizado começa com `prefix`, em ordem alfabética"""
+        keys = self.prefix_keys.get(uf, [])
+        items = self.prefix_items.get(uf, [])
+        start = bisect.bisect_left(keys, prefix)
+        result = []
+        for index in range(start, min(start + limit, len(keys))):
+            if not keys[index].startswith(prefix):
+                break
+            result.append(items[index])
+        return result
+
+    @property
+    def total(self) -> int:
+        return sum(len(lista) for lista in self.cidades_por_uf.values())
+
+
 class LocationService:
+    """
+    Estados e municípios do IBGE servidos da memória.
+
+    - Estados: lista fixa (ESTADOS_IBGE).
+    - Municípios: snapshot lido de IBGE_SNAPSHOT_PATH no startup ou, sem o
+      arquivo, baixado do IBGE em uma única chamada (e gravado no arquivo).
+      Um refresher em segundo plano baixa de novo a cada IBGE_REFRESH_HOURS.
+    - Enquanto não houver snapshot, cada UF é buscada direto no IBGE.
+    """
+
     def __init__(self):
-        self.ibge_estados_url = "https://servicodados.ibge.gov.br/api/v1/localidades/estados"
+        self.ibge_municipios_url = "https://servicodados.ibge.gov.br/api/v1/localidades/municipios"
         self.ibge_cidades_url = "https://servicodados.ibge.gov.br/api/v1/localidades/estados/{uf}/municipios"
-        
-    
+        self._snapshot: Optional[MunicipiosSnapshot] = None
+        self._refresher: Optional[asyncio.Task] = None
+
+    @property
+    def snapshot(self) -> Optional[MunicipiosSnapshot]:
+        return self._snapshot
+
+    def etag(self, uf: Optional[str] = None) -> str:
+        """ETag das respostas de /estados (sem uf) e /estados/{uf}/cidades"""
+        if uf is None:
+            return f'W/"{ESTADOS_VERSION}"'
+        version = self._snapshot.version if self._snapshot else "live"
+        return f'W/"{version}-{uf.upper()}"'
+
+    @staticmethod
+    def _read_snapshot_file(path: Path) -> Dict[str, List[Dict[str, str]]]:
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8") as file:
+            return json.load(file)
+
+    @staticmethod
+    def _write_snapshot_file(path: Path, cidades_por_uf: Dict[str, List[Dict[str, str]]]) -> None:
+        # Grava num temporário e renomeia: nunca fica um arquivo pela metade
+        tmp = path.with_name(path.name + ".tmp")
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(tmp, "wt", encoding="utf-8") as file:
+            json.dump(cidades_por_uf, file, ensure_ascii=False)
+        tmp.replace(path)
+
+    def _swap(self, snapshot: MunicipiosSnapshot, origem: str) -> None:
+        self._snapshot = snapshot
+        logger.info(
+            f"🗺️ Snapshot de municípios carregado de {origem}: "
+            f"{snapshot.total} municípios em {len(snapshot.cidades_por_uf)} UFs"
+        )
+
+    async def load_snapshot(self) -> bool:
+        """Carrega o snapshot de IBGE_SNAPSHOT_PATH, se o arquivo existir"""
+        if not settings.IBGE_SNAPSHOT_PATH:
+            return False
+        path = Path(settings.IBGE_SNAPSHOT_PATH)
+        if not path.exists():
+            return False
+        cidades_por_uf = await asyncio.to_thread(self._read_snapshot_file, path)
+        self._swap(MunicipiosSnapshot.build(cidades_por_uf), path.name)
+        return True
+
+    async def _fetch_municipios(self) -> Dict[str, List[Dict[str, str]]]:
+        """Todos os municípios do Brasil numa chamada só, agrupados por UF"""
+        client = http_clients.get(IBGE)
+        with ibge_breaker.guard():
+            response = raise_for_unavailable(
+                await client.get(self.ibge_municipios_url, params={"view": "nivelado"})
+            )
+        response.raise_for_status()
+
+        cidades_por_uf: Dict[str, List[Dict[str, str]]] = {}
+        for municipio in response.json():
+            cidades_por_uf.setdefault(municipio["UF-sigla"], []).append({
+                "codigo": str(municipio["municipio-id"]),
+                "nome": municipio["municipio-nome"],
+            })
+        return cidades_por_uf
+
+    async def refresh(self) -> None:
+        """Baixa os municípios do IBGE, troca o snapshot e atualiza o arquivo"""
+        logger.info("🌐 Atualizando snapshot de municípios do IBGE...")
+        cidades_por_uf = await self._fetch_municipios()
+        snapshot = MunicipiosSnapshot.build(cidades_por_uf)
+        if len(snapshot.cidades_por_uf) < len(ESTADOS_IBGE):
+            raise ValueError(f"Resposta do IBGE incompleta: {len(snapshot.cidades_por_uf)} UFs")
+        self._swap(snapshot, "IBGE")
+
+        if settings.IBGE_SNAPSHOT_PATH:
+            try:
+                await asyncio.to_thread(
+                    self._write_snapshot_file, Path(settings.IBGE_SNAPSHOT_PATH), snapshot.cidades_por_uf
+                )
+            except OSError as e:
+                logger.warning(f"⚠️ Não foi possível gravar o snapshot de municípios: {str(e)}")
+
+    async def _run_refresher(self) -> None:
+        interval = settings.IBGE_REFRESH_HOURS * 3600
+        while True:
+            if self._snapshot is not None:
+                if interval <= 0:
+                    return
+                await asyncio.sleep(interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao atualizar municípios do IBGE: {str(e)}")
+                if self._snapshot is None:
+                    await asyncio.sleep(SNAPSHOT_RETRY_SECONDS)
+
+    def start_refresher(self) -> None:
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._run_refresher())
+
+    async def stop_refresher(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
     async def get_estados(self) -> List[Dict[str, str]]:
         """
-        Busca todos os estados do Brasil da API do IBGE
+        Retorna todos os estados do Brasil, ordenados por nome
         Retorna: [{"sigla": "SP", "nome": "São Paulo"}, ...]
         """
-        try:   
-            logger.info("🌐 Buscando estados do IBGE...")
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.ibge_estados_url, timeout=10.0)
-                
-                if response.status_code == 200:
-                    estados_data = response.json()
-                    estados = []
-
-                    for estado in estados_data:
-                        estados.append({
-                            "sigla": estado.get("sigla"),
-                            "nome": estado.get("nome")
-                        })
-
-                    estados.sort(key=lambda x: x["nome"])
-                    logger.info(f"✅ {len(estados)} estados obtidos com sucesso.")
-                    return estados
-                else:
-                    logger.warning(f"⚠️ Falha ao buscar estados: Status {response.status_code}")
-                    return []
-        except httpx.TimeoutException:
-            logger.error("Timeout na requisição para obter estados do IBGE")
-            return []
-        except httpx.RequestError as e:
-            logger.error(f"Erro de conexão ao buscar estados do IBGE: {str(e)}")
-            return []
-
+        return list(ESTADOS)
 
     async def get_cidades_por_estado(self, uf: str) -> List[Dict[str, str]]:
         """
-        Busca todas as cidades de um estado específico da API do IBGE
+        Retorna todas as cidades de um estado, do snapshot em memória
+        (ou do IBGE, enquanto o snapshot não foi carregado)
         Parâmetros:
             uf: Sigla do estado (ex: "SP")
-        Retorna: [{"nome": "São Paulo"}, ...]
+        Retorna: [{"codigo": "3550308", "nome": "São Paulo"}, ...]
+        """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return list(snapshot.cidades_por_uf.get(uf.upper(), []))
+        return await self._fetch_cidades_por_estado(uf)
+
+    async def _fetch_cidades_por_estado(self, uf: str) -> List[Dict[str, str]]:
+        """
+        Busca todas as cidades de um estado específico da API do IBGE
         """
         try:
             url = self.ibge_cidades_url.format(uf=uf)
             logger.info(f"🌐 Buscando cidades para o estado {uf} do IBGE...")
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, timeout=10.0)
-                
-                if response.status_code == 200:
-                    cidades_data = response.json()
-                    cidades = []
-
-                    for cidade in cidades_data:
-                        cidades.append({
-                            "codigo": str(cidade.get("id")),
-                            "nome": cidade.get("nome")
-                        })
-
-                    cidades.sort(key=lambda x: x["nome"])
-                    logger.info(f"✅ {len(cidades)} cidades obtidas com sucesso para o estado {uf}.")
-                    return cidades
-                else:
-                    logger.warning(f"⚠️ Falha ao buscar cidades para o estado {uf}: Status {response.status_code}")
-                    return []
+            client = http_clients.get(IBGE)
+            with ibge_breaker.guard():
+                response = raise_for_unavailable(await client.get(url))
+            
+            if response.status_code == 200:
+                cidades_data = response.json()
+                cidades = []
+
+                for cidade in cidades_data:
+                    cidades.append({
+                        "codigo": str(cidade.get("id")),
+                        "nome": cidade.get("nome")
+                    })
+
+                cidades.sort(key=lambda x: x["nome"])
+                logger.info(f"✅ {len(cidades)} cidades obtidas com sucesso para o estado {uf}.")
+                return cidades
+            else:
+                logger.warning(f"⚠️ Falha ao buscar cidades para o estado {uf}: Status {response.status_code}")
+                return []
         except httpx.TimeoutException:
             logger.error(f"Timeout na requisição para obter cidades do estado {uf} do IBGE")
             return []
         except httpx.RequestError as e:
             logger.error(f"Erro de conexão ao buscar cidades do estado {uf} do IBGE: {str(e)}")
             return []
-                       
+        except httpx.HTTPStatusError as e:
+            logger.warning(f"⚠️ Falha ao buscar cidades para o estado {uf}: Status {e.response.status_code}")
+            return []
+        except CircuitOpenError as e:
+            logger.warning(f"🔌 {str(e)}")
+            return []
+
+    async def get_codigo_municipio(self, uf: str, cidade: str, fetch: bool = True) -> Optional[str]:
+        """
+        Retorna o código IBGE do município, comparando nomes sem acento/caixa.
+        Retorna None se o IBGE não responder ou a cidade não existir na UF.
+        Com `fetch=False` usa só o snapshot (None enquanto ele não carregou),
+        sem chamar o IBGE dentro da requisição.
+        """
+        cidade_norm = normalize_text(cidade)
+        if not uf or not cidade_norm:
+            return None
+
+        snapshot = self._snapshot
+        if snapshot is not None and uf.strip().upper() in snapshot.codigos_por_uf:
+            codigo = snapshot.codigos_por_uf[uf.strip().upper()].get(cidade_norm)
+            if codigo is None:
+                logger.warning(f"⚠️ Município não encontrado no IBGE: {cidade}-{uf}")
+            return codigo
+        if not fetch:
+            return None
+
+        for municipio in await self.get_cidades_por_estado(uf.strip().upper()):
+            if normalize_text(municipio["nome"]) == cidade_norm:
+                return municipio["codigo"]
+
+        logger.warning(f"⚠️ Município não encontrado no IBGE: {cidade}-{uf}")
+        return None
+
+    async def autocomplete_cidades(
+        self, q: str, uf: Optional[str] = None, limit: int = 10
+    ) -> Optional[List[Dict[str, str]]]:
+        """
+        Cidades cujo nome começa com `q` (sem acento/caixa), opcionalmente
+        numa UF. Retorna None se não houver snapshot e nenhuma UF foi dada.
+        Retorna: [{"codigo": "2611606", "nome": "Recife", "uf": "PE"}, ...]
+        """
+        prefix = normalize_text(q)
+        uf = uf.strip().upper() if uf else ""
+
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot.search_prefix(prefix, uf, limit)
+        if not uf:
+            return None
+
+        # Sem snapshot ainda: filtra a lista da UF vinda do IBGE
+        result = []
+        for cidade in await self.get_cidades_por_estado(uf):
+            if normalize_text(cidade["nome"]).startswith(prefix):
+                result.append({"codigo": cidade["codigo"], "nome": cidade["nome"], "uf": uf})
+        result.sort(key=lambda x: normalize_text(x["nome"]))
+        return result[:limit]
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "loaded": snapshot is not None,
+            "municipios": snapshot.total if snapshot else 0,
+            "version": snapshot.version if snapshot else None,
+            "loaded_at": snapshot.loaded_at.isoformat() if snapshot else None,
+        }
+
+
 ibge_service = LocationService()
\ No newline at end of file
@@ -0,0 +1,204 @@
+import logging
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from pymongo import ReturnDocument
+
+from app.config.config import settings
+from app.models.throttle_counter import ThrottleCounter
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_MAX_KEYS = 100_000
+
+
+def sliding_estimate(previous: int, current: int, elapsed: float, window: float) -> float:
+    """Tentativas nos últimos `window` segundos: a janela anterior pesa pelo trecho ainda coberto"""
+    return previous * (1 - elapsed / window) + current
+
+
+def retry_after(previous: int, current: int, limit: int, elapsed: float, window: float) -> int:
+    """Segundos até a estimativa ficar abaixo do limite (sem novas tentativas)"""
+    if current < limit:
+        # Basta a janela anterior perder peso: previous * (1 - t / window) + current < limit
+        seconds = window * (1 - (limit - current) / previous) - elapsed if previous else 0
+    else:
+        # Só na próxima janela, quando a atual vira a anterior
+        seconds = (window - elapsed) + window * (1 - limit / current)
+    return max(1, math.ceil(seconds))
+
+
+class SlidingWindowCounter:
+    """
+    Contadores por chave em memória, com janela deslizante aproximada por
+    duas janelas fixas (atual e anterior). Guarda no máximo THROTTLE_MAX_KEYS
+    chaves; as usadas há mais tempo saem primeiro.
+    """
+
+    def __init__(self, window_seconds: float, max_keys: int = THROTTLE_MAX_KEYS):
+        self.window = window_seconds
+        self.max_keys = max_keys
+        # chave -> [índice da janela atual, contagem atual, contagem anterior]
+        self._counts: "OrderedDict[str, List[int]]" = OrderedDict()
+
+    def counts(self, key: str, index: int) -> Tuple[int, int]:
+        """(anterior, atual) para a janela `index`"""
+        entry = self._counts.get(key)
+        if entry is None or entry[0] < index - 1:
+            return 0, 0
+        if entry[0] == index - 1:
+            return entry[1], 0
+        return entry[2], entry[1]
+
+    def hit(self, key: str, index: int) -> Tuple[int, int]:
+        previous, current = self.counts(key, index)
+        self._counts[key] = [index, current + 1, previous]
+        self._counts.move_to_end(key)
+        if len(self._counts) > self.max_keys:
+            self._counts.popitem(last=False)
+        return previous, current + 1
+
+    def reset(self, key: str) -> None:
+        self._counts.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+
+class LoginThrottle:
+    """
+    Limite de tentativas por IP e por email numa rota sensível (login,
+    recuperação de senha), checado antes de qualquer consulta ao banco ou
+    bcrypt. Acima do limite: 429 com Retry-After.
+
+    Os contadores ficam na memória do worker. Com THROTTLE_SHARED, cada
+    tentativa também soma na coleção throttle_counters e vale o total de
+    todos os workers; se o MongoDB falhar, vale só a contagem local.
+    Requisições já recusadas pela contagem local não contam.
+    """
+
+    def __init__(self, name: str, window_seconds: float, max_per_ip: int, max_per_email: int):
+        self.name = name
+        self.window = window_seconds
+        self.limits = {"ip": max_per_ip, "email": max_per_email}
+        self.local = SlidingWindowCounter(window_seconds)
+        # Janela anterior já fechada não muda mais: guarda a contagem compartilhada
+        self._shared_previous: Dict[str, Tuple[int, int]] = {}
+        self.allowed = 0
+        self.rejected = 0
+        self.fallbacks = 0
+
+    def _keys(self, ip: Optional[str], email: Optional[str]) -> List[Tuple[str, int]]:
+        keys = []
+        if ip:
+            keys.append((f"{self.name}:ip:{ip}", self.limits["ip"]))
+        if email:
+            keys.append((f"{self.name}:email:{email.strip().lower()}", self.limits["email"]))
+        return keys
+
+    def _reject(self, seconds: int) -> HTTPException:
+        self.rejected += 1
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Muitas tentativas, tente novamente mais tarde",
+            headers={"Retry-After": str(seconds)},
+        )
+
+    async def _shared_counts(self, key: str, index: int) -> Tuple[int, int]:
+        collection = ThrottleCounter.get_motor_collection()
+        window_end = datetime.utcfromtimestamp((index + 1) * self.window)
+        document = await collection.find_one_and_update(
+            {"key": f"{key}:{index}"},
+            {"$inc": {"hits": 1}, "$setOnInsert": {"expires_at": window_end + timedelta(seconds=self.window)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+        cached = self._shared_previous.get(key)
+        if cached is not None and cached[0] == index - 1:
+            previous = cached[1]
+        else:
+            previous_document = await collection.find_one({"key": f"{key}:{index - 1}"})
+            previous = previous_document["hits"] if previous_document else 0
+            if len(self._shared_previous) >= THROTTLE_MAX_KEYS:
+                self._shared_previous.clear()
+            self._shared_previous[key] = (index - 1, previous)
+        return previous, document["hits"]
+
+    async def hit(self, ip: Optional[str], email: Optional[str] = None) -> None:
+        """Conta uma tentativa; 429 se o IP ou o email passou do limite"""
+        now = time.time()
+        index = int(now // self.window)
+        elapsed = now - index * self.window
+        keys = self._keys(ip, email)
+
+        # Acima do limite só com a contagem deste worker: recusa sem ir ao MongoDB
+        for key, limit in keys:
+            previous, current = self.local.counts(key, index)
+            if sliding_estimate(previous, current, elapsed, self.window) + 1 > limit:
+                raise self._reject(retry_after(previous, current, limit, elapsed, self.window))
+
+        counts = [self.local.hit(key, index) for key, _ in keys]
+        if settings.THROTTLE_SHARED:
+            try:
+                counts = [await self._shared_counts(key, index) for key, _ in keys]
+            except Exception as e:
+                self.fallbacks += 1
+                logger.warning(f"⚠️ Limite de tentativas '{self.name}' sem MongoDB, usando contagem local: {str(e)}")
+
+        for (key, limit), (previous, current) in zip(keys, counts):
+            if sliding_estimate(previous, current, elapsed, self.window) > limit:
+                logger.warning(f"🚫 Tentativas demais em '{self.name}' para {key.split(':', 1)[1]}")
+                raise self._reject(retry_after(previous, current, limit, elapsed, self.window))
+        self.allowed += 1
+
+    async def reset(self, email: str) -> None:
+        """Zera a contagem do email (login certo depois de erros de digitação)"""
+        index = int(time.time() // self.window)
+        for key, _ in self._keys(None, email):
+            self.local.reset(key)
+            self._shared_previous.pop(key, None)
+            if settings.THROTTLE_SHARED:
+                try:
+                    await ThrottleCounter.get_motor_collection().delete_many(
+                        {"key": {"$in": [f"{key}:{index}", f"{key}:{index - 1}"]}}
+                    )
+                except Exception as e:
+                    logger.warning(f"⚠️ Falha ao zerar tentativas de '{self.name}': {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "window_seconds": self.window,
+            "limits": self.limits,
+            "keys": len(self.local),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "fallbacks": self.fallbacks,
+        }
+
+
+def client_ip(request: Request) -> Optional[str]:
+    """IP do cliente; atrás do proxy, o primeiro do X-Forwarded-For (THROTTLE_TRUST_FORWARDED_FOR)"""
+    if settings.THROTTLE_TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+
+login_throttle = LoginThrottle(
+    "login",
+    window_seconds=settings.LOGIN_THROTTLE_WINDOW_SECONDS,
+    max_per_ip=settings.LOGIN_THROTTLE_MAX_PER_IP,
+    max_per_email=settings.LOGIN_THROTTLE_MAX_PER_EMAIL,
+)
+forgot_password_throttle = LoginThrottle(
+    "forgot_password",
+    window_seconds=settings.FORGOT_PASSWORD_THROTTLE_WINDOW_SECONDS,
+    max_per_ip=settings.FORGOT_PASSWORD_THROTTLE_MAX_PER_IP,
+    max_per_email=settings.FORGOT_PASSWORD_THROTTLE_MAX_PER_EMAIL,
+)
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+from app.config.config import settings
+from app.models.cache_version import CacheVersion
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+TILE_CACHE_MAX_ITEMS = 2048
+TILE_CACHE_TTL_SECONDS = 60
+DENSITY_CACHE_MAX_ITEMS = 64
+DENSITY_CACHE_TTL_SECONDS = 300
+MAP_CACHE_KEY = "company_map"
+
+
+class MapCache:
+    """
+    Caches derivados das coletoras exibidas no mapa.
+
+    `db_version` espelha o documento "company_map" da coleção cache_versions.
+    Quem altera uma coletora incrementa esse documento; os outros workers
+    percebem a mudança pelo watcher iniciado no lifespan e descartam seus
+    caches. Se o incremento falha, só `local_epoch` avança (o número do banco
+    não é inventado) e o watcher tenta publicar de novo. `version` junta os
+    dois e entra no ETag dos tiles e no snapshot do mapa.
+    """
+
+    def __init__(self):
+        self.db_version = 0
+        self.local_epoch = 0
+        self._publish_pending = False
+        self.tiles = TTLCache(maxsize=TILE_CACHE_MAX_ITEMS, ttl=TILE_CACHE_TTL_SECONDS)
+        # Grades de densidade por (camada, zoom); descartes só expiram por TTL
+        self.density = TTLCache(maxsize=DENSITY_CACHE_MAX_ITEMS, ttl=DENSITY_CACHE_TTL_SECONDS)
+        self._watcher: asyncio.Task | None = None
+
+    @property
+    def version(self) -> str:
+        return f"{self.db_version}.{self.local_epoch}"
+
+    def _clear(self, reason: str) -> None:
+        self.tiles.clear()
+        self.density.clear()
+        logger.debug(f"🗺️ Cache do mapa invalidado (versão {self.version}) {reason}")
+
+    def _apply_version(self, version: int, reason: str = "") -> None:
+        if version == self.db_version:
+            return
+        self.db_version = version
+        self._clear(reason)
+
+    async def _publish(self, reason: str = "") -> None:
+        document = await CacheVersion.get_motor_collection().find_one_and_update(
+            {"key": MAP_CACHE_KEY},
+            {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self._publish_pending = False
+        self._apply_version(document["version"], reason)
+
+    async def invalidate(self, reason: str = "") -> None:
+        """
+        Invalida o cache neste worker e publica a nova versão para os demais
+        """
+        try:
+            await self._publish(reason)
+        except Exception as e:
+            # Sem o banco ao menos este worker fica consistente; o watcher publica depois
+            logger.warning(f"⚠️ Falha ao publicar versão do mapa: {str(e)}")
+            self.local_epoch += 1
+            self._publish_pending = True
+            self._clear(reason)
+
+    async def refresh_version(self) -> int:
+        """
+        Lê a versão publicada e descarta os caches locais se ela mudou
+        """
+        document = await CacheVersion.get_motor_collection().find_one({"key": MAP_CACHE_KEY})
+        if document is not None:
+            self._apply_version(document["version"], "(alteração em outro worker)")
+        return self.db_version
+
+    async def _watch_version(self) -> None:
+        while True:
+            try:
+                if self._publish_pending:
+                    await self._publish("(publicação pendente)")
+                await self.refresh_version()
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao consultar versão do mapa: {str(e)}")
+            await asyncio.sleep(settings.MAP_VERSION_POLL_SECONDS)
+
+    def start_watcher(self) -> None:
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.create_task(self._watch_version())
+
+    async def stop_watcher(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "publish_pending": self._publish_pending,
+            "tiles": self.tiles.stats(), "density": self.density.stats(),
+        }
+
+
+map_cache = MapCache()
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import math
+import time
+from array import array
+from typing import List, Optional, Tuple
+
+from app.models.company import Company, CompanyType, tags_to_mask
+from app.schemas.company import CompanyMapFilter, CompanyMapProjection, TagMatch, DEFAULT_MAP_RADIUS_KM
+from app.services.map_cache import map_cache
+from app.utils.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Distância em km entre dois pontos sobre a esfera"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class MapSnapshot:
+    """
+    Foto imutável das coletoras elegíveis para o mapa.
+    Os filtros rodam sobre colunas compactas (arrays) e só as linhas
+    selecionadas viram objetos de resposta.
+    """
+
+    def __init__(self, rows: List[CompanyMapProjection], version: str):
+        rows = [row for row in rows if row.latitude is not None and row.longitude is not None]
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.rows = rows
+        self.uuids = [row.uuid for row in rows]
+        self.latitudes = array("d", (row.latitude for row in rows))
+        self.longitudes = array("d", (row.longitude for row in rows))
+        self.ratings = array("d", (row.rating_average for row in rows))
+        self.tag_masks = array("B", (row.tags_mask for row in rows))
+        self.ufs = [row.uf.upper() for row in rows]
+        self.cidades = [normalize_text(row.cidade) for row in rows]
+        self.codigos_ibge = [row.codigo_ibge for row in rows]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def query(
+        self, filter_data: CompanyMapFilter
+    ) -> Tuple[List[Tuple[CompanyMapProjection, Optional[float]]], bool]:
+        """
+        Mesma semântica de CompanyService._query_map_companies, sem ir ao banco
+        """
+        tags_mask = tags_to_mask(filter_data.tags)
+        match_all = filter_data.tag_match == TagMatch.ALL
+        uf = filter_data.uf.upper() if filter_data.uf else None
+        city = normalize_text(filter_data.city) if filter_data.city else None
+        city_code = filter_data.city_code
+        min_rating = filter_data.min_rating
+        bbox = filter_data.bbox
+        center = (filter_data.lat, filter_data.lng) if filter_data.has_geo_center() else None
+        radius_km = filter_data.radius_km or DEFAULT_MAP_RADIUS_KM
+
+        matches: List[Tuple[int, Optional[float]]] = []
+        for i in range(len(self.rows)):
+            if tags_mask:
+                matched = self.tag_masks[i] & tags_mask
+                if not matched or (match_all and matched != tags_mask):
+                    continue
+            if uf is not None and self.ufs[i] != uf:
+                continue
+            if city is not None and self.cidades[i] != city:
+                continue
+            if city_code and self.codigos_ibge[i] != city_code:
+                continue
+            if min_rating is not None and self.ratings[i] < min_rating:
+                continue
+
+            lat, lng = self.latitudes[i], self.longitudes[i]
+            if bbox is not None:
+                min_lng, min_lat, max_lng, max_lat = bbox
+                if not (min_lng <= lng <= max_lng and min_lat <= lat <= max_lat):
+                    continue
+                matches.append((i, None))
+            elif center is not None:
+                distance_km = haversine_km(center[0], center[1], lat, lng)
+                if distance_km > radius_km:
+                    continue
+                matches.append((i, round(distance_km, 2)))
+            else:
+                matches.append((i, None))
+
+        truncated = False
+        if bbox is not None:
+            matches.sort(key=lambda match: self.ratings[match[0]], reverse=True)
+            truncated = len(matches) > filter_data.limit
+            matches = matches[:filter_data.limit]
+        elif center is not None:
+            matches.sort(key=lambda match: match[1])
+
+        return [(self.rows[i], distance_km) for i, distance_km in matches], truncated
+
+
+class MapSnapshotService:
+    """
+    Mantém o snapshot do processo alinhado com map_cache.version.
+    Leituras só vão ao banco quando a versão muda.
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[MapSnapshot] = None
+        self._lock = asyncio.Lock()
+
+    async def _load(self, version: str) -> MapSnapshot:
+        started = time.perf_counter()
+        rows = await Company.find({
+            "is_active": True,
+            "company_type": CompanyType.EMPRESA_COLETORA,
+            "location": {"$ne": None},
+        }).project(CompanyMapProjection).to_list()
+        snapshot = MapSnapshot(rows, version)
+        logger.info(
+            f"🗺️ Snapshot do mapa carregado: {len(snapshot)} coletoras, versão {version} "
+            f"({(time.perf_counter() - started) * 1000:.0f} ms)"
+        )
+        return snapshot
+
+    async def get_snapshot(self) -> MapSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == map_cache.version:
+            return snapshot
+
+        async with self._lock:
+            # Outra requisição pode ter recarregado enquanto esperávamos
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != map_cache.version:
+                # A versão é lida antes da consulta: uma escrita no meio força novo load
+                snapshot = await self._load(map_cache.version)
+                self._snapshot = snapshot
+            return snapshot
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "version": snapshot.version,
+            "companies": len(snapshot),
+            "age_seconds": round(time.monotonic() - snapshot.loaded_at, 1),
+        }
+
+
+map_snapshot_service = MapSnapshotService()
@@ -0,0 +1,71 @@
+import hashlib
+from typing import Tuple
+
+from app.models.company import Company
+from app.schemas.company import CompanyMapFilter, CompanyMapPointProjection
+from app.services.company_service import CompanyService
+from app.services.map_cache import map_cache
+from app.services.vector_tile import encode_point_layer, tile_bounds
+from app.utils.text import normalize_text
+
+MVT_LAYER_NAME = "coletoras"
+MAX_TILE_ZOOM = 22
+
+
+class MapTileService:
+
+    @staticmethod
+    def filter_hash(filter_data: CompanyMapFilter) -> str:
+        """
+        Hash estável dos filtros que afetam o conteúdo do tile
+        """
+        key = "|".join([
+            ",".join(sorted(tag.value for tag in filter_data.tags or [])),
+            filter_data.tag_match.value,
+            normalize_text(filter_data.city),
+            filter_data.city_code or "",
+            (filter_data.uf or "").upper(),
+            str(filter_data.min_rating),
+        ])
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    async def get_tile(z: int, x: int, y: int, filter_data: CompanyMapFilter) -> Tuple[bytes, str]:
+        """
+        Retorna o tile MVT z/x/y das coletoras ativas e o seu ETag.
+        O tile fica em cache por (z, x, y, hash dos filtros).
+        """
+        if not (0 <= z <= MAX_TILE_ZOOM) or not (0 <= x < 2 ** z) or not (0 <= y < 2 ** z):
+            raise ValueError("Tile fora dos limites")
+
+        cache_key = (z, x, y, MapTileService.filter_hash(filter_data))
+        etag = f'"{map_cache.version}-{z}-{x}-{y}-{cache_key[3]}"'
+
+        tile = map_cache.tiles.get(cache_key)
+        if tile is not None:
+            return tile, etag
+
+        query = CompanyService._build_map_query(filter_data)
+        query["location"] = CompanyService._bbox_filter(tile_bounds(z, x, y))
+        points = await Company.find(query).project(CompanyMapPointProjection).to_list()
+
+        features = [
+            (
+                point.longitude,
+                point.latitude,
+                {
+                    "uuid": str(point.uuid),
+                    "rating_average": point.rating_average,
+                    # MVT não tem listas; as tags vão separadas por vírgula
+                    "tags": ",".join(tag.value for tag in point.company_colector_tags or []),
+                },
+            )
+            for point in points
+        ]
+
+        tile = encode_point_layer(MVT_LAYER_NAME, features, z, x, y)
+        map_cache.tiles.set(cache_key, tile)
+        return tile, etag
+
+
+map_tile_service = MapTileService()
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException, status
+
+from app.config.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHashPool:
+    """
+    Pool de threads dedicado ao bcrypt (hash e verificação de senha).
+
+    O bcrypt leva ~200-300 ms e libera o GIL, então rodá-lo fora do event
+    loop mantém o worker respondendo às outras rotas. O número de chamadas
+    em espera + em execução é limitado por PASSWORD_HASH_MAX_PENDING: acima
+    disso a requisição recebe 429 na hora em vez de entrar numa fila longa.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Executa `fn(*args)` no pool; 429 se já houver chamadas demais na fila"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            logger.warning(f"⏳ Pool de senhas saturado ({self.pending} chamadas pendentes)")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Servidor ocupado, tente novamente em instantes",
+                headers={"Retry-After": "1"},
+            )
+
+        submitted = time.perf_counter()
+
+        def timed() -> Any:
+            self.wait_seconds += time.perf_counter() - submitted
+            return fn(*args)
+
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), timed)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "peak_pending": self.peak_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+        }
+
+
+password_hash_pool = PasswordHashPool(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
@@ -1,8 +1,9 @@
 from datetime import datetime, timedelta, timezone
-from uuid import uuid4
+from uuid import UUID, uuid4
 from jose import JWTError, jwt
 from fastapi import HTTPException
 from app.config.config import settings
+from app.models.password_reset_token import PasswordResetToken
 
 
 class passwordResetService:
@@ -11,30 +12,62 @@ class passwordResetService:
         self.algorithm = "HS256"
         self.expire_minutes = 30  
 
-    def create_reset_token(self, company_id: str) -> str:
+    async def create_reset_token(self, company_id: str) -> str:
+        """
+        Emite o token e registra o jti em password_reset_tokens. Um pedido
+        novo invalida os links anteriores da mesma empresa.
+        """
         expire = datetime.now(timezone.utc) + timedelta(minutes=self.expire_minutes)
+        jti = str(uuid4())
 
         to_encode = {"exp": expire, 
                     "sub": str(company_id),
                     "type": "password_reset",
-                    "jti": str(uuid4())}
+                    "jti": jti}
             
         encoded_jwt = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
+
+        company_uuid = UUID(str(company_id))
+        await PasswordResetToken.find({"company_uuid": company_uuid}).delete()
+        await PasswordResetToken(
+            jti=jti,
+            company_uuid=company_uuid,
+            expires_at=expire.replace(tzinfo=None),
+        ).insert()
         return encoded_jwt
 
-    def verify_reset_token(self, token: str) -> str | None:
+    def _decode(self, token: str) -> dict:
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
-            if payload.get("type") != "password_reset":
-                raise HTTPException(status_code=401, detail="Invalid token type")
-            company_id: str = payload.get("sub")
-
-            if company_id is None:
-                raise HTTPException(status_code=401, detail="Invalid token payload")
-            return company_id
-        
         except JWTError:
             raise HTTPException(status_code=401, detail="Could not validate credentials")
+        if payload.get("type") != "password_reset":
+            raise HTTPException(status_code=401, detail="Invalid token type")
+        if payload.get("sub") is None:
+            raise HTTPException(status_code=401, detail="Invalid token payload")
+        return payload
+
+    def verify_reset_token(self, token: str) -> str | None:
+        return self._decode(token)["sub"]
+
+    async def consume_reset_token(self, token: str) -> UUID:
+        """
+        Valida o token e o marca como usado, atomicamente: de duas requisições
+        com o mesmo token só uma encontra o jti (find_one_and_delete)
+        """
+        payload = self._decode(token)
+        try:
+            company_uuid = UUID(payload["sub"])
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Token inválido")
+
+        document = await PasswordResetToken.get_motor_collection().find_one_and_delete({
+            "jti": payload.get("jti"),
+            "expires_at": {"$gt": datetime.utcnow()},
+        })
+        if document is None:
+            raise HTTPException(status_code=400, detail="Token inválido ou expirado")
+        return company_uuid
         
     def is_token_expired(self, token: str) -> bool:
         try:
@@ -0,0 +1,36 @@
+from typing import Optional
+from uuid import UUID
+
+from app.config.config import settings
+from app.schemas.company import CompanyPrincipal
+from app.utils.cache import TTLCache
+
+PRINCIPAL_CACHE_MAX_ITEMS = 10000
+
+
+class PrincipalCache:
+    """
+    Cache curto (PRINCIPAL_CACHE_TTL_SECONDS) do principal autenticado,
+    por `sub` do token. É por worker: alterações feitas neste processo
+    invalidam na hora (hook do Company), nos demais valem após o TTL.
+    """
+
+    def __init__(self):
+        self.memory = TTLCache(maxsize=PRINCIPAL_CACHE_MAX_ITEMS, ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS)
+        self.invalidations = 0
+
+    def get(self, company_uuid: UUID) -> Optional[CompanyPrincipal]:
+        return self.memory.get(company_uuid)
+
+    def set(self, principal: CompanyPrincipal) -> None:
+        self.memory.set(principal.uuid, principal)
+
+    def invalidate(self, company_uuid: UUID) -> None:
+        self.invalidations += 1
+        self.memory.delete(company_uuid)
+
+    def stats(self) -> dict:
+        return {**self.memory.stats(), "invalidations": self.invalidations}
+
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,190 @@
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+from bson import Binary
+from pydantic import BaseModel
+
+from app.models.company import Company, CompanyType, Companycolectortags
+from app.schemas.company import CompanyMapFilter, TagMatch
+from app.services.company_service import CompanyService
+
+logger = logging.getLogger(__name__)
+
+COLLSCAN_STAGE = "COLLSCAN"
+GEO_INDEX_NAME = "location_2dsphere"
+GEO_NEAR_STAGE_PREFIX = "GEO_NEAR"
+
+
+class QueryPlanSample(BaseModel):
+    """Consulta representativa de um caminho de acesso do company_service"""
+    name: str
+    filter: Optional[Dict[str, Any]] = None
+    sort: Optional[List[Tuple[str, int]]] = None
+    pipeline: Optional[List[Dict[str, Any]]] = None
+    # Consulta geográfica: só vale se o plano usar o índice location_2dsphere
+    geo_index: bool = False
+
+
+class QueryPlanResult(BaseModel):
+    name: str
+    stages: List[str]
+    indexes: List[str] = []
+    geo_index: bool = False
+
+    @property
+    def collscan(self) -> bool:
+        return COLLSCAN_STAGE in self.stages
+
+    @property
+    def missing_geo_index(self) -> bool:
+        """Consulta geográfica servida por outro índice (filtro de localização no FETCH)"""
+        if not self.geo_index:
+            return False
+        return GEO_INDEX_NAME not in self.indexes and not any(
+            stage.startswith(GEO_NEAR_STAGE_PREFIX) for stage in self.stages
+        )
+
+    @property
+    def failed(self) -> bool:
+        return self.collscan or self.missing_geo_index
+
+
+def _winning_plan_nodes(explain: Any) -> Iterator[dict]:
+    """
+    Estágios dos planos vencedores de uma saída de explain(). Percorre find
+    e aggregate (inclusive o $cursor interno) e ignora rejectedPlans.
+    """
+
+    def walk(node: Any, in_winning_plan: bool) -> Iterator[dict]:
+        if isinstance(node, dict):
+            if in_winning_plan and isinstance(node.get("stage"), str):
+                yield node
+            for key, value in node.items():
+                if key == "rejectedPlans":
+                    continue
+                yield from walk(value, in_winning_plan or key == "winningPlan")
+        elif isinstance(node, list):
+            for item in node:
+                yield from walk(item, in_winning_plan)
+
+    return walk(explain, False)
+
+
+def winning_plan_stages(explain: Any) -> List[str]:
+    """Lista os estágios dos planos vencedores de uma saída de explain()"""
+    return [node["stage"] for node in _winning_plan_nodes(explain)]
+
+
+def winning_plan_indexes(explain: Any) -> List[str]:
+    """Índices usados pelos planos vencedores de uma saída de explain()"""
+    return [node["indexName"] for node in _winning_plan_nodes(explain) if node.get("indexName")]
+
+
+class QueryPlanService:
+
+    @staticmethod
+    def company_service_samples() -> List[QueryPlanSample]:
+        """
+        Uma amostra por consulta do company_service, montada com os mesmos
+        helpers usados pelo serviço
+        """
+        service = CompanyService
+        tags = [Companycolectortags.Venda_de_material_reciclavel]
+        all_tags = list(Companycolectortags)
+        center = CompanyMapFilter(lat=-23.55, lng=-46.63, radius_km=10)
+        bbox = CompanyMapFilter(bbox=(-46.8, -23.7, -46.4, -23.4))
+
+        def map_query(filter_data: CompanyMapFilter) -> dict:
+            query = service._build_map_query(filter_data)
+            query["location"] = {"$ne": None}
+            return query
+
+        bbox_query = service._build_map_query(bbox)
+        bbox_query["location"] = service._bbox_filter(bbox.bbox)
+        clusters = CompanyMapFilter(zoom=4, bbox=(-74.0, -34.0, -34.0, 6.0))
+
+        return [
+            QueryPlanSample(name="mapa: todas as coletoras", filter=map_query(CompanyMapFilter())),
+            QueryPlanSample(name="mapa: tags", filter=map_query(CompanyMapFilter(tags=tags))),
+            QueryPlanSample(
+                name="mapa: todas as tags",
+                filter=map_query(CompanyMapFilter(tags=all_tags, tag_match=TagMatch.ALL)),
+            ),
+            QueryPlanSample(name="mapa: uf + cidade", filter=map_query(CompanyMapFilter(uf="SP", city="São Paulo"))),
+            QueryPlanSample(name="mapa: código IBGE", filter=map_query(CompanyMapFilter(city_code="3550308"))),
+            QueryPlanSample(name="mapa: avaliação mínima", filter=map_query(CompanyMapFilter(min_rating=4))),
+            QueryPlanSample(name="mapa: bbox", filter=bbox_query, sort=[("rating_average", -1)], geo_index=True),
+            QueryPlanSample(
+                name="mapa: raio ($geoNear)",
+                pipeline=service._geo_near_pipeline(center, service._build_map_query(center)),
+                geo_index=True,
+            ),
+            QueryPlanSample(
+                name="mapa: clusters",
+                pipeline=[{"$match": service._cluster_match(clusters)}],
+                geo_index=True,
+            ),
+            QueryPlanSample(
+                name="mapa: clusters sem bbox",
+                pipeline=[{"$match": service._cluster_match(CompanyMapFilter(zoom=4))}],
+            ),
+            QueryPlanSample(name="get_companies_by_tags", filter=service._tags_query(tags)),
+            QueryPlanSample(
+                name="update_company_tags",
+                filter={"uuid": Binary.from_uuid(uuid4()), "company_type": CompanyType.EMPRESA_COLETORA},
+            ),
+            QueryPlanSample(name="admin: listagem de empresas", filter={"is_admin": False}),
+        ]
+
+    @staticmethod
+    async def explain(sample: QueryPlanSample) -> dict:
+        collection = Company.get_motor_collection()
+        if sample.pipeline is not None:
+            return await collection.database.command(
+                "explain",
+                {"aggregate": collection.name, "pipeline": sample.pipeline, "cursor": {}},
+                verbosity="queryPlanner",
+            )
+        cursor = collection.find(sample.filter)
+        if sample.sort:
+            cursor = cursor.sort(sample.sort)
+        return await cursor.explain()
+
+    @staticmethod
+    async def check_company_service() -> List[QueryPlanResult]:
+        """
+        Roda explain() em cada consulta do company_service e retorna os
+        estágios e índices do plano
+        """
+        results = []
+        for sample in QueryPlanService.company_service_samples():
+            explain = await QueryPlanService.explain(sample)
+            result = QueryPlanResult(
+                name=sample.name,
+                stages=winning_plan_stages(explain),
+                indexes=winning_plan_indexes(explain),
+                geo_index=sample.geo_index,
+            )
+            if result.collscan:
+                logger.error(f"❌ {result.name}: COLLSCAN ({' > '.join(result.stages)})")
+            elif result.missing_geo_index:
+                logger.error(f"❌ {result.name}: sem o índice {GEO_INDEX_NAME} ({', '.join(result.indexes)})")
+            else:
+                logger.info(f"✅ {result.name}: {' > '.join(result.stages)}")
+            results.append(result)
+        return results
+
+    @staticmethod
+    async def assert_query_plans() -> None:
+        """
+        Falha se alguma consulta do company_service cair em COLLSCAN ou se
+        uma consulta geográfica não usar o índice location_2dsphere
+        """
+        results = await QueryPlanService.check_company_service()
+        failures = [result.name for result in results if result.failed]
+        if failures:
+            raise RuntimeError(f"Consultas sem o índice esperado: {', '.join(failures)}")
+
+
+query_plan_service = QueryPlanService()
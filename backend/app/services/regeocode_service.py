@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from bson import ObjectId
+from pydantic import BaseModel
+from pymongo import UpdateOne
+
+from app.models.company import Company, CompanyType, GeocodeStatus
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.geocode_cache import geocode_cache
+from app.services.geocoding_dispatcher import Lane
+from app.services.geocoding_service import geocoding_service
+from app.services.map_cache import map_cache
+
+logger = logging.getLogger(__name__)
+
+ADDRESS_FIELDS = ("rua", "numero", "bairro", "cidade", "uf")
+ADDRESS_PROJECTION = {
+    **{field: 1 for field in ADDRESS_FIELDS}, "company_type": 1, "is_active": 1,
+}
+
+
+class RegeocodeReport(BaseModel):
+    scanned: int = 0
+    map_entries: int = 0  # coletoras ativas entre as candidatas (candidatas ao mapa)
+    cached: int = 0  # dry-run: candidatas com resultado no cache de geocoding (sem Nominatim)
+    geocoded: int = 0
+    recovered_map_entries: int = 0
+    not_found: int = 0
+    errors: int = 0
+    changed_during_run: int = 0  # endereço alterado enquanto o bloco rodava: não gravadas
+    interrupted: bool = False  # Nominatim indisponível (circuito aberto): execução parada
+    last_id: Optional[str] = None  # checkpoint: tudo até aqui foi geocodificado e gravado
+    checkpoint_frozen: bool = False  # houve falha: o checkpoint não passa dela
+
+
+class RegeocodeService:
+    """
+    Re-geocoding em lote das empresas sem coordenadas (ou com coordenadas
+    antigas). Lê as empresas por cursor em ordem de _id, em blocos de
+    `batch_size`; cada bloco é geocodificado com concorrência limitada
+    (passando pelo cache e pela fila do Nominatim, na faixa de lote) e
+    gravado com um único bulk_write. Depois de cada bloco o último _id vai
+    para o arquivo de checkpoint, de onde a execução pode ser retomada.
+
+    Falhas transitórias (rede, timeout) não avançam o checkpoint: ele para
+    antes da primeira empresa que falhou, para a retomada tentar de novo.
+    Com o circuito do Nominatim aberto a execução para, em vez de percorrer
+    o cursor inteiro contando erros.
+    """
+
+    @staticmethod
+    def build_query(stale_days: Optional[int] = None, after_id: Optional[ObjectId] = None) -> dict:
+        conditions: List[dict] = [{"latitude": None}, {"longitude": None}]
+        if stale_days is not None:
+            conditions.append({"geocoded_at": {"$lt": datetime.utcnow() - timedelta(days=stale_days)}})
+            # Empresas antigas com coordenadas mas sem data de geocoding também são velhas
+            conditions.append({"geocoded_at": None})
+
+        query = {
+            "$or": conditions,
+            # Empresas com job pendente já estão na fila de geocoding
+            "geocode_status": {"$ne": GeocodeStatus.PENDENTE.value},
+        }
+        if after_id is not None:
+            query["_id"] = {"$gt": after_id}
+        return query
+
+    @staticmethod
+    def read_checkpoint(path: Optional[Path]) -> Optional[ObjectId]:
+        if path is None or not path.exists():
+            return None
+        return ObjectId(json.loads(path.read_text())["last_id"])
+
+    @staticmethod
+    def write_checkpoint(path: Optional[Path], last_id: ObjectId) -> None:
+        if path is None:
+            return
+        # Grava num temporário e renomeia: o checkpoint nunca fica pela metade
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps({"last_id": str(last_id), "updated_at": datetime.utcnow().isoformat()}))
+        tmp.replace(path)
+
+    @staticmethod
+    def _address(document: dict) -> dict:
+        return {field: document.get(field, "") for field in ADDRESS_FIELDS}
+
+    @staticmethod
+    def _unchanged_filter(document: dict) -> dict:
+        """
+        Só grava se o endereço ainda é o lido: uma edição no meio do bloco
+        (que também põe geocode_status em pendente) não é sobrescrita com as
+        coordenadas do endereço antigo
+        """
+        return {
+            "_id": document["_id"],
+            **{field: document.get(field) for field in ADDRESS_FIELDS},
+            "geocode_status": {"$ne": GeocodeStatus.PENDENTE.value},
+        }
+
+    @staticmethod
+    def _is_map_entry(document: dict) -> bool:
+        return document.get("is_active", True) and document.get("company_type") == CompanyType.EMPRESA_COLETORA.value
+
+    @staticmethod
+    async def _geocode_batch(
+        documents: List[dict], concurrency: int, report: RegeocodeReport
+    ) -> Tuple[List[UpdateOne], Optional[int]]:
+        """
+        Operações de escrita do bloco e a posição da primeira empresa não
+        geocodificada (falha ou deixada para trás com o circuito aberto)
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        failed: List[int] = []
+
+        async def geocode(position: int, document: dict) -> Optional[UpdateOne]:
+            async with semaphore:
+                if report.interrupted:
+                    failed.append(position)
+                    return None
+                try:
+                    coordinates = await geocoding_service.lookup_coordinates(
+                        RegeocodeService._address(document), Lane.BATCH
+                    )
+                except CircuitOpenError as e:
+                    failed.append(position)
+                    if not report.interrupted:
+                        report.interrupted = True
+                        logger.warning(f"🔌 Re-geocoding interrompido: {str(e)}")
+                    return None
+                except Exception as e:
+                    failed.append(position)
+                    report.errors += 1
+                    logger.warning(f"⚠️ Falha ao geocodificar {document['_id']}: {str(e)}")
+                    return None
+
+            update = {"geocoded_at": datetime.utcnow()}
+            if coordinates:
+                latitude, longitude = coordinates
+                report.geocoded += 1
+                if RegeocodeService._is_map_entry(document):
+                    report.recovered_map_entries += 1
+                update.update({
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "location": {"type": "Point", "coordinates": [longitude, latitude]},
+                    "geocode_status": GeocodeStatus.OK.value,
+                })
+            else:
+                report.not_found += 1
+                update["geocode_status"] = GeocodeStatus.NAO_ENCONTRADO.value
+            return UpdateOne(RegeocodeService._unchanged_filter(document), {"$set": update})
+
+        operations = await asyncio.gather(*(geocode(position, document) for position, document in enumerate(documents)))
+        return [operation for operation in operations if operation is not None], min(failed, default=None)
+
+    @staticmethod
+    async def _count_cached(documents: List[dict], report: RegeocodeReport) -> None:
+        for document in documents:
+            query = geocoding_service._build_query_string(RegeocodeService._address(document))
+            found, coordinates = await geocode_cache.get(query)
+            if found and coordinates:
+                report.cached += 1
+
+    @staticmethod
+    async def run(
+        stale_days: Optional[int] = None,
+        concurrency: int = 4,
+        batch_size: int = 100,
+        checkpoint: Optional[Path] = None,
+        dry_run: bool = False,
+    ) -> RegeocodeReport:
+        report = RegeocodeReport()
+        after_id = RegeocodeService.read_checkpoint(checkpoint)
+        if after_id is not None:
+            logger.info(f"⏩ Retomando a partir do checkpoint {after_id}")
+
+        collection = Company.get_motor_collection()
+        cursor = collection.find(
+            RegeocodeService.build_query(stale_days, after_id), ADDRESS_PROJECTION
+        ).sort("_id", 1).batch_size(batch_size)
+
+        batch: List[dict] = []
+        try:
+            async for document in cursor:
+                batch.append(document)
+                if len(batch) >= batch_size:
+                    await RegeocodeService._process_batch(batch, concurrency, checkpoint, dry_run, report)
+                    batch = []
+                    if report.interrupted:
+                        break
+            if batch and not report.interrupted:
+                await RegeocodeService._process_batch(batch, concurrency, checkpoint, dry_run, report)
+        finally:
+            await cursor.close()
+
+        if report.recovered_map_entries:
+            await map_cache.invalidate("regeocode")
+        return report
+
+    @staticmethod
+    async def _process_batch(
+        batch: List[dict],
+        concurrency: int,
+        checkpoint: Optional[Path],
+        dry_run: bool,
+        report: RegeocodeReport,
+    ) -> None:
+        report.scanned += len(batch)
+        report.map_entries += sum(1 for document in batch if RegeocodeService._is_map_entry(document))
+
+        if dry_run:
+            report.last_id = str(batch[-1]["_id"])
+            await RegeocodeService._count_cached(batch, report)
+            return
+
+        operations, first_failed = await RegeocodeService._geocode_batch(batch, concurrency, report)
+        if operations:
+            result = await Company.get_motor_collection().bulk_write(operations, ordered=False)
+            report.changed_during_run += len(operations) - result.matched_count
+
+        # Só avança até antes da primeira empresa que ficou sem geocodificar
+        if not report.checkpoint_frozen:
+            done = batch if first_failed is None else batch[:first_failed]
+            if done:
+                report.last_id = str(done[-1]["_id"])
+                RegeocodeService.write_checkpoint(checkpoint, done[-1]["_id"])
+            report.checkpoint_frozen = first_failed is not None
+        logger.info(
+            f"📍 {report.scanned} empresas lidas, {report.geocoded} geocodificadas, "
+            f"{report.not_found} sem resultado, {report.errors} erros"
+        )
+
+
+regeocode_service = RegeocodeService()
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from app.config.config import settings
+from app.models.revoked_token import RevokedToken
+from app.utils.bloom import BloomFilter
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_BLOOM_CAPACITY = 100_000
+REVOCATION_BLOOM_ERROR_RATE = 0.001
+REVOCATION_REBUILD_SECONDS = 60 * 60
+# Margem para relógios diferentes entre workers na sincronização incremental
+REVOCATION_SYNC_OVERLAP = timedelta(seconds=5)
+
+
+class RevocationStore:
+    """
+    Store de revogação de tokens: coleção revoked_tokens (fonte da verdade,
+    expirada por índice TTL) com um filtro de Bloom em memória na frente.
+
+    Na autorização de cada requisição, se a sessão (sid) não está no filtro,
+    ela não foi encerrada, sem ir ao MongoDB. Só um "talvez" (revogado de
+    fato ou falso positivo, ~0,1%) consulta a coleção.
+
+    As revogações por empresa (sub) não entram no filtro: ficam num dict
+    uuid -> revoked_at comparado direto com o iat do access token. Basta
+    guardá-las por COMPANY_ACCESS_TOKEN_EXPIRE_MINUTES, depois disso todo
+    access token anterior já expirou; o refresh token é checado na coleção.
+
+    Os outros workers recebem as revogações pela sincronização a cada
+    REVOCATION_SYNC_SECONDS. O filtro é remontado de hora em hora,
+    esquecendo as entradas expiradas.
+    """
+
+    def __init__(self):
+        self._bloom = BloomFilter(REVOCATION_BLOOM_CAPACITY, REVOCATION_BLOOM_ERROR_RATE)
+        # uuid da empresa -> revoked_at (timestamp) das revogações recentes
+        self._subjects: Dict[str, float] = {}
+        self._synced_until: Optional[datetime] = None
+        self._rebuilt_at = 0.0
+        self._sync_task: Optional[asyncio.Task] = None
+        self.checks = 0
+        self.db_checks = 0
+        self.revoked_hits = 0
+
+    @staticmethod
+    def _timestamp(value: datetime) -> float:
+        return value.replace(tzinfo=timezone.utc).timestamp()
+
+    @staticmethod
+    def _subject_window() -> float:
+        return settings.COMPANY_ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+    def _add(self, document: dict, bloom: BloomFilter, subjects: Dict[str, float]) -> None:
+        key = document["key"]
+        if not key.startswith("sub:"):
+            bloom.add(key)
+            return
+        revoked_at = self._timestamp(document["revoked_at"])
+        if revoked_at > time.time() - self._subject_window():
+            company_uuid = key[len("sub:"):]
+            subjects[company_uuid] = max(revoked_at, subjects.get(company_uuid, 0.0))
+
+    def _remember(self, document: dict) -> None:
+        self._add(document, self._bloom, self._subjects)
+
+    def _prune_subjects(self) -> None:
+        cutoff = time.time() - self._subject_window()
+        self._subjects = {uuid: revoked_at for uuid, revoked_at in self._subjects.items() if revoked_at > cutoff}
+
+    async def _upsert(self, key: str, expires_at: datetime) -> None:
+        now = datetime.utcnow()
+        await RevokedToken.get_motor_collection().update_one(
+            {"key": key},
+            {"$set": {"revoked_at": now}, "$max": {"expires_at": expires_at}},
+            upsert=True,
+        )
+        self._remember({"key": key, "revoked_at": now})
+
+    async def revoke_session(self, sid: str, expires_at: datetime) -> None:
+        """Encerra a sessão: o refresh token e os access tokens com esse sid"""
+        await self._upsert(f"sid:{sid}", expires_at)
+
+    async def revoke_subject(self, company_uuid: str) -> None:
+        """Invalida todos os tokens da empresa emitidos até agora"""
+        expires_at = datetime.utcnow() + timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES)
+        await self._upsert(f"sub:{company_uuid}", expires_at)
+
+    async def consume(self, jti: str, expires_at: datetime) -> bool:
+        """
+        Marca o refresh token como usado. False se ele já tinha sido usado
+        (inserção única no MongoDB: dois workers não aceitam o mesmo token)
+        """
+        try:
+            await RevokedToken.get_motor_collection().insert_one({
+                "key": f"jti:{jti}",
+                "revoked_at": datetime.utcnow(),
+                "expires_at": expires_at,
+            })
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def is_revoked(
+        self, sid: Optional[str], company_uuid: str, issued_at: float, check_db: bool = False
+    ) -> bool:
+        """
+        True se a sessão foi encerrada ou a empresa teve os tokens revogados
+        depois da emissão. `check_db` ignora a memória e consulta a coleção
+        (usado na rotação do refresh token, que já vai ao banco).
+        """
+        self.checks += 1
+        if check_db:
+            keys = [key for key in (f"sid:{sid}" if sid else None, f"sub:{company_uuid}") if key]
+        else:
+            # Access token: vive menos que a janela do dict, que basta para a empresa
+            revoked_at = self._subjects.get(company_uuid)
+            if revoked_at is not None and issued_at <= revoked_at:
+                self.revoked_hits += 1
+                return True
+            keys = [f"sid:{sid}"] if sid and f"sid:{sid}" in self._bloom else []
+            if not keys:
+                return False
+
+        self.db_checks += 1
+        try:
+            documents = await RevokedToken.get_motor_collection().find({"key": {"$in": keys}}).to_list(None)
+        except Exception as e:
+            # Sem como confirmar: na dúvida o token não vale
+            logger.warning(f"⚠️ Falha ao consultar revogação de tokens: {str(e)}")
+            self.revoked_hits += 1
+            return True
+
+        for document in documents:
+            if document["key"].startswith("sid:") or issued_at <= self._timestamp(document["revoked_at"]):
+                self.revoked_hits += 1
+                return True
+        return False
+
+    async def load(self) -> None:
+        """Remonta o filtro e as revogações por empresa ainda válidas"""
+        started = datetime.utcnow()
+        bloom = BloomFilter(REVOCATION_BLOOM_CAPACITY, REVOCATION_BLOOM_ERROR_RATE)
+        subjects: Dict[str, float] = {}
+        cursor = RevokedToken.get_motor_collection().find(
+            {"expires_at": {"$gt": started}}, {"key": 1, "revoked_at": 1}
+        )
+        async for document in cursor:
+            self._add(document, bloom, subjects)
+
+        self._bloom = bloom
+        self._subjects = subjects
+        self._synced_until = started
+        self._rebuilt_at = time.monotonic()
+        logger.info(
+            f"🔐 Filtro de revogação carregado: {len(bloom)} entradas, "
+            f"{len(subjects)} empresas revogadas recentemente"
+        )
+
+    async def sync(self) -> None:
+        """Adiciona as revogações feitas pelos outros workers"""
+        if self._synced_until is None or time.monotonic() - self._rebuilt_at > REVOCATION_REBUILD_SECONDS:
+            await self.load()
+            return
+
+        started = datetime.utcnow()
+        cursor = RevokedToken.get_motor_collection().find(
+            {"revoked_at": {"$gt": self._synced_until - REVOCATION_SYNC_OVERLAP}}, {"key": 1, "revoked_at": 1}
+        )
+        async for document in cursor:
+            self._remember(document)
+        self._prune_subjects()
+        self._synced_until = started
+
+    async def _run_sync(self) -> None:
+        while True:
+            await asyncio.sleep(settings.REVOCATION_SYNC_SECONDS)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao sincronizar revogações de tokens: {str(e)}")
+
+    def start_sync(self) -> None:
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self._run_sync())
+
+    async def stop_sync(self) -> None:
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+
+    def stats(self) -> dict:
+        return {
+            "bloom_entries": len(self._bloom),
+            "revoked_subjects": len(self._subjects),
+            "checks": self.checks,
+            "db_checks": self.db_checks,
+            "revoked_hits": self.revoked_hits,
+        }
+
+
+revocation_store = RevocationStore()
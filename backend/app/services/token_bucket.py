@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import time
+
+from pymongo import ReturnDocument
+
+from app.models.rate_limit import RateLimitBucket
+
+logger = logging.getLogger(__name__)
+
+
+class MongoTokenBucket:
+    """
+    Token bucket compartilhado entre processos via MongoDB.
+
+    Cada acquire() reserva atomicamente o próximo horário livre no documento
+    `key` da coleção rate_limits (find_one_and_update com pipeline, usando o
+    relógio do servidor) e dorme até ele. Com `capacity` > 1 até `capacity`
+    envios podem sair em rajada depois de um período ocioso.
+
+    Se o MongoDB não responder, cai para um bucket local deste processo.
+    """
+
+    def __init__(self, key: str, rate_per_second: float, capacity: int = 1):
+        self.key = key
+        self.interval_ms = 1000.0 / rate_per_second
+        self.capacity = capacity
+        self._local_next_slot = 0.0
+        self._local_lock = asyncio.Lock()
+        self.waits = 0
+        self.waited_seconds = 0.0
+        self.fallbacks = 0
+
+    def _reserve_pipeline(self) -> list:
+        burst_ms = (self.capacity - 1) * self.interval_ms
+        return [
+            {"$set": {
+                "checked_at": "$$NOW",
+                "slot_at": {"$max": [
+                    {"$ifNull": ["$next_slot_at", "$$NOW"]},
+                    {"$subtract": ["$$NOW", burst_ms]},
+                ]},
+            }},
+            {"$set": {"next_slot_at": {"$add": ["$slot_at", self.interval_ms]}}},
+        ]
+
+    async def _reserve_shared(self) -> float:
+        document = await RateLimitBucket.get_motor_collection().find_one_and_update(
+            {"key": self.key},
+            self._reserve_pipeline(),
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return max((document["slot_at"] - document["checked_at"]).total_seconds(), 0.0)
+
+    async def _reserve_local(self) -> float:
+        async with self._local_lock:
+            now = time.monotonic()
+            burst = (self.capacity - 1) * self.interval_ms / 1000
+            slot = max(self._local_next_slot, now - burst)
+            self._local_next_slot = slot + self.interval_ms / 1000
+            return max(slot - now, 0.0)
+
+    async def acquire(self) -> None:
+        """Espera até haver um token disponível"""
+        try:
+            delay = await self._reserve_shared()
+        except Exception as e:
+            self.fallbacks += 1
+            logger.warning(f"⚠️ Token bucket '{self.key}' sem MongoDB, usando limite local: {str(e)}")
+            delay = await self._reserve_local()
+
+        if delay > 0:
+            self.waits += 1
+            self.waited_seconds += delay
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_second": round(1000.0 / self.interval_ms, 3),
+            "capacity": self.capacity,
+            "waits": self.waits,
+            "waited_seconds": round(self.waited_seconds, 3),
+            "fallbacks": self.fallbacks,
+        }
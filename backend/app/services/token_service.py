@@ -0,0 +1,132 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from uuid import UUID, uuid4
+
+from fastapi import HTTPException
+from jose import JWTError, jwt
+
+from app.auth.auth_company import (
+    ACCESS_TOKEN_TYPE,
+    ALGORITHM,
+    REFRESH_TOKEN_TYPE,
+    create_access_token_company,
+)
+from app.config.config import settings
+from app.models.company import Company
+from app.schemas.company import CompanyPrincipal
+from app.services.revocation_store import revocation_store
+
+logger = logging.getLogger(__name__)
+
+
+class TokenService:
+    """
+    Sessões das empresas: access token curto (COMPANY_ACCESS_TOKEN_EXPIRE_MINUTES)
+    com as claims necessárias para autorizar sem ler o banco, e refresh token
+    longo (REFRESH_TOKEN_EXPIRE_MINUTES) que vale uma única vez.
+
+    Cada login abre uma sessão (`sid`). A cada /refresh o refresh token usado
+    é consumido e um novo par é emitido na mesma sessão; se um refresh token
+    já consumido aparece de novo (vazou), a sessão inteira é revogada.
+    """
+
+    def __init__(self):
+        self.issued = 0
+        self.rotated = 0
+        self.reuse_detected = 0
+
+    @staticmethod
+    def _issued_at() -> float:
+        # Em ms: a revogação por empresa compara com o instante exato da troca de senha
+        return round(time.time(), 3)
+
+    def issue(self, company, sid: Optional[str] = None) -> dict:
+        """Par access + refresh para a empresa (Company ou CompanyPrincipal)"""
+        sid = sid or uuid4().hex
+        issued_at = self._issued_at()
+        access_token = create_access_token_company(
+            company.uuid,
+            expires_delta=timedelta(minutes=settings.COMPANY_ACCESS_TOKEN_EXPIRE_MINUTES),
+            claims={
+                "type": ACCESS_TOKEN_TYPE,
+                "sid": sid,
+                "iat": issued_at,
+                "adm": company.is_admin,
+                "ctp": company.company_type.value,
+            },
+        )
+        refresh_token = jwt.encode(
+            {
+                "type": REFRESH_TOKEN_TYPE,
+                "sub": str(company.uuid),
+                "sid": sid,
+                "jti": uuid4().hex,
+                "iat": issued_at,
+                "exp": datetime.now(timezone.utc) + timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES),
+            },
+            settings.SECRET_KEY,
+            algorithm=ALGORITHM,
+        )
+        self.issued += 1
+        return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+    @staticmethod
+    def _decode_refresh(refresh_token: str) -> dict:
+        try:
+            payload = jwt.decode(refresh_token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+        if payload.get("type") != REFRESH_TOKEN_TYPE or not all(
+            payload.get(claim) for claim in ("sub", "sid", "jti", "exp")
+        ):
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+        return payload
+
+    async def rotate(self, refresh_token: str) -> dict:
+        """Troca o refresh token por um novo par; cada refresh token vale uma vez"""
+        payload = self._decode_refresh(refresh_token)
+        sid, company_id = payload["sid"], payload["sub"]
+
+        if await revocation_store.is_revoked(sid, company_id, payload.get("iat", 0), check_db=True):
+            raise HTTPException(status_code=401, detail="Session revoked")
+
+        expires_at = datetime.utcfromtimestamp(payload["exp"])
+        if not await revocation_store.consume(payload["jti"], expires_at):
+            self.reuse_detected += 1
+            logger.warning(f"🚨 Refresh token reutilizado: sessão {sid} da empresa {company_id} revogada")
+            await revocation_store.revoke_session(sid, expires_at)
+            raise HTTPException(status_code=401, detail="Session revoked")
+
+        try:
+            principal = await Company.find_one({"uuid": UUID(company_id)}, projection_model=CompanyPrincipal)
+        except ValueError:
+            principal = None
+        if principal is None:
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+        if not principal.is_active:
+            raise HTTPException(status_code=400, detail="Inactive company")
+
+        self.rotated += 1
+        return self.issue(principal, sid=sid)
+
+    async def logout(self, refresh_token: str) -> None:
+        """Encerra a sessão do refresh token (vale também para o access token dela)"""
+        payload = self._decode_refresh(refresh_token)
+        await revocation_store.revoke_session(payload["sid"], datetime.utcfromtimestamp(payload["exp"]))
+
+    async def revoke_company(self, company_uuid) -> None:
+        """Derruba todas as sessões da empresa (senha trocada, desativada, removida)"""
+        await revocation_store.revoke_subject(str(company_uuid))
+
+    def stats(self) -> dict:
+        return {
+            "issued": self.issued,
+            "rotated": self.rotated,
+            "reuse_detected": self.reuse_detected,
+            "revocation": revocation_store.stats(),
+        }
+
+
+token_service = TokenService()
@@ -0,0 +1,131 @@
+"""
+Codificador mínimo de Mapbox Vector Tiles (spec 2.1) para camadas de pontos.
+
+Só cobre o que o mapa precisa (features do tipo POINT com atributos simples),
+evitando depender de uma biblioteca de geometria completa.
+"""
+import math
+import struct
+from typing import Any, Iterable, List, Tuple
+
+MVT_EXTENT = 4096
+MVT_VERSION = 2
+GEOM_TYPE_POINT = 1
+CMD_MOVE_TO = 1
+
+# Tipos de fio do protobuf
+_VARINT = 0
+_FIXED64 = 1
+_LENGTH_DELIMITED = 2
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field: int, payload: bytes) -> bytes:
+    return _key(field, _LENGTH_DELIMITED) + _varint(len(payload)) + payload
+
+
+def _packed_field(field: int, values: Iterable[int]) -> bytes:
+    return _bytes_field(field, b"".join(_varint(v) for v in values))
+
+
+def _encode_value(value: Any) -> bytes:
+    """Mensagem Value: string (1), double (3), int (4) ou bool (7)"""
+    if isinstance(value, bool):
+        return _key(7, _VARINT) + _varint(int(value))
+    if isinstance(value, int):
+        return _key(4, _VARINT) + _varint(value & 0xFFFFFFFFFFFFFFFF)
+    if isinstance(value, float):
+        return _key(3, _FIXED64) + struct.pack("<d", value)
+    return _bytes_field(1, str(value).encode("utf-8"))
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Retorna (minLng, minLat, maxLng, maxLat) do tile z/x/y (web mercator)"""
+    n = 2 ** z
+
+    def lng(tx: int) -> float:
+        return tx / n * 360.0 - 180.0
+
+    def lat(ty: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return lng(x), lat(y + 1), lng(x + 1), lat(y)
+
+
+def project_to_tile(
+    lng: float, lat: float, z: int, x: int, y: int, extent: int = MVT_EXTENT
+) -> Tuple[int, int]:
+    """Projeta lng/lat para coordenadas inteiras dentro do tile"""
+    n = 2 ** z
+    lat_rad = math.radians(max(min(lat, 85.0511), -85.0511))
+    world_x = (lng + 180.0) / 360.0 * n
+    world_y = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n
+    return round((world_x - x) * extent), round((world_y - y) * extent)
+
+
+def encode_point_layer(
+    name: str,
+    features: List[Tuple[float, float, dict]],
+    z: int,
+    x: int,
+    y: int,
+    extent: int = MVT_EXTENT,
+) -> bytes:
+    """
+    Codifica um tile com uma única camada de pontos.
+    `features` é uma lista de (lng, lat, atributos).
+    """
+    keys: dict[str, int] = {}
+    values: dict[Any, int] = {}
+    encoded_features = []
+
+    for lng, lat, properties in features:
+        px, py = project_to_tile(lng, lat, z, x, y, extent)
+
+        tags: List[int] = []
+        for prop_key, prop_value in properties.items():
+            if prop_value is None:
+                continue
+            key_index = keys.setdefault(prop_key, len(keys))
+            # type() na chave evita colidir 1 com 1.0 e True
+            value_index = values.setdefault((type(prop_value), prop_value), len(values))
+            tags.extend((key_index, value_index))
+
+        feature = (
+            _packed_field(2, tags)
+            + _key(3, _VARINT)
+            + _varint(GEOM_TYPE_POINT)
+            + _packed_field(4, ((1 << 3) | CMD_MOVE_TO, _zigzag(px), _zigzag(py)))
+        )
+        encoded_features.append(_bytes_field(2, feature))
+
+    layer = (
+        _key(15, _VARINT)
+        + _varint(MVT_VERSION)
+        + _bytes_field(1, name.encode("utf-8"))
+        + b"".join(encoded_features)
+        + b"".join(_bytes_field(3, k.encode("utf-8")) for k in keys)
+        + b"".join(_bytes_field(4, _encode_value(v)) for _, v in values)
+        + _key(5, _VARINT)
+        + _varint(extent)
+    )
+    return _bytes_field(3, layer)
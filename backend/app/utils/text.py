@@ -0,0 +1,16 @@
+import re
+import unicodedata
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(value: str | None) -> str:
+    """
+    Normaliza texto para comparação: sem acentos, minúsculo e com espaços
+    simples. Ex.: '  São  João do Rio Vermelho ' → 'sao joao do rio vermelho'
+    """
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value)
+    without_accents = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _WHITESPACE.sub(" ", without_accents).strip().casefold()
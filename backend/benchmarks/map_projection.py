@@ -0,0 +1,150 @@
+"""
+Compara o custo por requisição do mapa com o Document completo vs. projeção.
+
+Uso (a partir de ./backend, com um MongoDB acessível):
+
+    python -m benchmarks.map_projection
+    python -m benchmarks.map_projection --url mongodb://localhost:27017 --companies 10000
+
+Sem --url usa o MONGO_HOST do .env (com TLS, como o main.py). Os dados vão
+para um banco temporário "<MONGO_DB>_bench", que é apagado no final.
+"""
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Awaitable, Callable
+from uuid import uuid4
+
+import bson
+import certifi
+from bson import Binary
+from beanie import init_beanie
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.models.company import Company, Companycolectortags
+from app.schemas.company import CompanyMapFilter, CompanyMapProjection
+from app.services.company_service import CompanyService
+
+TAGS = [tag.value for tag in Companycolectortags]
+
+
+def make_documents(total: int) -> list[dict]:
+    random.seed(42)
+    documents = []
+    for i in range(total):
+        lat = random.uniform(-33.0, 5.0)
+        lng = random.uniform(-73.0, -35.0)
+        documents.append({
+            "uuid": Binary.from_uuid(uuid4()),
+            "cnpj": f"{i:014d}",
+            "email": f"empresa{i}@bench.com",
+            "nome": f"Empresa {i}",
+            "telefone": "81999999999",
+            # hash bcrypt de tamanho real, que a versão completa carrega à toa
+            "hashed_password": "$2b$12$" + "x" * 53,
+            "company_type": "coletora",
+            "company_description": "Coleta de eletrônicos " * 5,
+            "company_colector_tags": random.sample(TAGS, k=random.randint(1, len(TAGS))),
+            "company_photo_url": f"https://cdn.example.com/fotos/{i}.png",
+            "cep": "50000-000",
+            "rua": "Rua do Benchmark",
+            "numero": str(i),
+            "bairro": "Centro",
+            "cidade": "Recife",
+            "uf": "PE",
+            "complemento": None,
+            "referencia": None,
+            "latitude": lat,
+            "longitude": lng,
+            "location": {"type": "Point", "coordinates": [lng, lat]},
+            "is_active": True,
+            "is_admin": False,
+            "rating_average": round(random.uniform(1, 5), 2),
+            "total_ratings": random.randint(0, 200),
+            "total_points": 0,
+            "total_rewards_redeemed": 0,
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow(),
+        })
+    return documents
+
+
+async def measure(label: str, rounds: int, run: Callable[[], Awaitable[int]]) -> None:
+    results = await run()  # aquecimento
+
+    tracemalloc.start()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(rounds):
+        results = await run()
+    cpu = (time.process_time() - cpu_start) / rounds
+    wall = (time.perf_counter() - wall_start) / rounds
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{label:<32} {results:>6} itens | CPU {cpu * 1000:8.1f} ms/req | "
+        f"wall {wall * 1000:8.1f} ms/req | pico de memória {peak / 1024 / 1024:7.1f} MiB"
+    )
+
+
+async def run(client: AsyncIOMotorClient, database_name: str, total: int, rounds: int) -> None:
+    database = client[database_name]
+    await init_beanie(database=database, document_models=[Company])
+    await Company.get_motor_collection().delete_many({})
+    await Company.get_motor_collection().insert_many(make_documents(total))
+
+    filter_data = CompanyMapFilter()
+    query = CompanyService._build_map_query(filter_data)
+    query["location"] = {"$ne": None}
+
+    async def payload_sizes() -> tuple[int, int]:
+        collection = Company.get_motor_collection()
+        projection = {field: 1 for field in CompanyMapProjection.model_fields}
+        full = sum([len(bson.encode(doc)) async for doc in collection.find(query)])
+        projected = sum([len(bson.encode(doc)) async for doc in collection.find(query, projection)])
+        return full, projected
+
+    full, projected = await payload_sizes()
+    print(f"Payload BSON: completo {full / 1024:.0f} KiB, projeção {projected / 1024:.0f} KiB")
+
+    async def full_documents() -> int:
+        companies = await Company.find(query).to_list()
+        return len([CompanyService._to_map_simple_out(c) for c in companies])
+
+    async def projection() -> int:
+        # Direto no MongoDB: get_companies_for_map_simple responderia do snapshot em memória
+        companies, _ = await CompanyService._query_map_companies(filter_data)
+        return len([CompanyService._to_map_simple_out(c, distance_km) for c, distance_km in companies])
+
+    try:
+        await measure("Document completo", rounds, full_documents)
+        await measure("Projeção (CompanyMapProjection)", rounds, projection)
+    finally:
+        await client.drop_database(database_name)
+        client.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--url", help="MongoDB URL (padrão: MONGO_HOST do .env)")
+    parser.add_argument("--companies", type=int, default=10_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    from app.config.config import settings
+
+    if args.url:
+        client = AsyncIOMotorClient(args.url)
+    else:
+        client = AsyncIOMotorClient(settings.MONGO_HOST, tls=True, tlsCAFile=certifi.where())
+    asyncio.run(run(client, f"{settings.MONGO_DB}_bench", args.companies, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -36,13 +36,21 @@ async def test_register_company_success(monkeypatch):
     async def fake_save(self):
         return self
 
-    async def fake_get_coords(address):
-        return (-8.05, -34.9)
+    enqueued = []
+
+    async def fake_enqueue(company_uuid):
+        enqueued.append(company_uuid)
+
+    async def fake_get_codigo_municipio(uf, cidade, fetch=True):
+        # a requisição não chama o IBGE: só o snapshot
+        assert fetch is False
+        return "2611606"
 
     monkeypatch.setattr(mod.models.Company, "find_one", fake_find_one)
     monkeypatch.setattr(mod.models.Company, "create", fake_create)
     monkeypatch.setattr(mod.models.Company, "save", fake_save)
-    monkeypatch.setattr(mod.geocoding_service, "get_coordinates_from_address", fake_get_coords)
+    monkeypatch.setattr(mod.geocode_job_service, "enqueue", fake_enqueue)
+    monkeypatch.setattr(mod.ibge_service, "get_codigo_municipio", fake_get_codigo_municipio)
 
     from app.schemas.company import CompanyCreate
     payload = CompanyCreate(
@@ -69,9 +77,86 @@ async def test_register_company_success(monkeypatch):
     result = await mod.register_company(payload)
     assert result.nome == "Eco"
     assert result.cnpj == "96.534.094/0001-58"
-    assert result.latitude == -8.05
-    assert result.longitude == -34.9
+    # Geocoding fica para o job em segundo plano
+    assert result.latitude is None
+    assert result.geocode_status == "pendente"
+    assert enqueued == [result.uuid]
+
+
+
+async def test_geocode_job_retries_then_marks_failed(monkeypatch):
+    import httpx
+    from uuid import uuid4
+    from bson import Binary
+    from app.services import geocode_job_service as jobs_mod
+
+    service = jobs_mod.GeocodeJobService()
+    company = SimpleNamespace(uuid=uuid4(), rua="R", numero="1", bairro="B", cidade="Recife", uf="PE")
+    calls = []
+
+    async def fake_find_one(query):
+        return company
+
+    async def failing_lookup(address, lane):
+        # job em segundo plano não disputa a fila com quem está esperando
+        assert lane == jobs_mod.Lane.BATCH
+        raise httpx.ConnectError("offline")
+
+    async def fake_retry_later(job, error):
+        calls.append(("retry", job["attempts"]))
+        return True
+
+    async def fake_finish(job, status, error=None):
+        calls.append(("finish", status.value))
+        return True
+
+    async def fake_apply(company, coordinates, status):
+        calls.append(("apply", status.value))
 
+    monkeypatch.setattr(jobs_mod.Company, "find_one", fake_find_one)
+    monkeypatch.setattr(jobs_mod.geocoding_service, "lookup_coordinates", failing_lookup)
+    monkeypatch.setattr(service, "_retry_later", fake_retry_later)
+    monkeypatch.setattr(service, "_finish", fake_finish)
+    monkeypatch.setattr(service, "_apply", fake_apply)
+    monkeypatch.setattr(jobs_mod.settings, "GEOCODE_JOB_MAX_ATTEMPTS", 2)
+
+    job = {"_id": 1, "revision": 1, "company_uuid": Binary.from_uuid(company.uuid)}
+    await service.process({**job, "attempts": 1})
+    await service.process({**job, "attempts": 2})
+
+    assert calls == [("retry", 1), ("finish", "failed"), ("apply", "falhou")]
+    assert service.stats()["retried"] == 1
+    assert service.stats()["failed"] == 1
+
+
+async def test_geocode_job_resolves_missing_codigo_ibge(monkeypatch):
+    from uuid import uuid4
+    from app.services import geocode_job_service as jobs_mod
+
+    updates = []
+    lookups = []
+
+    def fake_find_one(query):
+        async def update(change):
+            updates.append(change["$set"])
+        return SimpleNamespace(update=update)
+
+    async def fake_get_codigo_municipio(uf, cidade, fetch=True):
+        lookups.append((uf, cidade, fetch))
+        return "2611606"
+
+    monkeypatch.setattr(jobs_mod.Company, "find_one", fake_find_one)
+    monkeypatch.setattr(jobs_mod.ibge_service, "get_codigo_municipio", fake_get_codigo_municipio)
+
+    company = SimpleNamespace(uuid=uuid4(), uf="PE", cidade="Recife", codigo_ibge=None, is_coletora=lambda: False)
+    await jobs_mod.GeocodeJobService._apply(company, (-8.05, -34.9), jobs_mod.GeocodeStatus.OK)
+    assert updates[-1]["codigo_ibge"] == "2611606"
+    assert lookups == [("PE", "Recife", True)]
+
+    # já resolvido na requisição: nada a buscar
+    company.codigo_ibge = "2611606"
+    await jobs_mod.GeocodeJobService._apply(company, None, jobs_mod.GeocodeStatus.NAO_ENCONTRADO)
+    assert "codigo_ibge" not in updates[-1] and len(lookups) == 1
 
 
 # ========================
@@ -112,7 +197,7 @@ async def test_get_companies(monkeypatch):
         return make_company(is_admin=True)
 
     monkeypatch.setattr(mod.models.Company, "find", fake_find)
-    monkeypatch.setattr(mod, "get_current_active_admin_company", fake_admin)
+    monkeypatch.setattr(mod, "get_current_active_admin_principal", fake_admin)
 
     result = await mod.get_companies(admin_company=fake_admin())
     assert len(result) == 2
@@ -135,3 +220,153 @@ async def test_delete_me(monkeypatch):
 
 
 
+
+
+async def test_regeocode_query_and_checkpoint(tmp_path):
+    from bson import ObjectId
+    from app.services.regeocode_service import RegeocodeService
+
+    query = RegeocodeService.build_query(stale_days=30)
+    assert {"latitude": None} in query["$or"]
+    assert any("$lt" in (c.get("geocoded_at") or {}) for c in query["$or"])
+    # empresas antigas, com coordenadas mas sem geocoded_at
+    assert {"geocoded_at": None} in query["$or"]
+    assert {"geocoded_at": None} not in RegeocodeService.build_query()["$or"]
+    assert query["geocode_status"] == {"$ne": "pendente"}
+
+    checkpoint = tmp_path / "regeocode.json"
+    assert RegeocodeService.read_checkpoint(checkpoint) is None
+    last_id = ObjectId()
+    RegeocodeService.write_checkpoint(checkpoint, last_id)
+    assert RegeocodeService.read_checkpoint(checkpoint) == last_id
+    assert RegeocodeService.build_query(after_id=last_id)["_id"] == {"$gt": last_id}
+
+
+async def test_regeocode_update_only_applies_to_unchanged_address(monkeypatch):
+    from bson import ObjectId
+    from app.services import regeocode_service as regeo_mod
+
+    async def fake_lookup(address, lane):
+        return (-8.05, -34.9)
+
+    monkeypatch.setattr(regeo_mod.geocoding_service, "lookup_coordinates", fake_lookup)
+    document = {
+        "_id": ObjectId(), "rua": "Rua A", "numero": "1", "cidade": "Recife", "uf": "PE",
+        "company_type": "coletora", "is_active": True,
+    }
+    report = regeo_mod.RegeocodeReport()
+
+    (operation,), first_failed = await regeo_mod.RegeocodeService._geocode_batch([document], 1, report)
+    assert first_failed is None
+    assert operation._filter == {
+        "_id": document["_id"], "rua": "Rua A", "numero": "1", "bairro": None,
+        "cidade": "Recife", "uf": "PE", "geocode_status": {"$ne": "pendente"},
+    }
+    assert operation._doc["$set"]["geocode_status"] == "ok"
+    assert report.recovered_map_entries == 1
+
+
+class FakeRegeocodeCompanies:
+    """Coleção companies para o re-geocoding: cursor em ordem de _id e bulk_write."""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.written = []
+
+    def find(self, query, projection):
+        documents = [d for d in self.documents if "_id" not in query or d["_id"] > query["_id"]["$gt"]]
+
+        class Cursor:
+            def sort(self, *args):
+                return self
+
+            def batch_size(self, size):
+                return self
+
+            def __aiter__(self):
+                async def iterate():
+                    for document in documents:
+                        yield document
+                return iterate()
+
+            async def close(self):
+                pass
+
+        return Cursor()
+
+    async def bulk_write(self, operations, ordered=True):
+        self.written.extend(operation._filter["_id"] for operation in operations)
+        return SimpleNamespace(matched_count=len(operations))
+
+
+@pytest.mark.parametrize("failure, interrupted, looked_up", [
+    # erro transitório: segue, mas o checkpoint fica antes da empresa que falhou
+    ("timeout", False, 6),
+    # circuito aberto: para no bloco em que abriu
+    ("circuito", True, 4),
+])
+async def test_regeocode_checkpoint_stops_before_failures(monkeypatch, tmp_path, failure, interrupted, looked_up):
+    from bson import ObjectId
+    from app.services import regeocode_service as regeo_mod
+    from app.services.circuit_breaker import CircuitOpenError
+
+    documents = [{"_id": ObjectId(), "rua": f"Rua {i}", "cidade": "Recife", "uf": "PE"} for i in range(6)]
+    collection = FakeRegeocodeCompanies(documents)
+    calls = []
+
+    async def fake_lookup(address, lane):
+        calls.append(address["rua"])
+        if address["rua"] == "Rua 3":
+            raise CircuitOpenError("nominatim") if failure == "circuito" else TimeoutError()
+        return (-8.05, -34.9)
+
+    monkeypatch.setattr(regeo_mod.Company, "get_motor_collection", classmethod(lambda cls: collection))
+    monkeypatch.setattr(regeo_mod.geocoding_service, "lookup_coordinates", fake_lookup)
+    checkpoint = tmp_path / "regeocode.json"
+
+    report = await regeo_mod.RegeocodeService.run(concurrency=1, batch_size=2, checkpoint=checkpoint)
+
+    assert report.interrupted is interrupted
+    assert len(calls) == looked_up
+    assert documents[3]["_id"] not in collection.written and documents[2]["_id"] in collection.written
+    # a retomada começa pela empresa que falhou
+    assert regeo_mod.RegeocodeService.read_checkpoint(checkpoint) == documents[2]["_id"]
+    assert report.last_id == str(documents[2]["_id"])
+
+
+async def test_cnpj_validator_checks_digits_and_caches(monkeypatch):
+    from app.services import cnpj_validator as cnpj_mod
+
+    calls = []
+
+    class FakeClient:
+        async def get(self, url):
+            calls.append(url)
+            status = 200 if url.endswith("96534094000158") else 404
+            return SimpleNamespace(status_code=status, json=lambda: {"razao_social": "Eco Teste LTDA"})
+
+    stored = {}
+
+    async def fake_cache_get(self, cnpj):
+        return self.memory.get(cnpj) or stored.get(cnpj)
+
+    async def fake_cache_set(self, cnpj, result):
+        self.memory.set(cnpj, result)
+        stored[cnpj] = result
+
+    monkeypatch.setattr(cnpj_mod.http_clients, "get", lambda name: FakeClient())
+    monkeypatch.setattr(cnpj_mod.CNPJValidator, "_cache_get", fake_cache_get)
+    monkeypatch.setattr(cnpj_mod.CNPJValidator, "_cache_set", fake_cache_set)
+    validator = cnpj_mod.CNPJValidator()
+
+    # dígito verificador errado: nem chega na API
+    result = await validator.validate("96.534.094/0001-59")
+    assert result["valid"] is False and "verificadores" in result["error"]
+    assert calls == []
+
+    assert (await validator.validate("96.534.094/0001-58"))["company_name"] == "Eco Teste LTDA"
+    assert (await validator.validate("96534094000158"))["valid"] is True
+    assert (await validator.validate("11.222.333/0001-81"))["valid"] is False
+    assert (await validator.validate("11222333000181"))["valid"] is False
+    assert len(calls) == 2
+    assert validator.stats()["local_rejections"] == 1
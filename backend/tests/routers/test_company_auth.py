@@ -1,6 +1,5 @@
 import pytest
 import asyncio
-from datetime import timedelta
 from types import SimpleNamespace
 from fastapi import HTTPException
 
@@ -13,38 +12,67 @@ pytestmark = pytest.mark.asyncio
 
 def make_company(uuid="11111111-1111-1111-1111-111111111111", is_active=True):
     """Objeto simples com os atributos usados nos endpoints."""
-    return SimpleNamespace(uuid=uuid, is_active=is_active)
+    from app.models.company import CompanyType
+    return SimpleNamespace(uuid=uuid, is_active=is_active, is_admin=False, company_type=CompanyType.EMPRESA_COLETORA)
+
+
+def make_request(ip="10.0.0.1"):
+    """Request mínimo para as rotas que leem o IP do cliente."""
+    from fastapi import Request
+    return Request({"type": "http", "headers": [], "client": (ip, 50000)})
+
+
+class FakeRevocationStore:
+    """Store de revogação em memória, no lugar da coleção revoked_tokens."""
+
+    def __init__(self):
+        self.used = set()
+        self.sessions = set()
+
+    async def is_revoked(self, sid, company_uuid, issued_at, check_db=False):
+        return sid in self.sessions
+
+    async def consume(self, jti, expires_at):
+        if jti in self.used:
+            return False
+        self.used.add(jti)
+        return True
+
+    async def revoke_session(self, sid, expires_at):
+        self.sessions.add(sid)
 
 
 # --- Testes ---
 async def test_login_access_token_success(monkeypatch):
     """
-    Caso feliz: authenticate_company retorna company ativo e create_access_token_company
-    retorna token. login_access_token deve devolver dict com access_token e token_type.
+    Caso feliz: authenticate_company retorna company ativo. login_access_token deve
+    devolver access token curto com as claims da empresa e refresh token da mesma sessão.
     """
-  
+    from jose import jwt
+    from app.config.config import settings
+
     mod = __import__(MODULE_PATH, fromlist=["*"])
 
     async def fake_authenticate_company(username, password):
         return make_company()
 
-    def fake_create_access_token_company(uuid, expires_delta=None):
-        # verificar que expires_delta é um timedelta
-        assert isinstance(expires_delta, timedelta)
-        return "fake-company-token"
-
     monkeypatch.setattr(mod, "authenticate_company", fake_authenticate_company)
-    monkeypatch.setattr(mod, "create_access_token_company", fake_create_access_token_company)
 
     from fastapi.security import OAuth2PasswordRequestForm
 
     form = OAuth2PasswordRequestForm(username="any", password="any", scope="", grant_type="", client_id=None, client_secret=None)
 
-    result = await mod.login_access_token(form)
+    result = await mod.login_access_token(make_request(), form)
     assert isinstance(result, dict)
-    assert result["access_token"] == "fake-company-token"
     assert result["token_type"] == "bearer"
 
+    access = jwt.decode(result["access_token"], settings.SECRET_KEY, algorithms=["HS256"])
+    refresh = jwt.decode(result["refresh_token"], settings.SECRET_KEY, algorithms=["HS256"])
+    assert access["type"] == "access" and refresh["type"] == "refresh"
+    assert access["sid"] == refresh["sid"]
+    assert access["ctp"] == "coletora" and access["adm"] is False
+    assert access["exp"] - access["iat"] <= settings.COMPANY_ACCESS_TOKEN_EXPIRE_MINUTES * 60 + 1
+
 
 async def test_login_access_token_incorrect_credentials(monkeypatch):
     """
@@ -62,7 +90,7 @@ async def test_login_access_token_incorrect_credentials(monkeypatch):
     form = OAuth2PasswordRequestForm(username="bad", password="bad", scope="", grant_type="", client_id=None, client_secret=None)
 
     with pytest.raises(HTTPException) as excinfo:
-        await mod.login_access_token(form)
+        await mod.login_access_token(make_request(), form)
     assert excinfo.value.status_code == 400
     assert "Incorrect" in str(excinfo.value.detail) or "email" in str(excinfo.value.detail)
 
@@ -83,7 +111,7 @@ async def test_login_access_token_inactive_company(monkeypatch):
     form = OAuth2PasswordRequestForm(username="any", password="any", scope="", grant_type="", client_id=None, client_secret=None)
 
     with pytest.raises(HTTPException) as excinfo:
-        await mod.login_access_token(form)
+        await mod.login_access_token(make_request(), form)
     assert excinfo.value.status_code == 400
     assert "Inactive" in str(excinfo.value.detail)
 
@@ -100,38 +128,323 @@ async def test_test_token_returns_company_direct_call():
     assert returned is fake
 
 
-async def test_refresh_token_success_and_inactive(monkeypatch):
+async def test_refresh_token_rotates_and_revokes_session_on_reuse(monkeypatch):
     """
-    Verifica refresh_token para company ativa (retorna token) e inativa (lança HTTPException).
-    A dependência get_current_company_from_cookie é substituída por uma função que retorna o company.
+    /refresh troca o refresh token por um novo par na mesma sessão; reusar o antigo
+    revoga a sessão inteira, e empresa inativa não renova.
     """
-    mod = __import__(MODULE_PATH, fromlist=["*"])
+    from app.schemas.tokens import RefreshTokenRequest
+    from app.services import token_service as token_module
 
-    # Caso sucesso
-    async def fake_get_current_company_from_cookie_active():
-        return make_company()
+    mod = __import__(MODULE_PATH, fromlist=["*"])
+    store = FakeRevocationStore()
+    rows = {"is_active": True}
 
-    def fake_create_access_token_company(uuid, expires_delta=None):
-        assert isinstance(expires_delta, timedelta)
-        return "new-refresh-token"
+    async def fake_find_one(query, projection_model=None):
+        return projection_model(uuid=query["uuid"], company_type="coletora", **rows)
 
-    monkeypatch.setattr(mod, "get_current_company_from_cookie", fake_get_current_company_from_cookie_active)
-    monkeypatch.setattr(mod, "create_access_token_company", fake_create_access_token_company)
+    monkeypatch.setattr(token_module, "revocation_store", store)
+    monkeypatch.setattr(token_module.Company, "find_one", fake_find_one)
 
-    result = await mod.refresh_token() 
-    assert isinstance(result, dict)
-    assert result["access_token"] == "new-refresh-token"
-    assert result["token_type"] == "bearer"
+    first = token_module.token_service.issue(make_company())
+    second = await mod.refresh_token(RefreshTokenRequest(refresh_token=first["refresh_token"]))
+    assert second["refresh_token"] != first["refresh_token"]
 
-  
-    async def fake_get_current_company_from_cookie_inactive():
-        return make_company(is_active=False)
+    # reuso do refresh token já trocado: sessão revogada, inclusive o par novo
+    with pytest.raises(HTTPException) as excinfo:
+        await mod.refresh_token(RefreshTokenRequest(refresh_token=first["refresh_token"]))
+    assert excinfo.value.status_code == 401
+    with pytest.raises(HTTPException) as excinfo:
+        await mod.refresh_token(RefreshTokenRequest(refresh_token=second["refresh_token"]))
+    assert excinfo.value.status_code == 401
 
-    monkeypatch.setattr(mod, "get_current_company_from_cookie", fake_get_current_company_from_cookie_inactive)
+    rows["is_active"] = False
+    other = token_module.token_service.issue(make_company())
     with pytest.raises(HTTPException) as excinfo:
-        await mod.refresh_token()
+        await mod.refresh_token(RefreshTokenRequest(refresh_token=other["refresh_token"]))
     assert excinfo.value.status_code == 400
     assert "Inactive" in str(excinfo.value.detail)
 
+    # access token não serve como refresh token
+    with pytest.raises(HTTPException) as excinfo:
+        await mod.refresh_token(RefreshTokenRequest(refresh_token=other["access_token"]))
+    assert excinfo.value.status_code == 401
+
+
+async def test_access_token_claims_authorize_without_database(monkeypatch):
+    from app.auth import auth_company
+    from app.services.revocation_store import RevocationStore
+    from app.services.token_service import token_service
+
+    async def fail_find_one(*args, **kwargs):
+        raise AssertionError("principal de access token novo não deve ler o MongoDB")
+
+    # filtro vazio: nenhuma revogação, nenhuma consulta
+    monkeypatch.setattr(auth_company, "revocation_store", RevocationStore())
+    monkeypatch.setattr(auth_company.Company, "find_one", fail_find_one)
+
+    tokens = token_service.issue(make_company())
+    principal = await auth_company.get_current_principal(tokens["access_token"])
+    assert principal.is_coletora() and not principal.is_admin
+
+    with pytest.raises(HTTPException) as excinfo:
+        await auth_company.get_current_principal(tokens["refresh_token"])
+    assert excinfo.value.status_code == 401
+
+    class RevokedStore:
+        async def is_revoked(self, sid, company_uuid, issued_at, check_db=False):
+            return True
+
+    monkeypatch.setattr(auth_company, "revocation_store", RevokedStore())
+    with pytest.raises(HTTPException) as excinfo:
+        await auth_company.get_current_principal(tokens["access_token"])
+    assert excinfo.value.status_code == 401
+
+
+class FakeRevokedTokens:
+    """Coleção revoked_tokens em memória; conta as consultas de autorização."""
+
+    def __init__(self, documents=()):
+        self.documents = {document["key"]: document for document in documents}
+        self.queries = []
+
+    async def update_one(self, query, change, upsert=False):
+        self.documents[query["key"]] = {"key": query["key"], **change["$set"]}
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        documents = list(self.documents.values())
+
+        class Cursor:
+            async def to_list(self, length):
+                return documents
+
+            def __aiter__(self):
+                async def iterate():
+                    for document in documents:
+                        yield document
+                return iterate()
+
+        return Cursor()
+
+
+async def test_subject_revocation_is_checked_in_memory_for_access_tokens(monkeypatch):
+    import time
+    from datetime import datetime
+    from app.config.config import settings
+    from app.models.revoked_token import RevokedToken
+    from app.services.revocation_store import RevocationStore
+
+    company_uuid = "11111111-1111-1111-1111-111111111111"
+    collection = FakeRevokedTokens()
+    monkeypatch.setattr(RevokedToken, "get_motor_collection", classmethod(lambda cls: collection))
+    store = RevocationStore()
+
+    issued_before = time.time() - 1
+    await store.revoke_subject(company_uuid)
+    assert await store.is_revoked("sessao", company_uuid, issued_before)
+    assert not await store.is_revoked("sessao", company_uuid, time.time() + 1)
+    assert not await store.is_revoked("sessao", "outra-empresa", issued_before)
+    # nada disso foi ao MongoDB, nem entrou no filtro de Bloom
+    assert collection.queries == [] and f"sub:{company_uuid}" not in store._bloom
+
+    # refresh token: sempre na coleção
+    assert await store.is_revoked("sessao", company_uuid, issued_before, check_db=True)
+    assert len(collection.queries) == 1
+
+    # revogação mais antiga que o access token: esquecida ao recarregar
+    window = settings.COMPANY_ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    old = datetime.utcfromtimestamp(time.time() - window - 60)
+    collection.documents = {
+        f"sub:{company_uuid}": {"key": f"sub:{company_uuid}", "revoked_at": old},
+        "sub:recente": {"key": "sub:recente", "revoked_at": datetime.utcnow()},
+    }
+    await store.load()
+    assert not await store.is_revoked(None, company_uuid, time.time() - window - 120)
+    assert await store.is_revoked(None, "recente", issued_before)
+    assert store.stats()["revoked_subjects"] == 1
+
+
+async def test_untyped_tokens_are_revoked_with_the_company(monkeypatch):
+    from uuid import uuid4
+    from app.auth import auth_company
+    from app.models.revoked_token import RevokedToken
+    from app.services.principal_cache import principal_cache
+    from app.services.revocation_store import RevocationStore
+
+    company_uuid = uuid4()
+    collection = FakeRevokedTokens()
+    store = RevocationStore()
+
+    async def fake_find_one(query, projection_model=None):
+        return projection_model(uuid=company_uuid, company_type="coletora", is_active=True)
+
+    monkeypatch.setattr(RevokedToken, "get_motor_collection", classmethod(lambda cls: collection))
+    monkeypatch.setattr(auth_company, "revocation_store", store)
+    monkeypatch.setattr(auth_company.Company, "find_one", fake_find_one)
+
+    # token antigo: sem type, sid nem iat
+    token = auth_company.create_access_token_company(company_uuid)
+    assert (await auth_company.get_current_principal(token)).uuid == company_uuid
+    assert collection.queries == [{"key": {"$in": [f"sub:{company_uuid}"]}}]
+
+    # revogação já fora da memória (mais de 15 min): a coleção ainda derruba o token
+    await store.revoke_subject(str(company_uuid))
+    store._subjects.clear()
+    with pytest.raises(HTTPException) as excinfo:
+        await auth_company.get_current_principal(token)
+    assert excinfo.value.status_code == 401
+    principal_cache.invalidate(company_uuid)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    from app.utils.bloom import BloomFilter
+
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f"sid:{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
 
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"sub:{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+    assert len(bloom) == 1000
 
+
+async def test_password_hash_pool_runs_off_loop_and_rejects_when_saturated():
+    import threading
+    from app.auth.auth_company import get_hashed_password, verify_password
+    from app.services.password_hasher import PasswordHashPool
+
+    pool = PasswordHashPool(workers=1, max_pending=1)
+    hashed = await pool.run(get_hashed_password, "segredo123")
+    assert await pool.run(verify_password, "segredo123", hashed) is True
+
+    release = threading.Event()
+    busy = asyncio.create_task(pool.run(release.wait))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as excinfo:
+        await pool.run(verify_password, "segredo123", hashed)
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.headers["Retry-After"] == "1"
+
+    release.set()
+    await busy
+    stats = pool.stats()
+    assert stats["rejected"] == 1 and stats["completed"] == 3 and stats["pending"] == 0
+    pool.shutdown()
+
+
+async def test_current_principal_is_cached_and_invalidated(monkeypatch):
+    from uuid import uuid4
+    from app.auth import auth_company
+    from app.schemas.company import CompanyPrincipal
+    from app.services.principal_cache import principal_cache
+
+    company_uuid = uuid4()
+    rows = {"is_active": True}
+    calls = []
+
+    async def fake_find_one(query, projection_model=None):
+        calls.append(query)
+        return projection_model(uuid=company_uuid, company_type="coletora", **rows)
+
+    monkeypatch.setattr(auth_company.Company, "find_one", fake_find_one)
+    monkeypatch.setattr(auth_company, "revocation_store", FakeRevocationStore())
+    token = auth_company.create_access_token_company(company_uuid)
+
+    principal = await auth_company.get_current_principal(token)
+    assert isinstance(principal, CompanyPrincipal) and principal.is_coletora()
+    assert await auth_company.get_current_principal(token) is principal
+    assert len(calls) == 1
+
+    # desativada: o hook do Company invalida e a próxima requisição relê
+    rows["is_active"] = False
+    principal_cache.invalidate(company_uuid)
+    with pytest.raises(HTTPException) as excinfo:
+        auth_company.get_current_active_principal(await auth_company.get_current_principal(token))
+    assert excinfo.value.status_code == 400
+    assert len(calls) == 2
+
+    with pytest.raises(HTTPException) as excinfo:
+        await auth_company.get_current_principal("token-invalido")
+    assert excinfo.value.status_code == 401
+    principal_cache.invalidate(company_uuid)
+
+
+async def test_login_throttle_rejects_before_authenticating(monkeypatch):
+    from fastapi.security import OAuth2PasswordRequestForm
+    from app.services.login_throttle import LoginThrottle
+
+    mod = __import__(MODULE_PATH, fromlist=["*"])
+    attempts = []
+
+    async def fake_authenticate_company(username, password):
+        attempts.append(username)
+        return None
+
+    monkeypatch.setattr(mod, "authenticate_company", fake_authenticate_company)
+    monkeypatch.setattr(mod, "login_throttle", LoginThrottle("login", window_seconds=60, max_per_ip=5, max_per_email=3))
+
+    form = OAuth2PasswordRequestForm(username="Alvo@Empresa.com", password="errada", scope="", grant_type="", client_id=None, client_secret=None)
+    for _ in range(3):
+        with pytest.raises(HTTPException) as excinfo:
+            await mod.login_access_token(make_request(), form)
+        assert excinfo.value.status_code == 400
+
+    # 4ª tentativa no mesmo email (outro IP): 429 sem chegar ao banco nem ao bcrypt
+    with pytest.raises(HTTPException) as excinfo:
+        await mod.login_access_token(make_request("10.0.0.2"), form)
+    assert excinfo.value.status_code == 429
+    assert int(excinfo.value.headers["Retry-After"]) >= 1
+    assert len(attempts) == 3
+
+    # limite por IP vale para emails diferentes
+    for i in range(2):
+        with pytest.raises(HTTPException):
+            await mod.login_access_token(make_request(), OAuth2PasswordRequestForm(
+                username=f"outro{i}@empresa.com", password="x", scope="", grant_type="", client_id=None, client_secret=None
+            ))
+    with pytest.raises(HTTPException) as excinfo:
+        await mod.login_access_token(make_request(), OAuth2PasswordRequestForm(
+            username="mais-um@empresa.com", password="x", scope="", grant_type="", client_id=None, client_secret=None
+        ))
+    assert excinfo.value.status_code == 429
+    assert len(attempts) == 5
+
+
+class FakeThrottleCounters:
+    """Coleção throttle_counters em memória (key -> documento)."""
+
+    def __init__(self):
+        self.documents = {}
+
+    async def find_one_and_update(self, query, change, upsert=False, return_document=None):
+        document = self.documents.setdefault(query["key"], {"key": query["key"], **change["$setOnInsert"]})
+        for field, amount in change["$inc"].items():
+            document[field] = document.get(field, 0) + amount
+        return dict(document)
+
+    async def find_one(self, query):
+        return self.documents.get(query["key"])
+
+
+async def test_shared_login_throttle_adds_up_hits_across_workers(monkeypatch):
+    from app.models.throttle_counter import ThrottleCounter
+    from app.services import login_throttle as throttle_mod
+
+    collection = FakeThrottleCounters()
+    monkeypatch.setattr(ThrottleCounter, "get_motor_collection", classmethod(lambda cls: collection))
+    monkeypatch.setattr(throttle_mod.settings, "THROTTLE_SHARED", True)
+    monkeypatch.setattr(throttle_mod.time, "time", lambda: 6000.0)
+
+    # dois workers, cada um com a própria contagem local
+    workers = [throttle_mod.LoginThrottle("login", window_seconds=60, max_per_ip=10, max_per_email=3) for _ in range(2)]
+    for worker in (0, 1, 0):
+        await workers[worker].hit(None, "alvo@empresa.com")
+    assert collection.documents["login:email:alvo@empresa.com:100"]["hits"] == 3
+
+    with pytest.raises(HTTPException) as excinfo:
+        await workers[1].hit(None, "alvo@empresa.com")
+    assert excinfo.value.status_code == 429
@@ -1,6 +1,15 @@
 import pytest
 from types import SimpleNamespace
-from app.schemas.company import CompanyMapFilter, CompanyMapOut, CompanyMapSimpleOut
+from uuid import uuid4
+from app.schemas.company import (
+    CompanyMapFilter,
+    CompanyMapOut,
+    CompanyMapSimpleOut,
+    CompanyMapViewportOut,
+    CompanyMapClusterOut,
+    CompanyMapClustersOut,
+    TagMatch,
+)
 from app.models.company import CompanyType
 from fastapi import HTTPException
 
@@ -64,7 +73,7 @@ async def test_get_companies_for_map(monkeypatch):
         return [make_company_map_out()]
 
     monkeypatch.setattr(mod.company_service, "get_companies_for_map", fake_get_companies_for_map)
-    monkeypatch.setattr(mod, "get_current_active_company", lambda: fake_company)
+    monkeypatch.setattr(mod, "get_current_active_principal", lambda: fake_company)
 
     result = await mod.get_companies_for_map(fake_filter, current_company=fake_company)
     assert len(result) == 1
@@ -82,7 +91,7 @@ async def test_get_available_tags(monkeypatch):
         return ["venda", "reciclagem"]
 
     monkeypatch.setattr(mod.company_service, "get_available_tags", fake_get_available_tags)
-    monkeypatch.setattr(mod, "get_current_active_company", lambda: fake_company)
+    monkeypatch.setattr(mod, "get_current_active_principal", lambda: fake_company)
 
     result = await mod.get_available_tags(current_company=fake_company)
     assert "venda" in result
@@ -104,3 +113,571 @@ async def test_get_coletoras_for_map(monkeypatch):
     assert len(result) == 1
     assert result[0].nome == "Coletora Y"
     assert result[0].rating_average == 4.0
+
+
+async def test_get_coletoras_for_map_all_tags(monkeypatch):
+    mod = __import__(MODULE_PATH, fromlist=["*"])
+    received = {}
+
+    async def fake_get_companies_for_map_simple(filter_data):
+        received["filter"] = filter_data
+        return []
+
+    monkeypatch.setattr(mod.company_service, "get_companies_for_map_simple", fake_get_companies_for_map_simple)
+
+    await mod.get_coletoras_for_map(
+        tags=["venda", "doacao"], tag_match="all", city=None, uf=None, min_rating=None
+    )
+    assert received["filter"].tag_match == TagMatch.ALL
+
+
+async def test_map_snapshot_tag_match():
+    from app.models.company import tags_to_mask
+    from app.schemas.company import CompanyMapProjection
+    from app.services.map_snapshot import MapSnapshot
+
+    def row(nome, tags):
+        return CompanyMapProjection(
+            uuid=uuid4(), nome=nome, company_type=CompanyType.EMPRESA_COLETORA,
+            company_colector_tags=tags, tags_mask=tags_to_mask(tags), telefone="9",
+            latitude=-8.05, longitude=-34.9, rua="R", numero="1", bairro="B",
+            cidade="Recife", uf="PE",
+        )
+
+    snapshot = MapSnapshot([row("A", ["venda"]), row("B", ["venda", "doacao"])], version=1)
+
+    any_of, _ = snapshot.query(CompanyMapFilter(tags=["venda", "doacao"]))
+    all_of, _ = snapshot.query(CompanyMapFilter(tags=["venda", "doacao"], tag_match="all"))
+    assert [company.nome for company, _ in any_of] == ["A", "B"]
+    assert [company.nome for company, _ in all_of] == ["B"]
+
+
+async def test_get_coletoras_for_map_with_radius(monkeypatch):
+    mod = __import__(MODULE_PATH, fromlist=["*"])
+    received = {}
+
+    async def fake_get_companies_for_map_simple(filter_data):
+        received["filter"] = filter_data
+        company = make_company_map_simple_out()
+        company.distance_km = 1.25
+        return [company]
+
+    monkeypatch.setattr(mod.company_service, "get_companies_for_map_simple", fake_get_companies_for_map_simple)
+
+    result = await mod.get_coletoras_for_map(
+        tags=None, city=None, uf=None, min_rating=None, lat=-8.05, lng=-34.9, radius_km=5
+    )
+    assert received["filter"].lat == -8.05
+    assert received["filter"].lng == -34.9
+    assert received["filter"].radius_km == 5
+    assert result[0].distance_km == 1.25
+
+
+async def test_get_coletoras_for_map_radius_without_center():
+    mod = __import__(MODULE_PATH, fromlist=["*"])
+
+    with pytest.raises(HTTPException) as e:
+        await mod.get_coletoras_for_map(
+            tags=None, city=None, uf=None, min_rating=None, radius_km=5
+        )
+
+    assert e.value.status_code == 400
+
+
+async def test_get_coletoras_for_map_bbox(monkeypatch):
+    mod = __import__(MODULE_PATH, fromlist=["*"])
+    received = {}
+
+    async def fake_viewport(filter_data):
+        received["filter"] = filter_data
+        return CompanyMapViewportOut[CompanyMapSimpleOut](
+            items=[make_company_map_simple_out()], truncated=True, limit=filter_data.limit
+        )
+
+    monkeypatch.setattr(mod.company_service, "get_companies_for_map_simple_viewport", fake_viewport)
+
+    result = await mod.get_coletoras_for_map(
+        tags=None, city=None, uf=None, min_rating=None, bbox="-35.1,-8.2,-34.8,-7.9", limit=1
+    )
+    assert received["filter"].bbox == (-35.1, -8.2, -34.8, -7.9)
+    assert result.truncated is True
+    assert result.limit == 1
+    assert len(result.items) == 1
+
+
+async def test_get_coletoras_for_map_invalid_bbox():
+    mod = __import__(MODULE_PATH, fromlist=["*"])
+
+    with pytest.raises(HTTPException) as e:
+        await mod.get_coletoras_for_map(
+            tags=None, city=None, uf=None, min_rating=None, bbox="-34.8,-8.2,-35.1"
+        )
+
+    assert e.value.status_code == 400
+
+
+def polygon_pieces(location_filter):
+    """Faixas [[minLng, minLat], [maxLng, maxLat]] do $geometry de uma bbox."""
+    geometry = location_filter["$geoWithin"]["$geometry"]
+    polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+    pieces = []
+    for (ring,) in polygons:
+        assert ring[0] == ring[-1]
+        lngs, lats = [p[0] for p in ring], [p[1] for p in ring]
+        pieces.append([[round(min(lngs), 4), round(min(lats), 4)], [round(max(lngs), 4), round(max(lats), 4)]])
+    return pieces
+
+
+async def test_bbox_filter_uses_2dsphere_polygons():
+    from app.services.company_service import CompanyService
+
+    city = CompanyService._bbox_filter(CompanyMapFilter(bbox="-35.0,-8.2,-34.8,-7.9").bbox)
+    assert city["$geoWithin"]["$geometry"]["type"] == "Polygon"
+    assert polygon_pieces(city) == [[[-35.0, -8.2], [-34.8, -7.9]]]
+
+    # mais de 180° de largura: faixas com menos de 180°, sem vértices nos polos
+    world = CompanyService._bbox_filter(CompanyMapFilter(bbox="-180,-90,180,90").bbox)
+    assert world["$geoWithin"]["$geometry"]["type"] == "MultiPolygon"
+    assert polygon_pieces(world) == [
+        [[-180.0, -89.9], [-90.0, 89.9]], [[-90.0, -89.9], [0.0, 89.9]],
+        [[0.0, -89.9], [90.0, 89.9]], [[90.0, -89.9], [180.0, 89.9]],
+    ]
+
+    # paralelos em trechos de no máximo 1°, para não curvarem rumo ao polo
+    wide = CompanyService._bbox_filter(CompanyMapFilter(bbox="-170,-60,30,10").bbox)
+    for (ring,) in wide["$geoWithin"]["$geometry"]["coordinates"]:
+        for start, end in zip(ring, ring[1:]):
+            assert start[1] == end[1] or start[0] == end[0]
+            assert abs(end[0] - start[0]) <= 1.0 + 1e-9
+    assert polygon_pieces(wide) == [
+        [[-170.0, -60.0], [-103.3333, 10.0]], [[-103.3333, -60.0], [-36.6667, 10.0]], [[-36.6667, -60.0], [30.0, 10.0]],
+    ]
+
+
+async def test_get_coletoras_for_map_low_zoom_returns_clusters(monkeypatch):
+    mod = __import__(MODULE_PATH, fromlist=["*"])
+
+    async def fake_get_map_clusters(filter_data):
+        return CompanyMapClustersOut(
+            zoom=filter_data.zoom,
+            cell_size_deg=2.8125,
+            total=3,
+            clusters=[
+                CompanyMapClusterOut(
+                    latitude=-8.05, longitude=-34.9, count=3, rating_average=4.2, tags={"venda": 3}
+                )
+            ],
+        )
+
+    async def fail_simple(filter_data):
+        raise AssertionError("individual points should not be loaded at low zoom")
+
+    monkeypatch.setattr(mod.company_service, "get_map_clusters", fake_get_map_clusters)
+    monkeypatch.setattr(mod.company_service, "get_companies_for_map_simple", fail_simple)
+
+    result = await mod.get_coletoras_for_map(tags=None, city=None, uf=None, min_rating=None, zoom=5)
+    assert result.zoom == 5
+    assert result.clusters[0].count == 3
+
+
+async def test_get_coletoras_for_map_high_zoom_returns_points(monkeypatch):
+    mod = __import__(MODULE_PATH, fromlist=["*"])
+
+    async def fake_get_companies_for_map_simple(filter_data):
+        return [make_company_map_simple_out()]
+
+    monkeypatch.setattr(mod.company_service, "get_companies_for_map_simple", fake_get_companies_for_map_simple)
+
+    result = await mod.get_coletoras_for_map(tags=None, city=None, uf=None, min_rating=None, zoom=15)
+    assert result[0].nome == "Coletora Y"
+
+
+# ========================
+# GET /map/tiles/{z}/{x}/{y}.mvt
+# ========================
+async def test_get_coletoras_tile(monkeypatch):
+    mod = __import__(MODULE_PATH, fromlist=["*"])
+    received = {}
+
+    async def fake_get_tile(z, x, y, filter_data):
+        received["args"] = (z, x, y, filter_data)
+        return b"\x1a\x00", '"1-10-365-532-abc"'
+
+    monkeypatch.setattr(mod.map_tile_service, "get_tile", fake_get_tile)
+
+    request = SimpleNamespace(headers={})
+    result = await mod.get_coletoras_tile(10, 365, 532, request, tags=["venda"], uf="PE")
+    assert result.body == b"\x1a\x00"
+    assert result.media_type == "application/vnd.mapbox-vector-tile"
+    assert result.headers["etag"] == '"1-10-365-532-abc"'
+    assert received["args"][3].uf == "PE"
+
+
+async def test_get_coletoras_tile_not_modified(monkeypatch):
+    mod = __import__(MODULE_PATH, fromlist=["*"])
+
+    async def fake_get_tile(z, x, y, filter_data):
+        return b"\x1a\x00", '"1-10-365-532-abc"'
+
+    monkeypatch.setattr(mod.map_tile_service, "get_tile", fake_get_tile)
+
+    request = SimpleNamespace(headers={"if-none-match": '"1-10-365-532-abc"'})
+    result = await mod.get_coletoras_tile(10, 365, 532, request)
+    assert result.status_code == 304
+
+
+async def test_check_query_plans_flags_collscan(monkeypatch):
+    from app.services import query_plan_service as qp
+
+    async def fake_explain(sample):
+        if sample.name == "admin: listagem de empresas":
+            return {"queryPlanner": {
+                "winningPlan": {"stage": "COLLSCAN"},
+                "rejectedPlans": [],
+            }}
+        return {"queryPlanner": {
+            "winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}},
+            "rejectedPlans": [{"stage": "COLLSCAN"}],
+        }}
+
+    monkeypatch.setattr(qp.QueryPlanService, "explain", staticmethod(fake_explain))
+
+    results = await qp.query_plan_service.check_company_service()
+    assert [r.name for r in results if r.collscan] == ["admin: listagem de empresas"]
+    assert results[0].stages == ["FETCH", "IXSCAN"]
+
+    with pytest.raises(RuntimeError):
+        await qp.query_plan_service.assert_query_plans()
+
+
+async def test_check_query_plans_requires_geo_index_for_bbox(monkeypatch):
+    from app.services import query_plan_service as qp
+
+    def ixscan(index_name):
+        return {"queryPlanner": {
+            "winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": index_name}},
+            "rejectedPlans": [{"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "location_2dsphere"}}],
+        }}
+
+    plans = {
+        # filtro de localização no FETCH: não é COLLSCAN, mas varre todas as coletoras
+        "mapa: bbox": ixscan("map_rating"),
+        "mapa: raio ($geoNear)": {"stages": [{"$geoNearCursor": {"queryPlanner": {
+            "winningPlan": {"stage": "GEO_NEAR_2DSPHERE", "inputStage": {"stage": "IXSCAN"}},
+        }}}]},
+        "mapa: clusters": ixscan("location_2dsphere"),
+    }
+
+    async def fake_explain(sample):
+        return plans.get(sample.name, ixscan("map_rating"))
+
+    monkeypatch.setattr(qp.QueryPlanService, "explain", staticmethod(fake_explain))
+
+    samples = {sample.name: sample for sample in qp.QueryPlanService.company_service_samples()}
+    assert "$geometry" in samples["mapa: bbox"].filter["location"]["$geoWithin"]
+    assert all(samples[name].geo_index for name in plans)
+
+    results = await qp.query_plan_service.check_company_service()
+    assert [r.name for r in results if r.failed] == ["mapa: bbox"]
+    assert not any(r.collscan for r in results)
+    with pytest.raises(RuntimeError, match="mapa: bbox"):
+        await qp.query_plan_service.assert_query_plans()
+
+    plans["mapa: bbox"] = ixscan("location_2dsphere")
+    await qp.query_plan_service.assert_query_plans()
+
+
+async def test_check_query_plans_reads_aggregate_explain():
+    from app.services.query_plan_service import winning_plan_stages
+
+    explain = {"stages": [{"$geoNearCursor": {"queryPlanner": {
+        "winningPlan": {"stage": "GEO_NEAR_2DSPHERE", "inputStage": {"stage": "IXSCAN"}},
+    }}}]}
+    assert winning_plan_stages(explain) == ["GEO_NEAR_2DSPHERE", "IXSCAN"]
+
+
+async def test_get_map_density(monkeypatch):
+    mod = __import__(MODULE_PATH, fromlist=["*"])
+    from app.schemas.company import CompanyDensityOut, DensityLayer
+
+    async def fake_get_density(layer, zoom):
+        return CompanyDensityOut(
+            layer=layer, zoom=zoom, cell_size_deg=0.5, total_count=3, total_quantidade=40, cells=[]
+        )
+
+    monkeypatch.setattr(mod.density_service, "get_density", fake_get_density)
+
+    result = await mod.get_map_density(layer=DensityLayer.DESCARTES, zoom=6, admin_company=make_company())
+    assert result.layer == DensityLayer.DESCARTES
+    assert result.total_quantidade == 40
+
+
+async def test_density_service_uses_cache(monkeypatch):
+    from app.schemas.company import CompanyDensityOut, DensityLayer
+    from app.services.density_service import density_service
+    from app.services.map_cache import map_cache
+
+    cached = CompanyDensityOut(
+        layer=DensityLayer.COLETORAS, zoom=3, cell_size_deg=11.25, total_count=1, total_quantidade=0, cells=[]
+    )
+    map_cache.density.set((DensityLayer.COLETORAS, 3), cached)
+    try:
+        assert await density_service.get_density(DensityLayer.COLETORAS, 3) is cached
+    finally:
+        map_cache.density.clear()
+
+
+def decode_point_tile(data):
+    """Decodifica o tile MVT de uma camada de pontos: (nome, extent, [(x, y, atributos)])."""
+    import struct
+
+    def fields(buffer):
+        pos = 0
+        while pos < len(buffer):
+            key, pos = varint(buffer, pos)
+            field, wire_type = key >> 3, key & 7
+            if wire_type == 0:
+                value, pos = varint(buffer, pos)
+            elif wire_type == 1:
+                value, pos = buffer[pos:pos + 8], pos + 8
+            else:
+                length, pos = varint(buffer, pos)
+                value, pos = buffer[pos:pos + length], pos + length
+            yield field, value
+
+    def varint(buffer, pos):
+        result = shift = 0
+        while True:
+            byte = buffer[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return result, pos
+
+    def packed(buffer):
+        values, pos = [], 0
+        while pos < len(buffer):
+            value, pos = varint(buffer, pos)
+            values.append(value)
+        return values
+
+    def unzigzag(value):
+        return (value >> 1) ^ -(value & 1)
+
+    def decode_value(buffer):
+        for field, value in fields(buffer):
+            if field == 1:
+                return value.decode()
+            if field == 3:
+                return struct.unpack("<d", value)[0]
+            if field == 4:
+                return value
+            if field == 7:
+                return bool(value)
+
+    (layer_field, layer), = list(fields(data))
+    assert layer_field == 3
+    name, extent, keys, values, raw_features = None, None, [], [], []
+    for field, value in fields(layer):
+        if field == 1:
+            name = value.decode()
+        elif field == 2:
+            raw_features.append(value)
+        elif field == 3:
+            keys.append(value.decode())
+        elif field == 4:
+            values.append(decode_value(value))
+        elif field == 5:
+            extent = value
+
+    features = []
+    for raw in raw_features:
+        parsed = dict(fields(raw))
+        assert parsed[3] == 1  # POINT
+        command, x, y = packed(parsed[4])
+        assert command == (1 << 3) | 1
+        tags = packed(parsed[2])
+        properties = {keys[tags[i]]: values[tags[i + 1]] for i in range(0, len(tags), 2)}
+        features.append((unzigzag(x), unzigzag(y), properties))
+    return name, extent, features
+
+
+def test_vector_tile_round_trip():
+    from app.services.vector_tile import MVT_EXTENT, encode_point_layer
+
+    data = encode_point_layer(
+        "coletoras",
+        [
+            (0.0, 0.0, {"uuid": "a", "rating_average": 4.5, "tags": "venda"}),
+            (-90.0, 45.0, {"uuid": "b", "rating_average": None, "count": 3, "ativo": True}),
+        ],
+        0, 0, 0,
+    )
+    name, extent, features = decode_point_tile(data)
+
+    assert name == "coletoras" and extent == MVT_EXTENT
+    assert features[0] == (2048, 2048, {"uuid": "a", "rating_average": 4.5, "tags": "venda"})
+    x, y, properties = features[1]
+    assert x == 1024 and 0 < y < 2048
+    assert properties == {"uuid": "b", "count": 3, "ativo": True}
+
+
+@pytest.mark.parametrize("z, x, y, expected_pieces", [
+    (0, 0, 0, [
+        [[-180.0, -85.0511], [-90.0, 85.0511]], [[-90.0, -85.0511], [0.0, 85.0511]],
+        [[0.0, -85.0511], [90.0, 85.0511]], [[90.0, -85.0511], [180.0, 85.0511]],
+    ]),
+    (1, 0, 1, [[[-180.0, -85.0511], [-90.0, 0.0]], [[-90.0, -85.0511], [0.0, 0.0]]]),
+])
+async def test_get_tile_low_zoom_queries_2dsphere_polygons(monkeypatch, z, x, y, expected_pieces):
+    from app.services import map_tile_service as tile_module
+    from app.utils.cache import TTLCache
+
+    received = {}
+    point = SimpleNamespace(
+        uuid=uuid4(), longitude=-46.63, latitude=-23.55, rating_average=4.0, company_colector_tags=[]
+    )
+
+    def fake_find(query):
+        received["query"] = query
+
+        async def to_list():
+            return [point]
+
+        return SimpleNamespace(project=lambda model: SimpleNamespace(to_list=to_list))
+
+    monkeypatch.setattr(tile_module.Company, "find", fake_find)
+    monkeypatch.setattr(tile_module, "map_cache", SimpleNamespace(version=1, tiles=TTLCache(maxsize=8, ttl=60)))
+
+    tile, etag = await tile_module.MapTileService.get_tile(z, x, y, CompanyMapFilter())
+
+    assert polygon_pieces(received["query"]["location"]) == expected_pieces
+    name, extent, features = decode_point_tile(tile)
+    assert name == "coletoras"
+    assert len(features) == 1 and features[0][2]["uuid"] == str(point.uuid)
+    assert etag.startswith(f'"1-{z}-{x}-{y}-')
+
+
+def make_map_row(nome, lat, lng, rating=0.0, tags=(), uf="PE", cidade="Recife"):
+    from app.models.company import tags_to_mask
+    from app.schemas.company import CompanyMapProjection
+
+    return CompanyMapProjection(
+        uuid=uuid4(), nome=nome, company_type=CompanyType.EMPRESA_COLETORA,
+        company_colector_tags=list(tags), tags_mask=tags_to_mask(list(tags)),
+        telefone="999999999", latitude=lat, longitude=lng, rating_average=rating,
+        rua="Rua A", numero="1", bairro="Centro", cidade=cidade, uf=uf,
+    )
+
+
+def test_map_snapshot_query_filters():
+    from app.models.company import Companycolectortags
+    from app.services.map_snapshot import MapSnapshot
+
+    venda, doacao = Companycolectortags.Venda_de_material_reciclavel, Companycolectortags.Doacao_de_material_reciclavel
+    rows = [
+        make_map_row("A", -8.05, -34.90, rating=3.0, tags=[venda]),
+        make_map_row("B", -8.06, -34.91, rating=5.0, tags=[venda, doacao]),
+        make_map_row("C", -23.55, -46.63, rating=4.0, tags=[doacao], uf="SP", cidade="São Paulo"),
+        make_map_row("Sem coordenada", None, None),
+    ]
+    snapshot = MapSnapshot(rows, "1.0")
+    assert len(snapshot) == 3
+
+    def names(filter_data):
+        results, _ = snapshot.query(filter_data)
+        return [row.nome for row, _ in results]
+
+    assert names(CompanyMapFilter(tags=[venda])) == ["A", "B"]
+    assert names(CompanyMapFilter(tags=[venda, doacao], tag_match=TagMatch.ALL)) == ["B"]
+    assert names(CompanyMapFilter(uf="sp", city="sao paulo")) == ["C"]
+    assert names(CompanyMapFilter(min_rating=4)) == ["B", "C"]
+
+    # bbox: ordenado por avaliação e truncado no limite
+    results, truncated = snapshot.query(CompanyMapFilter(bbox="-35,-9,-34,-8", limit=1))
+    assert [row.nome for row, _ in results] == ["B"] and truncated is True
+
+    # centro: ordenado por distância, dentro do raio
+    results, _ = snapshot.query(CompanyMapFilter(lat=-8.06, lng=-34.91, radius_km=5))
+    assert [row.nome for row, _ in results] == ["B", "A"]
+    assert results[0][1] == 0.0
+
+
+class FakeCacheVersions:
+    """Coleção cache_versions em memória; `down` simula o MongoDB fora."""
+
+    def __init__(self):
+        self.version = 0
+        self.down = False
+
+    async def find_one_and_update(self, query, update, **kwargs):
+        if self.down:
+            raise ConnectionError("mongo fora")
+        self.version += update["$inc"]["version"]
+        return {"key": query["key"], "version": self.version}
+
+    async def find_one(self, query):
+        if self.down:
+            raise ConnectionError("mongo fora")
+        return {"key": query["key"], "version": self.version} if self.version else None
+
+
+async def test_map_cache_local_invalidation_does_not_shadow_db_version(monkeypatch):
+    from app.models.cache_version import CacheVersion
+    from app.services.map_cache import MapCache
+
+    collection = FakeCacheVersions()
+    monkeypatch.setattr(CacheVersion, "get_motor_collection", classmethod(lambda cls: collection))
+    cache = MapCache()
+
+    await cache.invalidate("alteração")
+    assert cache.version == "1.0"
+
+    # banco fora: só a época local avança e o cache é descartado
+    cache.tiles.set("tile", b"velho")
+    collection.down = True
+    await cache.invalidate("alteração sem banco")
+    assert cache.version == "1.1" and cache.tiles.get("tile") is None
+
+    # outro worker publica a versão 2: ela é aplicada (antes era ignorada por coincidir)
+    collection.down = False
+    collection.version = 2
+    cache.tiles.set("tile", b"velho")
+    await cache.refresh_version()
+    assert cache.db_version == 2 and cache.tiles.get("tile") is None
+
+
+async def test_map_snapshot_reloads_when_version_changes(monkeypatch):
+    from app.services import map_snapshot as snapshot_module
+    from app.services.map_cache import MapCache
+
+    cache = MapCache()
+    loads = []
+    rows = [make_map_row("A", -8.05, -34.90)]
+
+    def fake_find(query):
+        loads.append(query)
+
+        async def to_list():
+            return list(rows)
+
+        return SimpleNamespace(project=lambda model: SimpleNamespace(to_list=to_list))
+
+    monkeypatch.setattr(snapshot_module, "map_cache", cache)
+    monkeypatch.setattr(snapshot_module.Company, "find", fake_find)
+    service = snapshot_module.MapSnapshotService()
+
+    first = await service.get_snapshot()
+    assert await service.get_snapshot() is first
+    assert len(loads) == 1
+
+    rows.append(make_map_row("B", -8.06, -34.91))
+    cache._apply_version(1)
+    second = await service.get_snapshot()
+    assert second is not first and len(second) == 2
+    assert len(loads) == 2
+
+    cache.local_epoch += 1
+    assert await service.get_snapshot() is not second
+    assert len(loads) == 3
@@ -10,6 +10,14 @@ def load_module():
     return __import__(MODULE, fromlist=["*"])
 
 
+def http(headers=None):
+    """Request/Response para chamar as rotas diretamente"""
+    from fastapi import Request, Response
+
+    raw = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    return Request({"type": "http", "headers": raw}), Response()
+
+
 # ============================
 # ESTADOS
 # ============================
@@ -21,7 +29,7 @@ async def test_get_estados_success(monkeypatch):
 
     monkeypatch.setattr(mod.ibge_service, "get_estados", fake_get_estados)
 
-    result = await mod.get_estados()
+    result = await mod.get_estados(*http())
 
     assert len(result) == 1
     assert result[0]["sigla"] == "PE"
@@ -36,7 +44,7 @@ async def test_get_estados_empty(monkeypatch):
     monkeypatch.setattr(mod.ibge_service, "get_estados", fake_get_estados)
 
     with pytest.raises(HTTPException) as e:
-        await mod.get_estados()
+        await mod.get_estados(*http())
 
     assert e.value.status_code == 503
 
@@ -52,7 +60,7 @@ async def test_get_cidades_por_estado_success(monkeypatch):
 
     monkeypatch.setattr(mod.ibge_service, "get_cidades_por_estado", fake_get_cidades)
 
-    result = await mod.get_cidades_por_estado("PE")
+    result = await mod.get_cidades_por_estado("PE", *http())
 
     assert result[0]["nome"] == "Recife"
 
@@ -61,7 +69,7 @@ async def test_get_cidades_por_estado_invalid_uf():
     mod = load_module()
 
     with pytest.raises(HTTPException) as e:
-        await mod.get_cidades_por_estado("PEX")
+        await mod.get_cidades_por_estado("PEX", *http())
 
     assert e.value.status_code == 400
 
@@ -75,11 +83,123 @@ async def test_get_cidades_por_estado_not_found(monkeypatch):
     monkeypatch.setattr(mod.ibge_service, "get_cidades_por_estado", fake_get_cidades)
 
     with pytest.raises(HTTPException) as e:
-        await mod.get_cidades_por_estado("PE")
+        await mod.get_cidades_por_estado("PE", *http())
 
     assert e.value.status_code == 404
 
 
+# ============================
+# SNAPSHOT DO IBGE
+# ============================
+@pytest.fixture
+def ibge_snapshot(monkeypatch, tmp_path):
+    from app.config.config import settings
+    from app.services.locationIBGE_service import LocationService
+
+    path = tmp_path / "municipios.json.gz"
+    monkeypatch.setattr(settings, "IBGE_SNAPSHOT_PATH", str(path))
+    service = LocationService()
+    LocationService._write_snapshot_file(path, {
+        "pe": [{"codigo": "2611606", "nome": "Recife"}, {"codigo": "2609600", "nome": "Olinda"}],
+    })
+    return service, path
+
+
+async def test_ibge_snapshot_served_from_memory(monkeypatch, ibge_snapshot):
+    service, _ = ibge_snapshot
+
+    async def offline(uf):
+        raise AssertionError("IBGE não deveria ser consultado")
+
+    monkeypatch.setattr(service, "_fetch_cidades_por_estado", offline)
+    assert await service.load_snapshot() is True
+
+    assert [c["nome"] for c in await service.get_cidades_por_estado("pe")] == ["Olinda", "Recife"]
+    assert await service.get_cidades_por_estado("SP") == []
+    assert await service.get_codigo_municipio("PE", " recife ") == "2611606"
+    assert len(await service.get_estados()) == 27
+
+
+async def test_ibge_refresh_swaps_snapshot_and_rewrites_file(monkeypatch, ibge_snapshot):
+    from app.services.locationIBGE_service import ESTADOS_IBGE, LocationService
+
+    service, path = ibge_snapshot
+    await service.load_snapshot()
+    old = service.snapshot
+
+    async def fake_fetch():
+        cidades = {sigla: [{"codigo": codigo + "00001", "nome": f"Cidade {sigla}"}] for codigo, sigla, _ in ESTADOS_IBGE}
+        cidades["PE"].append({"codigo": "2613701", "nome": "São Lourenço da Mata"})
+        return cidades
+
+    monkeypatch.setattr(service, "_fetch_municipios", fake_fetch)
+    await service.refresh()
+
+    assert service.snapshot is not old and service.snapshot.version != old.version
+    assert await service.get_codigo_municipio("pe", "SAO LOURENCO DA MATA") == "2613701"
+    assert old.cidades_por_uf["PE"][1]["nome"] == "Recife"
+    assert len(LocationService._read_snapshot_file(path)) == 27
+
+
+async def test_location_etag_returns_not_modified(monkeypatch, ibge_snapshot):
+    mod = load_module()
+    service, _ = ibge_snapshot
+    await service.load_snapshot()
+    monkeypatch.setattr(mod, "ibge_service", service)
+
+    request, response = http()
+    cidades = await mod.get_cidades_por_estado("PE", request, response)
+    etag = response.headers["etag"]
+    assert len(cidades) == 2
+    assert "max-age" in response.headers["cache-control"]
+
+    cached = await mod.get_cidades_por_estado("PE", *http({"If-None-Match": etag}))
+    assert cached.status_code == 304
+
+    estados = await mod.get_estados(*http({"If-None-Match": service.etag()}))
+    assert estados.status_code == 304
+
+
+async def test_autocomplete_cidades_prefix_index(monkeypatch):
+    from app.services.locationIBGE_service import LocationService, MunicipiosSnapshot
+
+    mod = load_module()
+    service = LocationService()
+    service._snapshot = MunicipiosSnapshot.build({
+        "SP": [{"codigo": "3550308", "nome": "São Paulo"}, {"codigo": "3548708", "nome": "São Bernardo do Campo"}],
+        "PE": [{"codigo": "2613701", "nome": "São Lourenço da Mata"}, {"codigo": "2611606", "nome": "Recife"}],
+    })
+    monkeypatch.setattr(mod, "ibge_service", service)
+
+    result = await mod.autocomplete_cidades(*http(), q="SAO", uf=None, limit=10)
+    assert [c["nome"] for c in result] == ["São Bernardo do Campo", "São Lourenço da Mata", "São Paulo"]
+    assert result[2] == {"codigo": "3550308", "nome": "São Paulo", "uf": "SP"}
+
+    assert [c["uf"] for c in await mod.autocomplete_cidades(*http(), q="são", uf="pe", limit=10)] == ["PE"]
+    assert len(await mod.autocomplete_cidades(*http(), q="s", uf=None, limit=2)) == 2
+    assert await mod.autocomplete_cidades(*http(), q="olinda", uf=None, limit=10) == []
+
+
+async def test_autocomplete_cidades_without_snapshot_needs_uf(monkeypatch):
+    from app.services.locationIBGE_service import LocationService
+
+    mod = load_module()
+    service = LocationService()
+
+    async def fake_fetch(uf):
+        return [{"codigo": "2611606", "nome": "Recife"}, {"codigo": "2609600", "nome": "Olinda"}]
+
+    monkeypatch.setattr(service, "_fetch_cidades_por_estado", fake_fetch)
+    monkeypatch.setattr(mod, "ibge_service", service)
+
+    result = await mod.autocomplete_cidades(*http(), q="rec", uf="PE", limit=10)
+    assert result == [{"codigo": "2611606", "nome": "Recife", "uf": "PE"}]
+
+    with pytest.raises(HTTPException) as e:
+        await mod.autocomplete_cidades(*http(), q="rec", uf=None, limit=10)
+    assert e.value.status_code == 503
+
+
 # ============================
 # CEP POR PATH
 # ============================
@@ -149,3 +269,334 @@ async def test_get_endereco_por_cep_query(monkeypatch):
     result = await mod.get_endereco_por_cep_query("50000-000")
 
     assert result.success is True
+
+
+# ============================
+# CÓDIGO IBGE DO MUNICÍPIO
+# ============================
+async def test_get_codigo_municipio_ignores_accents(monkeypatch):
+    mod = load_module()
+
+    async def fake_get_cidades(uf):
+        return [{"codigo": "2611606", "nome": "Recife"}, {"codigo": "2613701", "nome": "São Lourenço da Mata"}]
+
+    monkeypatch.setattr(mod.ibge_service, "get_cidades_por_estado", fake_get_cidades)
+
+    assert await mod.ibge_service.get_codigo_municipio("pe", "SAO LOURENCO  DA MATA") == "2613701"
+    assert await mod.ibge_service.get_codigo_municipio("PE", "Olinda") is None
+    # sem snapshot carregado, fetch=False não chama o IBGE
+    assert await mod.ibge_service.get_codigo_municipio("PE", "Recife", fetch=False) is None
+
+
+# ============================
+# CACHE DE GEOCODING
+# ============================
+class FakeBucket:
+    """Token bucket sem espera, registrando quantos tokens foram pedidos"""
+
+    def __init__(self):
+        self.acquired = 0
+
+    async def acquire(self):
+        self.acquired += 1
+
+    def stats(self):
+        return {"acquired": self.acquired}
+
+
+@pytest.fixture
+def geocoding(monkeypatch):
+    from app.services import geocoding_service as geo_mod
+    from app.services.geocoding_dispatcher import GeocodingDispatcher
+    from app.services.geocode_cache import geocode_cache
+
+    calls = []
+    results = {}
+
+    async def fake_fetch(query):
+        calls.append(query)
+        result = results.get("next")
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(geo_mod.geocoding_service, "_fetch_coordinates", fake_fetch)
+    # Fila própria do teste: o worker fica preso ao event loop deste caso
+    # e é cancelado junto com ele
+    monkeypatch.setattr(geo_mod, "geocoding_dispatcher", GeocodingDispatcher(FakeBucket()))
+    geocode_cache.memory.clear()
+    yield geo_mod.geocoding_service, calls, results
+    geocode_cache.memory.clear()
+
+
+async def test_geocoding_cache_reuses_normalized_address(geocoding):
+    service, calls, results = geocoding
+    results["next"] = (-8.05, -34.9)
+
+    first = await service.get_coordinates_from_address(
+        {"rua": "Rua São João", "numero": "10", "bairro": "Centro", "cidade": "Recife", "uf": "PE"}
+    )
+    second = await service.get_coordinates_from_address(
+        {"rua": "rua sao joão.", "numero": "10", "bairro": " centro", "cidade": "RECIFE", "uf": "pe"}
+    )
+
+    assert first == second == (-8.05, -34.9)
+    assert len(calls) == 1
+
+
+async def test_geocoding_cache_stores_negative_but_not_errors(geocoding):
+    import httpx
+
+    service, calls, results = geocoding
+    address = {"rua": "Rua Inexistente", "numero": "1", "cidade": "Recife", "uf": "PE"}
+
+    results["next"] = httpx.ConnectError("offline")
+    assert await service.get_coordinates_from_address(address) is None
+    results["next"] = None
+    assert await service.get_coordinates_from_address(address) is None
+    assert await service.get_coordinates_from_address(address) is None
+
+    # o erro de rede não ficou em cache; o resultado vazio sim
+    assert len(calls) == 2
+
+
+# ============================
+# FILA DO NOMINATIM
+# ============================
+async def test_geocoding_dispatcher_coalesces_same_key():
+    import asyncio
+    from app.services.geocoding_dispatcher import GeocodingDispatcher
+
+    bucket = FakeBucket()
+    dispatcher = GeocodingDispatcher(bucket)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return (-8.05, -34.9)
+
+    results = await asyncio.gather(*[dispatcher.submit("rua x, recife", call) for _ in range(5)])
+    await dispatcher.stop()
+
+    assert results == [(-8.05, -34.9)] * 5
+    assert len(calls) == 1
+    assert bucket.acquired == 1
+    assert dispatcher.stats()["coalesced"] == 4
+
+
+async def test_geocoding_dispatcher_serves_interactive_lane_first():
+    import asyncio
+    from app.services.geocoding_dispatcher import GeocodingDispatcher, Lane
+
+    order = []
+    gate = asyncio.Event()
+
+    class GatedBucket(FakeBucket):
+        async def acquire(self):
+            await gate.wait()
+
+    dispatcher = GeocodingDispatcher(GatedBucket())
+
+    def call(name):
+        async def run():
+            order.append(name)
+            return name
+        return run
+
+    tasks = [
+        asyncio.create_task(dispatcher.submit("lote-1", call("lote-1"), Lane.BATCH)),
+        asyncio.create_task(dispatcher.submit("lote-2", call("lote-2"), Lane.BATCH)),
+    ]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(dispatcher.submit("cep:50000000", call("cep"), Lane.INTERACTIVE)))
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(*tasks)
+    await dispatcher.stop()
+
+    assert order == ["cep", "lote-1", "lote-2"]
+
+
+async def test_geocoding_dispatcher_lane_upgrade_does_not_repeat_started_call():
+    import asyncio
+    from app.services.geocoding_dispatcher import GeocodingDispatcher, Lane
+
+    bucket = FakeBucket()
+    dispatcher = GeocodingDispatcher(bucket)
+    release = asyncio.Event()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await release.wait()
+        return (-8.05, -34.9)
+
+    batch = asyncio.create_task(dispatcher.submit("rua x, recife", call, Lane.BATCH))
+    await asyncio.sleep(0.01)
+    assert calls == [1]
+
+    # mesma chave, mais urgente, com a chamada do lote já em andamento
+    interactive = asyncio.create_task(dispatcher.submit("rua x, recife", call, Lane.INTERACTIVE))
+    await asyncio.sleep(0.01)
+    release.set()
+
+    assert await asyncio.gather(batch, interactive) == [(-8.05, -34.9)] * 2
+    await dispatcher.stop()
+    assert calls == [1]
+    assert bucket.acquired == 1
+
+
+# ============================
+# CLIENTES HTTP COMPARTILHADOS
+# ============================
+async def test_http_clients_are_reused_and_reopened():
+    from app.services.http_client import HttpClientRegistry, IBGE, NOMINATIM
+
+    registry = HttpClientRegistry()
+    ibge = registry.get(IBGE)
+    assert registry.get(IBGE) is ibge
+    assert registry.get(NOMINATIM).headers["User-Agent"].startswith("EcocycloApp")
+
+    await registry.aclose()
+    assert ibge.is_closed
+    assert registry.get(IBGE) is not ibge
+    await registry.aclose()
+
+
+# ============================
+# ÍNDICE LOCAL DE CEP
+# ============================
+def write_cep_file(path, rows):
+    import gzip
+
+    header = "cep_inicio;cep_fim;rua;bairro;cidade;uf;codigo_ibge;latitude;longitude\n"
+    with gzip.open(path, "wt", encoding="utf-8") as file:
+        file.write(header + "".join(";".join(row) + "\n" for row in rows))
+
+
+async def test_cep_index_range_lookup_and_reload(monkeypatch, tmp_path):
+    import os
+    from app.config.config import settings
+    from app.services.cep_index import CepIndex
+
+    source = tmp_path / "ceps.csv.gz"
+    write_cep_file(source, [
+        ("50000-000", "50099-999", "", "Centro", "Recife", "pe", "2611606", "-8.05", "-34.9"),
+        ("01310100", "", "Avenida Paulista", "Bela Vista", "São Paulo", "SP", "3550308", "", ""),
+    ])
+    monkeypatch.setattr(settings, "CEP_INDEX_PATH", str(source))
+    monkeypatch.setattr(settings, "CEP_INDEX_CHECK_SECONDS", 0)
+
+    index = CepIndex()
+    assert await index.reload() == 2
+
+    recife = await index.lookup("50050-123")
+    assert recife["cep"] == "50050-123"
+    assert (recife["cidade"], recife["uf"], recife["codigo_ibge"]) == ("Recife", "PE", "2611606")
+    assert (recife["latitude"], recife["longitude"]) == (-8.05, -34.9)
+
+    paulista = await index.lookup("01310100")
+    assert paulista["rua"] == "Avenida Paulista" and paulista["latitude"] is None
+    assert await index.lookup("01310101") is None
+    assert await index.lookup("49999999") is None
+
+    # arquivo novo no mesmo caminho: recarrega sozinho na próxima busca
+    write_cep_file(source, [("49000000", "49099999", "", "", "Aracaju", "SE", "2800308", "", "")])
+    os.utime(source, (1, 1))
+    assert (await index.lookup("49000001"))["cidade"] == "Aracaju"
+    assert await index.lookup("50050123") is None
+    assert index.stats()["rows"] == 1
+
+
+async def test_get_address_from_cep_prefers_local_index(monkeypatch):
+    from app.services import geocoding_service as geo_mod
+
+    async def fake_lookup(cep):
+        return {"cep": "50050-123", "rua": "", "bairro": "Centro", "cidade": "Recife", "uf": "PE"}
+
+    async def fail_submit(*args, **kwargs):
+        raise AssertionError("Nominatim não deveria ser consultado")
+
+    monkeypatch.setattr(geo_mod.cep_index, "lookup", fake_lookup)
+    monkeypatch.setattr(geo_mod.geocoding_dispatcher, "submit", fail_submit)
+
+    endereco = await geo_mod.geocoding_service.get_address_from_cep("50050123")
+    assert endereco["cidade"] == "Recife"
+
+
+# ============================
+# CIRCUIT BREAKER
+# ============================
+async def test_circuit_breaker_opens_probes_and_closes(monkeypatch):
+    from app.services import circuit_breaker as cb_mod
+
+    now = [1000.0]
+    monkeypatch.setattr(cb_mod.time, "monotonic", lambda: now[0])
+    breaker = cb_mod.CircuitBreaker("teste", failure_threshold=2, reset_timeout=30)
+
+    for _ in range(2):
+        with pytest.raises(TimeoutError):
+            with breaker.guard():
+                raise TimeoutError()
+    assert breaker.state == cb_mod.CircuitState.OPEN
+
+    with pytest.raises(cb_mod.CircuitOpenError):
+        breaker.reject_if_open()
+
+    # passado o reset_timeout só uma chamada de teste passa
+    now[0] += 31
+    assert breaker.allow() is True
+    assert breaker.allow() is False and breaker.is_open
+    breaker.record_success()
+    assert breaker.state == cb_mod.CircuitState.CLOSED
+
+    with breaker.guard():
+        pass
+    stats = cb_mod.circuit_breaker_stats()["teste"]
+    assert stats["state"] == "closed" and stats["rejected"] == 1 and stats["opened"] == 1
+    del cb_mod.CIRCUIT_BREAKERS["teste"]
+
+
+async def test_circuit_breaker_cancelled_probe_frees_half_open(monkeypatch):
+    import asyncio
+    from app.services import circuit_breaker as cb_mod
+
+    now = [1000.0]
+    monkeypatch.setattr(cb_mod.time, "monotonic", lambda: now[0])
+    breaker = cb_mod.CircuitBreaker("teste", failure_threshold=1, reset_timeout=30)
+    with pytest.raises(TimeoutError):
+        with breaker.guard():
+            raise TimeoutError()
+
+    async def probe():
+        with breaker.guard():
+            await asyncio.sleep(10)
+
+    now[0] += 31
+    task = asyncio.create_task(probe())
+    await asyncio.sleep(0)
+    assert breaker.is_open
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    # cancelamento não é falha do serviço: continua meio aberto, com a chamada de teste livre
+    assert breaker.state == cb_mod.CircuitState.HALF_OPEN and not breaker.is_open
+    assert breaker.failures == 1
+    with breaker.guard():
+        pass
+    assert breaker.state == cb_mod.CircuitState.CLOSED
+    del cb_mod.CIRCUIT_BREAKERS["teste"]
+
+
+async def test_geocoding_fails_fast_when_nominatim_circuit_is_open(monkeypatch, geocoding):
+    import time
+    from app.services.circuit_breaker import CircuitState, nominatim_breaker
+
+    service, calls, results = geocoding
+    monkeypatch.setattr(nominatim_breaker, "state", CircuitState.OPEN)
+    monkeypatch.setattr(nominatim_breaker, "opened_at", time.monotonic())
+
+    assert await service.get_coordinates_from_address({"rua": "Rua X", "cidade": "Recife", "uf": "PE"}) is None
+    assert calls == []
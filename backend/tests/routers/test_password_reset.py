@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException
+
+pytestmark = pytest.mark.asyncio
+
+MODULE_PATH = "app.routers.password_reset"
+
+
+class FakeResetTokens:
+    """Coleção password_reset_tokens em memória (jti -> documento)."""
+
+    def __init__(self):
+        self.documents = {}
+
+    async def find_one_and_delete(self, query):
+        return self.documents.pop(query["jti"], None)
+
+
+async def test_reset_password_token_is_single_use(monkeypatch):
+    mod = __import__(MODULE_PATH, fromlist=["*"])
+    from app.models.password_reset_token import PasswordResetToken
+    from app.schemas.password_reset import ResetPasswordRequest
+
+    collection = FakeResetTokens()
+    updates = []
+    revoked = []
+
+    async def fake_insert(self):
+        collection.documents[self.jti] = {"jti": self.jti}
+        return self
+
+    def fake_find(query):
+        async def delete():
+            collection.documents.clear()
+        return SimpleNamespace(delete=delete)
+
+    def fake_find_one(query):
+        async def update(change):
+            updates.append((query, change))
+            return SimpleNamespace(matched_count=1)
+        return SimpleNamespace(update=update)
+
+    async def fake_hash_password(password):
+        return f"hashed:{password}"
+
+    async def fake_revoke_company(company_uuid):
+        revoked.append(company_uuid)
+
+    monkeypatch.setattr(PasswordResetToken, "insert", fake_insert)
+    monkeypatch.setattr(PasswordResetToken, "find", fake_find)
+    monkeypatch.setattr(PasswordResetToken, "get_motor_collection", classmethod(lambda cls: collection))
+    monkeypatch.setattr(mod.models.Company, "find_one", fake_find_one)
+    monkeypatch.setattr(mod, "hash_password", fake_hash_password)
+    monkeypatch.setattr(mod.token_service, "revoke_company", fake_revoke_company)
+
+    company_uuid = uuid4()
+    token = await mod.password_reset_service.create_reset_token(str(company_uuid))
+    request = ResetPasswordRequest(token=token, new_password="nova-senha", confirm_password="nova-senha")
+
+    result = await mod.reset_password(request)
+    assert "sucesso" in result["message"]
+    query, change = updates[0]
+    assert query == {"uuid": company_uuid, "is_active": True}
+    assert change["$set"]["hashed_password"] == "hashed:nova-senha"
+    assert revoked == [company_uuid]
+
+    # mesmo token de novo: já consumido
+    with pytest.raises(HTTPException) as excinfo:
+        await mod.reset_password(request)
+    assert excinfo.value.status_code == 400
+    assert len(updates) == 1